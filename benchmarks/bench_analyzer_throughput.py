@@ -0,0 +1,96 @@
+"""
+Benchmark del throughput di PacketAnalyzer.analyze_packet con diversi livelli di log.
+
+Viene generato un traffico sintetico di pacchetti TCP/UDP/ICMP (PacketMeta decodificati da
+frame IP raw) tra sorgenti esterne e HOME_NET, analizzato con le regole di default in tre
+modalità: DEBUG disattivato, DEBUG attivo su ogni pacchetto e DEBUG campionato (un pacchetto
+su --sample). I messaggi di log vengono scritti su /dev/null, così il costo misurato è quello
+della costruzione dei messaggi e non dell'I/O. Le azioni delle regole vengono raccolte in una
+coda invece di essere registrate come allerte.
+
+Uso:
+    python -m benchmarks.bench_analyzer_throughput [--packets 200000] [--sample 100]
+"""
+
+import argparse
+import logging
+import os
+import random
+import time
+from queue import SimpleQueue
+
+from benchmarks.synthetic import build_frame
+from core.utils import DEFAULT_PROTOCOL_CONFIG, DEFAULT_RULES_CONFIG
+from rules.rule_manager import RuleManager
+from rules.rule_parser import RuleParser
+from services.packet_analyzer import PacketAnalyzer
+from services.packet_decoder import LINKTYPE_RAW, decode_frame
+
+
+def build_traffic(count, rng):
+    """
+    Genera 'count' pacchetti tra 4096 sorgenti esterne e gli host di HOME_NET (192.168.145.0/24).
+    """
+    packets = []
+    for i in range(count):
+        src = (203, 0, rng.randint(0, 15), rng.randint(1, 254))
+        dst = (192, 168, 145, rng.randint(1, 254))
+        kind = rng.random()
+        if kind < 0.6:
+            frame = build_frame(6, src, dst, rng.randint(1024, 65535), rng.choice((22, 80, 443, 8080)),
+                                rng.choice((0x02, 0x10, 0x18)))
+        elif kind < 0.9:
+            frame = build_frame(17, src, dst, rng.randint(1024, 65535), rng.choice((53, 123, 5353)))
+        else:
+            frame = build_frame(1, dst, src)
+        packets.append(decode_frame(frame, i * 1e-5, LINKTYPE_RAW))
+    return packets
+
+
+def build_analyzer(sample):
+    rule_manager = RuleManager(DEFAULT_PROTOCOL_CONFIG)
+    rules = RuleParser(DEFAULT_RULES_CONFIG, rule_manager).parse()
+    analyzer = PacketAnalyzer(None, rule_manager, config_dir="./configuration", rules=rules)
+    analyzer.event_sink = SimpleQueue()
+    analyzer.debug_sample_rate = sample
+    return analyzer
+
+
+def measure(packets, level, sample):
+    """
+    Analizza tutti i pacchetti con il livello di log indicato.
+
+    Returns:
+        float: Pacchetti al secondo.
+    """
+    logging.getLogger().setLevel(level)
+    analyzer = build_analyzer(sample)
+    analyze_packet = analyzer.analyze_packet
+    start = time.perf_counter()
+    for packet in packets:
+        analyze_packet(packet)
+    elapsed = time.perf_counter() - start
+    return len(packets) / elapsed
+
+
+def run(count, sample):
+    rng = random.Random(42)
+    packets = build_traffic(count, rng)
+    modes = (
+        ("DEBUG disattivato", logging.INFO, 1),
+        ("DEBUG su ogni pacchetto", logging.DEBUG, 1),
+        (f"DEBUG campionato 1/{sample}", logging.DEBUG, sample),
+    )
+    print(f"{'modalità':<28} {'pacchetti/s':>12} {'ns/pacchetto':>13}")
+    for name, level, rate in modes:
+        rate_pps = measure(packets, level, rate)
+        print(f"{name:<28} {rate_pps:>12.0f} {1e9 / rate_pps:>13.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del throughput dell'analyzer con diversi livelli di log")
+    parser.add_argument("--packets", type=int, default=200000, help="Numero di pacchetti analizzati per modalità")
+    parser.add_argument("--sample", type=int, default=100, help="Frequenza di campionamento del DEBUG campionato")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(open(os.devnull, "w"))])
+    run(args.packets, args.sample)
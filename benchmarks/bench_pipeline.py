@@ -0,0 +1,209 @@
+"""
+Benchmark riproducibile della pipeline di analisi per stadio, mix di traffico e dimensione del set di regole.
+
+Per ogni combinazione di mix di traffico sintetico (syn_flood, port_scan, benign_web, ipv6)
+e di numero di regole sintetiche (da 10 a 100000) vengono misurati, in ns per pacchetto:
+
+    decode       decode_frame sui frame raw
+    radix        RadixTree.search_int sull'albero dei prefissi sorgente del protocollo
+    lookup       RuleManager.get_matching_rules (bucket di wildcard e Patricia trie)
+    compiled     CompiledRuleSet.match_packet (tabelle per protocollo e porte)
+    analyze      PacketAnalyzer.analyze_packet completo (flussi, direzione, threshold)
+
+insieme al throughput di analyze_packet, al tempo di compilazione delle regole e al picco
+di memoria residente del processo (cumulativo: le dimensioni sono eseguite in ordine
+crescente). Traffico e regole sono generati con un seme fisso, quindi due esecuzioni sulla
+stessa macchina sono confrontabili: con --json i risultati vengono salvati in formato
+leggibile da programmi e con --baseline confrontati con quelli di un'esecuzione precedente.
+
+Uso:
+    python -m benchmarks.bench_pipeline [--packets 20000] [--rules 10 100 1000 10000 100000]
+                                        [--mixes syn_flood ipv6] [--json risultati.json]
+                                        [--baseline precedente.json] [--seed 42]
+"""
+
+import argparse
+import json
+import logging
+import platform
+import random
+import resource
+import sys
+import time
+from queue import SimpleQueue
+
+from benchmarks.synthetic import TRAFFIC_MIXES, build_rules, build_traffic, decode_traffic
+from core.utils import DEFAULT_PROTOCOL_CONFIG
+from rules.rule_manager import RuleManager
+from services.config_service import PROTOCOL_NAMES
+from services.packet_analyzer import PacketAnalyzer
+from services.packet_decoder import LINKTYPE_RAW, decode_frame
+
+
+RULE_COUNTS = (10, 100, 1000, 10000, 100000)
+STAGES = ("decode", "radix", "lookup", "compiled", "analyze")
+
+
+def peak_rss():
+    """
+    Restituisce il picco di memoria residente del processo in byte.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def build_pipeline(rules):
+    """
+    Carica le regole in un RuleManager e in un PacketAnalyzer (che le compila).
+
+    Restituisce:
+        tuple: (RuleManager, PacketAnalyzer, secondi impiegati).
+    """
+    start = time.perf_counter()
+    rule_manager = RuleManager(DEFAULT_PROTOCOL_CONFIG)
+    for rule in rules:
+        rule_manager.add_rule(rule.protocol, rule.src_ip, rule, rule.dst_ip)
+    analyzer = PacketAnalyzer(None, rule_manager, config_dir="./configuration", rules=rules)
+    analyzer.event_sink = SimpleQueue()  # Le azioni vengono raccolte invece di essere eseguite
+    return rule_manager, analyzer, time.perf_counter() - start
+
+
+def timed(packets, function):
+    """
+    Esegue `function` su ogni pacchetto e restituisce i ns medi per pacchetto.
+    """
+    start = time.perf_counter_ns()
+    for packet in packets:
+        function(packet)
+    return (time.perf_counter_ns() - start) / len(packets)
+
+
+def measure(frames, packets, rule_manager, analyzer):
+    """
+    Misura i ns per pacchetto di ciascuno stadio della pipeline.
+
+    Restituisce:
+        dict: ns per pacchetto per stadio.
+    """
+    names = [PROTOCOL_NAMES.get(packet.protocol) for packet in packets]
+    indexed = list(zip(names, packets))
+    results = {}
+
+    start = time.perf_counter_ns()
+    for timestamp, frame in frames:
+        decode_frame(frame, timestamp, LINKTYPE_RAW)
+    results["decode"] = (time.perf_counter_ns() - start) / len(frames)
+
+    trees = {name: index.src_tree for name, index in rule_manager.protocol_rules.items()}
+    results["radix"] = timed(indexed, lambda item: item[0] in trees and
+                             trees[item[0]].search_int(item[1].version, item[1].src_int))
+
+    get_matching_rules = rule_manager.get_matching_rules
+    results["lookup"] = timed(indexed, lambda item: item[0] in trees and
+                              get_matching_rules(item[0], item[1].src, item[1].dst))
+
+    match_packet = analyzer.compiled_rules.match_packet
+    results["compiled"] = timed(indexed, lambda item: match_packet(item[0], item[1]))
+
+    results["analyze"] = timed(packets, analyzer.analyze_packet)
+    return results
+
+
+def run(packet_count, rule_counts, mixes, seed, out=sys.stdout):
+    """
+    Esegue il benchmark su tutte le combinazioni richieste.
+
+    Restituisce:
+        dict: Metadati dell'esecuzione e lista dei risultati.
+    """
+    traffic = {}
+    for mix in mixes:
+        frames = build_traffic(mix, packet_count, random.Random(seed))
+        traffic[mix] = (frames, decode_traffic(frames))
+
+    results = []
+    for rule_count in sorted(rule_counts):
+        rules = build_rules(rule_count, random.Random(seed))
+        for mix in mixes:
+            # Pipeline nuova per ogni mix: flussi e threshold non passano da un mix all'altro
+            rule_manager, analyzer, build_seconds = build_pipeline(rules)
+            frames, packets = traffic[mix]
+            stages = measure(frames, packets, rule_manager, analyzer)
+            results.append({
+                "mix": mix,
+                "rules": rule_count,
+                "packets": len(packets),
+                "ns_per_packet": stages,
+                "throughput_pps": 1e9 / stages["analyze"],
+                "events": analyzer.event_sink.qsize(),
+                "build_seconds": build_seconds,
+                "peak_rss_bytes": peak_rss(),
+            })
+            print_result(results[-1], out)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "packets": packet_count,
+        },
+        "results": results,
+    }
+
+
+def print_header(out=sys.stdout):
+    stages = " ".join(f"{stage:>10}" for stage in STAGES)
+    print(f"{'mix':<11} {'regole':>7} {stages} {'pacchetti/s':>12} {'RSS MB':>8}", file=out)
+
+
+def print_result(result, out=sys.stdout):
+    stages = " ".join(f"{value:>10.0f}" for value in
+                      (result["ns_per_packet"][stage] for stage in STAGES))
+    print(f"{result['mix']:<11} {result['rules']:>7} {stages} {result['throughput_pps']:>12.0f} "
+          f"{result['peak_rss_bytes'] / 2 ** 20:>8.1f}", file=out, flush=True)
+
+
+def compare(report, baseline_path):
+    """
+    Confronta i ns per pacchetto di analyze_packet con quelli di un'esecuzione precedente.
+    """
+    with open(baseline_path) as f:
+        baseline = {(result["mix"], result["rules"]): result for result in json.load(f)["results"]}
+    print(f"\nConfronto con {baseline_path} (analyze, ns/pacchetto):")
+    print(f"{'mix':<11} {'regole':>7} {'baseline':>10} {'attuale':>10} {'rapporto':>9}")
+    for result in report["results"]:
+        previous = baseline.get((result["mix"], result["rules"]))
+        if previous is None:
+            continue
+        before, after = previous["ns_per_packet"]["analyze"], result["ns_per_packet"]["analyze"]
+        print(f"{result['mix']:<11} {result['rules']:>7} {before:>10.0f} {after:>10.0f} {after / before:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark della pipeline di analisi per stadio")
+    parser.add_argument("--packets", type=int, default=20000, help="Pacchetti per mix di traffico")
+    parser.add_argument("--rules", type=int, nargs="+", default=list(RULE_COUNTS), help="Dimensioni del set di regole")
+    parser.add_argument("--mixes", nargs="+", choices=list(TRAFFIC_MIXES), default=list(TRAFFIC_MIXES),
+                        help="Mix di traffico da misurare")
+    parser.add_argument("--seed", type=int, default=42, help="Seme del generatore di traffico e regole")
+    parser.add_argument("--json", default=None, help="File in cui salvare i risultati in JSON ('-' per stdout)")
+    parser.add_argument("--baseline", default=None, help="Risultati JSON di un'esecuzione precedente da confrontare")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    # Con il JSON su stdout la tabella viene scritta su stderr
+    out = sys.stderr if args.json == "-" else sys.stdout
+    print_header(out)
+    report = run(args.packets, args.rules, args.mixes, args.seed, out)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        compare(report, args.baseline)
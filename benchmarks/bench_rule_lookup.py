@@ -0,0 +1,79 @@
+"""
+Benchmark della ricerca delle regole candidate in RuleManager.get_matching_rules.
+
+Per ogni dimensione del set di regole vengono caricate N regole TCP (WILDCARD_RULES regole
+wildcard, il resto con prefissi CIDR sorgente/destinazione casuali) e viene misurato il costo
+medio di una ricerca. Con il bucket di wildcard e la Patricia trie il costo deve restare
+sostanzialmente costante al crescere di N.
+
+Uso:
+    python -m benchmarks.bench_rule_lookup [--lookups 20000]
+"""
+
+import argparse
+import logging
+import random
+import time
+
+from core.utils import DEFAULT_PROTOCOL_CONFIG
+from rules.rule import Rule
+from rules.rule_manager import RuleManager
+
+
+RULE_COUNTS = (10, 100, 1000, 10000, 100000)
+WILDCARD_RULES = 5
+
+
+def random_prefix(rng):
+    """
+    Genera un prefisso IPv4 casuale tra /8 e /32.
+    """
+    length = rng.randint(8, 32)
+    address = rng.getrandbits(32) & (((1 << length) - 1) << (32 - length))
+    return f"{address >> 24}.{(address >> 16) & 255}.{(address >> 8) & 255}.{address & 255}/{length}"
+
+
+def build_rule_manager(rule_count, rng):
+    """
+    Crea un RuleManager con 'rule_count' regole TCP sintetiche.
+    """
+    rule_manager = RuleManager(DEFAULT_PROTOCOL_CONFIG)
+    for rule_id in range(rule_count):
+        if rule_id < WILDCARD_RULES:
+            src_ip, dst_ip = "any", "any"
+        elif rule_id % 2:
+            src_ip, dst_ip = random_prefix(rng), "any"
+        else:
+            src_ip, dst_ip = "any", random_prefix(rng)
+        rule = Rule(str(rule_id), "TCP", src_ip, dst_ip, "any", "any", "alert", "benchmark")
+        rule_manager.add_rule("TCP", src_ip, rule, dst_ip)
+    return rule_manager
+
+
+def run(lookups):
+    rng = random.Random(42)
+    addresses = [
+        (f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+         f"172.16.{rng.randint(0, 255)}.{rng.randint(1, 254)}")
+        for _ in range(1024)
+    ]
+
+    print(f"{'regole':>8} {'ns/ricerca':>12} {'candidate medie':>16}")
+    for rule_count in RULE_COUNTS:
+        rule_manager = build_rule_manager(rule_count, rng)
+        get_matching_rules = rule_manager.get_matching_rules
+        candidates = 0
+        start = time.perf_counter_ns()
+        for i in range(lookups):
+            src_ip, dst_ip = addresses[i & 1023]
+            candidates += len(get_matching_rules("TCP", src_ip, dst_ip))
+        elapsed = time.perf_counter_ns() - start
+        print(f"{rule_count:>8} {elapsed / lookups:>12.0f} {candidates / lookups:>16.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark della ricerca delle regole")
+    parser.add_argument("--lookups", type=int, default=20000, help="Numero di ricerche per dimensione")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    run(args.lookups)
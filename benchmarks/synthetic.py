@@ -0,0 +1,204 @@
+"""
+Generatori deterministici di traffico e di set di regole sintetici per i benchmark.
+
+Tutti i generatori ricevono un random.Random: con lo stesso seme producono sempre gli
+stessi frame e le stesse regole, così i risultati di esecuzioni diverse sono confrontabili.
+
+Mix di traffico disponibili (TRAFFIC_MIXES):
+    syn_flood   SYN verso un host di HOME_NET da sorgenti esterne casuali (spoofing).
+    port_scan   Una sorgente esterna che invia SYN a porte crescenti di pochi host.
+    benign_web  Connessioni HTTP/HTTPS stabilite tra client di HOME_NET e server esterni,
+                con pacchetti in entrambi i versi.
+    ipv6        Traffico TCP/UDP/ICMPv6 tra prefissi IPv6 esterni e interni.
+"""
+
+import ipaddress
+import struct
+
+from rules.rule import Rule
+from services.packet_decoder import LINKTYPE_RAW, decode_frame
+
+
+IPV4_HEADER = struct.Struct("!BBHHHBBH4s4s")
+IPV6_HEADER = struct.Struct("!IHBB16s16s")
+TCP_HEADER = struct.Struct("!HHIIBBHHH")
+UDP_HEADER = struct.Struct("!HHHH")
+ICMP_HEADER = struct.Struct("!BBHI")
+
+SYN, ACK, PSH_ACK = 0x02, 0x10, 0x18
+
+HOME_NET = (192, 168, 145)  # Deve corrispondere a HOME_NET di configuration/config_settings.json
+HOME_NET6 = 0x20010DB8_00010000 << 64
+EXTERNAL_NET6 = 0x2001_0DB8_FFFF_0000 << 64
+
+
+def _transport(protocol, sport, dport, flags):
+    if protocol == 6:
+        return TCP_HEADER.pack(sport, dport, 0, 0, 5 << 4, flags, 65535, 0, 0)
+    if protocol == 17:
+        return UDP_HEADER.pack(sport, dport, UDP_HEADER.size, 0)
+    if protocol == 58:
+        return ICMP_HEADER.pack(128, 0, 0, 0)
+    return ICMP_HEADER.pack(8, 0, 0, 0)
+
+
+def build_frame(protocol, src, dst, sport=0, dport=0, flags=0):
+    """
+    Costruisce un pacchetto IPv4 raw (senza header Ethernet) con l'header di trasporto richiesto.
+
+    Argomenti:
+        protocol (int): 6 (TCP), 17 (UDP) o 1 (ICMP).
+        src, dst (tuple|bytes): Indirizzi come 4 ottetti.
+    """
+    payload = _transport(protocol, sport, dport, flags)
+    header = IPV4_HEADER.pack(0x45, 0, IPV4_HEADER.size + len(payload), 0, 0, 64, protocol, 0,
+                              bytes(src), bytes(dst))
+    return header + payload
+
+
+def build_frame6(protocol, src, dst, sport=0, dport=0, flags=0):
+    """
+    Costruisce un pacchetto IPv6 raw con l'header di trasporto richiesto.
+
+    Argomenti:
+        protocol (int): 6 (TCP), 17 (UDP) o 58 (ICMPv6).
+        src, dst (int): Indirizzi IPv6 come interi a 128 bit.
+    """
+    payload = _transport(protocol, sport, dport, flags)
+    header = IPV6_HEADER.pack(6 << 28, len(payload), protocol, 64, src.to_bytes(16, "big"), dst.to_bytes(16, "big"))
+    return header + payload
+
+
+def _home(rng):
+    return HOME_NET + (rng.randint(1, 254),)
+
+
+def _external(rng):
+    return (rng.choice((23, 45, 77, 151, 185, 203)), rng.randint(0, 255), rng.randint(0, 255), rng.randint(1, 254))
+
+
+def syn_flood(count, rng):
+    target = _home(rng)
+    return [build_frame(6, _external(rng), target, rng.randint(1024, 65535), 80, SYN) for _ in range(count)]
+
+
+def port_scan(count, rng):
+    scanner = _external(rng)
+    targets = [_home(rng) for _ in range(4)]
+    frames = []
+    for i in range(count):
+        dport = i // len(targets) % 65535 + 1
+        frames.append(build_frame(6, scanner, targets[i % len(targets)], 40000 + i % 1000, dport, SYN))
+    return frames
+
+
+def benign_web(count, rng):
+    # Flussi stabiliti: ogni connessione scambia pacchetti in entrambi i versi
+    connections = [(_home(rng), _external(rng), rng.randint(1024, 65535), rng.choice((80, 443)))
+                   for _ in range(max(1, count // 50))]
+    frames = []
+    for _ in range(count):
+        client, server, sport, dport = rng.choice(connections)
+        if rng.random() < 0.5:
+            frames.append(build_frame(6, client, server, sport, dport, rng.choice((ACK, PSH_ACK))))
+        else:
+            frames.append(build_frame(6, server, client, dport, sport, rng.choice((ACK, PSH_ACK))))
+    return frames
+
+
+def ipv6(count, rng):
+    frames = []
+    for _ in range(count):
+        src = EXTERNAL_NET6 | rng.getrandbits(64)
+        dst = HOME_NET6 | rng.randint(1, 1024)
+        kind = rng.random()
+        if kind < 0.6:
+            frames.append(build_frame6(6, src, dst, rng.randint(1024, 65535), rng.choice((22, 80, 443)),
+                                       rng.choice((SYN, ACK, PSH_ACK))))
+        elif kind < 0.9:
+            frames.append(build_frame6(17, src, dst, rng.randint(1024, 65535), rng.choice((53, 123))))
+        else:
+            frames.append(build_frame6(58, dst, src))
+    return frames
+
+
+TRAFFIC_MIXES = {
+    "syn_flood": syn_flood,
+    "port_scan": port_scan,
+    "benign_web": benign_web,
+    "ipv6": ipv6,
+}
+
+
+def build_traffic(mix, count, rng, rate=100000.0):
+    """
+    Genera i frame raw di un mix di traffico con timestamp a intervalli regolari.
+
+    Argomenti:
+        mix (str): Nome del mix (chiave di TRAFFIC_MIXES).
+        count (int): Numero di pacchetti.
+        rng (random.Random): Generatore pseudo-casuale.
+        rate (float): Pacchetti al secondo simulati dai timestamp.
+
+    Restituisce:
+        list: Tuple (timestamp, frame) decodificabili con LINKTYPE_RAW.
+    """
+    frames = TRAFFIC_MIXES[mix](count, rng)
+    return [(i / rate, frame) for i, frame in enumerate(frames)]
+
+
+def decode_traffic(frames):
+    """
+    Decodifica i frame generati da build_traffic in PacketMeta.
+    """
+    return [decode_frame(frame, timestamp, LINKTYPE_RAW) for timestamp, frame in frames]
+
+
+def _random_prefix(rng, version):
+    if version == 6:
+        length = rng.randint(64, 128)
+        base = rng.choice((EXTERNAL_NET6, HOME_NET6)) | rng.getrandbits(64)
+        network = ipaddress.IPv6Network((base >> (128 - length) << (128 - length), length))
+    else:
+        length = rng.randint(8, 32)
+        network = ipaddress.IPv4Network((rng.getrandbits(32) >> (32 - length) << (32 - length), length))
+    return str(network)
+
+
+def build_rules(count, rng, wildcard=5):
+    """
+    Genera un set di regole sintetiche, simile per composizione a un set reale: poche regole
+    wildcard, le altre con un prefisso sorgente o di destinazione (un quinto IPv6), porte,
+    flag TCP e threshold variabili.
+
+    Argomenti:
+        count (int): Numero di regole.
+        rng (random.Random): Generatore pseudo-casuale.
+        wildcard (int): Numero di regole con src_ip e dst_ip "any".
+
+    Restituisce:
+        list: Le Rule generate, con rule_id progressivi.
+    """
+    rules = []
+    for rule_id in range(count):
+        protocol = rng.choices(("TCP", "UDP", "ICMP"), (70, 20, 10))[0]
+        src_ip = dst_ip = "any"
+        if rule_id >= wildcard:
+            prefix = _random_prefix(rng, 6 if rng.random() < 0.2 else 4)
+            if rng.random() < 0.5:
+                src_ip = prefix
+            else:
+                dst_ip = prefix
+        src_port = dst_port = "any"
+        flags = []
+        if protocol != "ICMP":
+            if rng.random() < 0.7:
+                dst_port = rng.choice((22, 23, 53, 80, 123, 443, 445, 3389, 8080, rng.randint(1, 65535)))
+            if protocol == "TCP" and rng.random() < 0.5:
+                flags = ["S"]
+        threshold = {"count": rng.choice((1, 5, 20, 100)), "time": rng.choice((1, 10, 60)),
+                     "track": rng.choice(("by_src", "by_dst", "by_src_dst", "by_flow"))}
+        rules.append(Rule(str(rule_id), protocol, src_ip, dst_ip, src_port, dst_port, "alert",
+                          f"Regola sintetica {rule_id}", direction=rng.choice(("in", "out", "both")),
+                          flags=flags, threshold=threshold))
+    return rules
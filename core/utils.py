@@ -1,6 +1,9 @@
 import argparse
 import logging
+import logging.handlers
 import os
+import signal
+from queue import Full, Queue
 
 def setup_logging(log_file="/tmp/openwrt-ids-ips.log"):
     """
@@ -41,6 +44,48 @@ def setup_logging(log_file="/tmp/openwrt-ids-ips.log"):
 
 
 
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler su una coda limitata: a coda piena il record viene scartato e contato,
+    invece di bloccare il thread chiamante o segnalare un errore.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+def setup_async_logging(level=logging.INFO, max_pending=10000):
+    """
+    Configura il logging asincrono: i thread dell'applicazione inseriscono i record in una
+    coda limitata tramite un QueueHandler e un QueueListener li scrive su stderr dal proprio
+    thread, così le scritture del log non rallentano cattura e analisi.
+
+    Argomenti:
+        level (int): Livello di log del logger radice.
+        max_pending (int): Numero massimo di record in attesa di scrittura.
+
+    Restituisce:
+        logging.handlers.QueueListener: Il listener avviato, da arrestare con stop() alla chiusura.
+    """
+    log_queue = Queue(maxsize=max_pending)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    listener.start()
+    return listener
+
+
 def parse_arguments():
     """
     Analizza gli argomenti da riga di comando.
@@ -51,8 +96,8 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description="Sniffer di rete con Scapy")
     parser.add_argument(
         "-i", "--interface", 
-        required=True, 
-        help="Interfaccia di rete da analizzare (es. eth0, wlan0, etc.)"
+        required=False, 
+        help="Interfaccia di rete da analizzare (es. eth0, wlan0, etc.), obbligatoria con 'start'"
     )
     parser.add_argument(
         "-c", "--config", 
@@ -66,12 +111,166 @@ def parse_arguments():
         default="192.168.1.0/24", 
         help="Indirizzo di rete HOME_NET (es. 192.168.1.0/24, 10.0.0.0/8, singolo indirizzo IP)."
     )
+    parser.add_argument(
+        "--capture-backend",
+        required=False,
+        choices=["scapy", "afpacket"],
+        default="scapy",
+        help="Backend di cattura: 'scapy' oppure 'afpacket' (socket AF_PACKET con ring PACKET_MMAP e letture a lotti)"
+    )
+    parser.add_argument(
+        "--no-bpf-prefilter",
+        action="store_true",
+        help="Disattiva il filtro BPF calcolato dalle regole e cattura tutto il traffico"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Numero di processi di analisi (default: 1, analisi in un thread del processo principale)"
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=["auto", "src", "flow"],
+        default="auto",
+        help="Chiave di distribuzione dei pacchetti tra i worker: IP sorgente, 5-tupla simmetrica o 'auto' "
+             "(default: per flusso se una regola usa flow_state o track by_flow, altrimenti per sorgente)"
+    )
+    parser.add_argument(
+        "--firewall",
+        choices=["nftables", "ipset", "iptables", "dry-run"],
+        default="nftables",
+        help="Backend di enforcement dei blocchi: set nftables, ipset, regole iptables per IP o dry-run (nessuna modifica)"
+    )
+    parser.add_argument(
+        "--block-timeout",
+        type=int,
+        default=3600,
+        help="Durata in secondi dei blocchi applicati dal firewall (default: 3600, 0 per nessuna scadenza)"
+    )
+    parser.add_argument(
+        "--max-blocked",
+        type=int,
+        default=10000,
+        help="Numero massimo di indirizzi bloccati; oltre il limite viene rimosso il blocco più vecchio (default: 10000)"
+    )
+    parser.add_argument(
+        "--blacklist-snapshot",
+        default=None,
+        help=f"File JSON in cui salvare la blacklist, riapplicata all'avvio (default: {DEFAULT_BLACKLIST_SNAPSHOT})"
+    )
+    parser.add_argument(
+        "--alert-log",
+        default=DEFAULT_ALERT_LOG,
+        help=f"File JSON-lines (formato EVE) delle allerte strutturate (default: {DEFAULT_ALERT_LOG})"
+    )
+    parser.add_argument(
+        "--alert-log-size",
+        type=int,
+        default=64,
+        help="Dimensione in MB oltre la quale il file delle allerte viene ruotato (default: 64, 0 per non ruotare)"
+    )
+    parser.add_argument(
+        "--alert-window",
+        type=float,
+        default=60,
+        help="Secondi in cui le allerte ripetute di una regola per la stessa sorgente sono riassunte in un unico riepilogo (default: 60, 0 per disattivare)"
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Livello di log (default: INFO)"
+    )
+    parser.add_argument(
+        "--debug-sample",
+        type=int,
+        default=1,
+        help="Con --log-level DEBUG registra i dettagli di un pacchetto ogni N (default: 1, tutti i pacchetti)"
+    )
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        help="Esporta le metriche in formato Prometheus su un indirizzo locale: 'host:porta' (es. 127.0.0.1:9108) o 'unix:/percorso'"
+    )
+    parser.add_argument(
+        "--rule-profile",
+        action="store_true",
+        help="Misura valutazioni, match e tempo cumulativo di ciascuna regola (riportati nel log, nelle metriche e nei profili)"
+    )
+    parser.add_argument(
+        "--profile-output",
+        default=DEFAULT_PROFILE_OUTPUT,
+        help=f"Prefisso dei file dei profili a campionamento avviati con SIGUSR1 (default: {DEFAULT_PROFILE_OUTPUT})"
+    )
+    parser.add_argument(
+        "--profile-duration",
+        type=float,
+        default=10,
+        help="Durata in secondi di un profilo a campionamento (default: 10)"
+    )
+    parser.add_argument(
+        "--pcap",
+        default=None,
+        help="File pcap o pcapng da riprodurre con il comando 'replay'"
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=0,
+        help="Velocità della riproduzione: 0 per la massima velocità (default), 1 per il ritmo originale della cattura"
+    )
+    parser.add_argument(
+        "--rules-watch",
+        type=float,
+        default=2,
+        help="Intervallo in secondi di controllo del file delle regole, ricaricato senza riavvio quando cambia (default: 2, 0 per ricaricarlo solo con SIGHUP o 'update-rules')"
+    )
+    parser.add_argument(
+        "--pid-file",
+        default=DEFAULT_PID_FILE,
+        help=f"File con il PID del servizio in esecuzione, usato da 'update-rules' (default: {DEFAULT_PID_FILE})"
+    )
     parser.add_argument(
         "command", 
-        choices=["start", "stop"], 
-        help="Comando per avviare o fermare il servizio"
+        choices=["start", "stop", "replay", "update-rules"], 
+        help="Comando per avviare o fermare il servizio, per ricaricarne le regole o per riprodurre un file pcap"
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.command == "replay" and not args.pcap:
+        parser.error("il comando 'replay' richiede --pcap")
+    if args.command in ("start", "stop") and not args.interface:
+        parser.error(f"il comando '{args.command}' richiede --interface")
+    if args.replay_speed < 0:
+        parser.error("--replay-speed non può essere negativo")
+    if args.rules_watch < 0:
+        parser.error("--rules-watch non può essere negativo")
+    return args
+
+
+def request_rules_reload(pid_file=None):
+    """
+    Chiede al servizio in esecuzione di ricaricare le regole inviandogli SIGHUP.
+
+    Il servizio rilegge e compila le regole in background e le sostituisce a quelle attive
+    senza interrompere la cattura.
+
+    Argomenti:
+        pid_file (str): File con il PID del servizio (default: DEFAULT_PID_FILE).
+
+    Restituisce:
+        bool: True se il segnale è stato inviato.
+    """
+    pid_file = pid_file or DEFAULT_PID_FILE
+    try:
+        with open(pid_file) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, signal.SIGHUP)
+    except (OSError, ValueError) as e:
+        logging.error(f"Impossibile richiedere il ricaricamento delle regole (PID file {pid_file}): {e}")
+        return False
+    logging.info(f"Ricaricamento delle regole richiesto al processo {pid}.")
+    return True
 
 
 def clear_log_file():
@@ -102,4 +301,12 @@ DEFAULT_PROTOCOL_CONFIG = "./configuration/config_protocols.json"
 
 DEFAULT_SETTINGS_CONFIG = "./configuration/config_settings.json"
 
-DEFAULT_RULES_CONFIG = "./rules/config_rules.json"
\ No newline at end of file
+DEFAULT_RULES_CONFIG = "./rules/config_rules.json"
+
+DEFAULT_BLACKLIST_SNAPSHOT = "./configuration/blacklist_snapshot.json"
+
+DEFAULT_ALERT_LOG = "/tmp/openwrt-ids-ips-alerts.json"
+
+DEFAULT_PROFILE_OUTPUT = "/tmp/openwrt-ids-ips-profile"
+
+DEFAULT_PID_FILE = "/tmp/openwrt-ids-ips.pid"
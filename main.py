@@ -7,15 +7,47 @@ Utilizza la libreria argparse per la gestione della riga di comando e logging pe
 
 Argomenti da linea di comando:
 ------------------------------
--i, --interface        : Interfaccia di rete da monitorare (obbligatorio)
+-i, --interface        : Interfaccia di rete da monitorare (obbligatorio con 'start')
                          Esempio: eth0, wlan0, etc.
 -c, --config           : Percorso al file di configurazione delle regole (facoltativo)
                          Default: './rules/config_rules.json'
 --home-net             : Indirizzo di rete HOME_NET (es. 192.168.1.0/24, 10.0.0.0/8, singolo indirizzo IP).
                          Default : 192.168.1.0/24
+--capture-backend      : Backend di cattura dei pacchetti (facoltativo)
+                         - 'scapy' (default) socket di cattura di Scapy
+                         - 'afpacket' socket AF_PACKET con ring PACKET_MMAP e letture a lotti
+--no-bpf-prefilter     : Disattiva il filtro BPF calcolato dalle regole (facoltativo)
+--workers              : Numero di processi di analisi (facoltativo, default 1)
+--shard-by             : Distribuzione dei pacchetti tra i worker: 'auto' (default), 'src' o 'flow'.
+                         'auto' usa 'flow' se una regola usa flow_state o track by_flow, altrimenti 'src';
+                         'src' con queste regole viene sostituito da 'flow'
+--firewall             : Backend di enforcement dei blocchi (facoltativo)
+                         - 'nftables' (default) set nftables con timeout
+                         - 'ipset' set ipset referenziati da iptables
+                         - 'iptables' regole DROP per singolo IP
+                         - 'dry-run' nessuna modifica al firewall
+--block-timeout        : Durata dei blocchi in secondi (facoltativo, default 3600, 0 per nessuna scadenza)
+--max-blocked          : Numero massimo di indirizzi bloccati (facoltativo, default 10000)
+--blacklist-snapshot   : File dello snapshot della blacklist riapplicato all'avvio (facoltativo)
+--alert-log            : File JSON-lines (formato EVE) delle allerte (facoltativo, default '/tmp/openwrt-ids-ips-alerts.json')
+--alert-log-size       : Dimensione in MB per la rotazione del file delle allerte (facoltativo, default 64)
+--alert-window         : Finestra in secondi di soppressione delle allerte ripetute (facoltativo, default 60, 0 per disattivare)
+--log-level            : Livello di log: DEBUG, INFO (default), WARNING, ERROR
+--debug-sample         : Con DEBUG attivo registra i dettagli di un pacchetto ogni N (facoltativo, default 1)
+--metrics              : Indirizzo locale su cui esportare le metriche Prometheus, 'host:porta' o 'unix:/percorso' (facoltativo)
+--rule-profile         : Misura valutazioni, match e tempo cumulativo di ciascuna regola (facoltativo)
+--profile-output       : Prefisso dei file dei profili a campionamento, avviati con SIGUSR1 (facoltativo)
+--profile-duration     : Durata in secondi di un profilo a campionamento (facoltativo, default 10)
+--pcap                 : File pcap o pcapng da riprodurre (obbligatorio con 'replay')
+--replay-speed         : Velocità della riproduzione: 0 massima (default), 1 ritmo originale della cattura
+--rules-watch          : Intervallo in secondi di controllo del file delle regole, ricaricato quando cambia
+                         (facoltativo, default 2, 0 per ricaricarlo solo con SIGHUP o 'update-rules')
+--pid-file             : File con il PID del servizio, usato da 'update-rules' (default '/tmp/openwrt-ids-ips.pid')
 command                : Comando per avviare o fermare il servizio
                          - 'start' per avviare il servizio
                          - 'stop' per fermare il servizio
+                         - 'replay' per analizzare offline un file pcap/pcapng con la stessa pipeline
+                         - 'update-rules' per far ricaricare le regole al servizio in esecuzione (SIGHUP)
 
 Funzionalità principali:
 -------------------------
@@ -31,6 +63,11 @@ Funzionalità principali:
 3. Avvio e arresto del servizio:
    - Se viene fornito il comando 'start', il servizio viene avviato utilizzando il ServiceManager.
    - Se viene fornito il comando 'stop', viene eseguita una logica di arresto (da implementare).
+   - Se viene fornito il comando 'replay', il file indicato con --pcap viene analizzato usando i
+     timestamp di cattura, senza modificare il firewall, e al termine viene stampato un riepilogo.
+   - Se viene fornito il comando 'update-rules', al servizio in esecuzione viene inviato SIGHUP:
+     le regole vengono rilette e sostituite senza fermare la cattura, conservando blacklist
+     e contatori del threshold delle regole invariate.
 
 Requisiti:
 -----------
@@ -40,7 +77,8 @@ Requisiti:
 """
 
 import logging
-from core.utils import clear_log_file, parse_arguments, setup_logging
+import sys
+from core.utils import clear_log_file, parse_arguments, request_rules_reload, setup_async_logging
 from services.service_manager import ServiceManager
 
 
@@ -60,12 +98,45 @@ if __name__ == "__main__":
     config_file = args.config
     #home_net = args.home_net
 
-    # Imposta il logging
-    logging.basicConfig(level=logging.INFO)
+    # Imposta il logging (scritto da un thread dedicato)
+    log_listener = setup_async_logging(getattr(logging, args.log_level))
     
+    # Il ricaricamento delle regole viene eseguito dal servizio già in esecuzione
+    if args.command == "update-rules":
+        reloaded = request_rules_reload(args.pid_file)
+        log_listener.stop()
+        sys.exit(0 if reloaded else 1)
+
+    # La riproduzione usa il file pcap come sorgente dei pacchetti al posto dell'interfaccia
+    if args.command == "replay":
+        interface = args.pcap
+        capture_backend = "pcap"
+    else:
+        capture_backend = args.capture_backend
 
     # Inizializzazione del service manager con la configurazione
-    service_manager = ServiceManager(interface, config_file)
+    service_manager = ServiceManager(
+        interface,
+        config_file,
+        capture_backend=capture_backend,
+        bpf_prefilter=not args.no_bpf_prefilter,
+        workers=args.workers,
+        shard_by=args.shard_by,
+        firewall_backend=args.firewall,
+        block_timeout=args.block_timeout,
+        max_blocked=args.max_blocked,
+        blacklist_snapshot=args.blacklist_snapshot,
+        debug_sample_rate=args.debug_sample,
+        alert_log=args.alert_log,
+        alert_log_max_bytes=args.alert_log_size * 1024 * 1024,
+        alert_window=args.alert_window,
+        replay_speed=args.replay_speed,
+        metrics_address=args.metrics,
+        rule_profile=args.rule_profile,
+        profile_output=args.profile_output,
+        profile_duration=args.profile_duration,
+        rules_watch_interval=args.rules_watch
+    )
 
     if args.command == "start":
         # Svuota o crea il file di log
@@ -78,5 +149,14 @@ if __name__ == "__main__":
         logging.info("Comando stop ricevuto.")
         service_manager.stop()
     
-    elif args.command == "update-rules":
-        logging.info("#Update Rules commad !")
+    elif args.command == "replay":
+        service_manager.start()
+        summary = service_manager.replay_summary()
+        print(f"Pacchetti: {summary['packets']} ({summary['non_ip']} non IP) in {summary['seconds']:.2f} s, "
+              f"{summary['pps']:.0f} pacchetti/s")
+        print(f"Allerte: {summary['alerts']} ({summary['suppressed']} soppresse), "
+              f"allerte scartate: {summary['alerts_dropped']}")
+        print(f"Pacchetti scartati: {summary['dropped']}")
+
+    # Scrive i record di log ancora in coda
+    log_listener.stop()
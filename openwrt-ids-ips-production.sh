@@ -67,6 +67,23 @@ stop_service() {
     echo "[INFO] Tutti i processi del servizio $SERVICE_SCRIPT sono stati arrestati."
 }
 
+reload_service() {
+    if [ -f "$SERVICE_PID_FILE" ]; then
+        PID=$(cat "$SERVICE_PID_FILE")
+        if kill -0 $PID > /dev/null; then
+            echo "Ricaricamento delle regole del servizio con PID $PID..."
+            kill -SIGHUP "$PID"  # Le regole vengono sostituite senza fermare la cattura
+            echo "Richiesta di ricaricamento inviata. L'esito è riportato in $LOG_FILE."
+        else
+            echo "[ERROR] Il processo con PID $PID non è in esecuzione."
+            exit 1
+        fi
+    else
+        echo "[ERROR] Nessun PID trovato nel file. Il servizio non è in esecuzione?"
+        exit 1
+    fi
+}
+
 case "$1" in
   start)
     start_service "$@"
@@ -74,8 +91,11 @@ case "$1" in
   stop)
     stop_service
     ;;
+  reload)
+    reload_service
+    ;;
   *)
-    echo "Uso: $0 {start|stop} [interfaccia]"
+    echo "Uso: $0 {start|stop|reload} [interfaccia]"
     exit 1
     ;;
 esac
\ No newline at end of file
@@ -1,40 +1,123 @@
 import logging
+import socket
+
+
+# Ampiezza in bit degli indirizzi per ciascuna famiglia IP
+ADDRESS_WIDTH = {4: 32, 6: 128}
+
+
+def parse_prefix(key):
+    """
+    Converte un prefisso testuale (CIDR, singolo indirizzo o 'any') nella sua forma intera.
+
+    Argomenti:
+    ----------
+    key (str): Prefisso da convertire (es. "10.0.0.0/8", "192.168.1.1", "2001:db8::/32", "any").
+
+    Restituisce:
+    -----------
+    list: Lista di tuple (versione, prefisso intero, lunghezza del prefisso).
+          'any' corrisponde a 0.0.0.0/0 e ::/0, quindi restituisce una tupla per ciascuna famiglia.
+
+    Eccezioni:
+    ----------
+    ValueError: Se il prefisso non è un indirizzo o una rete IP valida.
+    """
+    if key is None or key == "any":
+        return [(4, 0, 0), (6, 0, 0)]
+
+    key = str(key).strip()
+    address, _, length = key.partition("/")
+    version = 6 if ":" in address else 4
+    width = ADDRESS_WIDTH[version]
+    try:
+        packed = socket.inet_pton(socket.AF_INET6 if version == 6 else socket.AF_INET, address)
+    except OSError:
+        raise ValueError(f"Indirizzo IP non valido: {key}")
+
+    prefix_length = int(length) if length else width
+    if not 0 <= prefix_length <= width:
+        raise ValueError(f"Lunghezza del prefisso non valida: {key}")
+
+    value = int.from_bytes(packed, "big")
+    # Azzera i bit di host, come ipaddress.ip_network(..., strict=False)
+    value &= ((1 << prefix_length) - 1) << (width - prefix_length)
+    return [(version, value, prefix_length)]
+
+
+def parse_address(ip):
+    """
+    Converte un indirizzo IP testuale nella coppia (versione, intero) senza passare da ipaddress.
+
+    Argomenti:
+    ----------
+    ip (str): Indirizzo IPv4 o IPv6.
+
+    Restituisce:
+    -----------
+    tuple: (versione, indirizzo intero).
+
+    Eccezioni:
+    ----------
+    ValueError: Se l'indirizzo non è valido.
+    """
+    try:
+        if ":" in ip:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+        return 4, int.from_bytes(socket.inet_aton(ip), "big")
+    except (OSError, TypeError):
+        raise ValueError(f"Indirizzo IP non valido: {ip}")
 
 
 class RadixTreeNode:
     """
-    Nodo base per la struttura Radix Tree.
+    Nodo di una Patricia trie binaria (path-compressed).
 
     Attributi:
     -----------
-    children (dict): Dizionario che memorizza i nodi figli, con le chiavi come caratteri e i valori come nodi.
-    rules (list): Lista delle regole associate al nodo.
+    prefix (int): Valore intero del prefisso, con i bit oltre 'length' azzerati.
+    length (int): Lunghezza del prefisso in bit.
+    children (list): I due figli del nodo, indicizzati dal bit successivo al prefisso (0 o 1).
+    rules (list): Lista delle regole associate esattamente a questo prefisso.
     """
 
-    def __init__(self):
-        self.children = {}
+    __slots__ = ("prefix", "length", "children", "rules")
+
+    def __init__(self, prefix=0, length=0):
+        self.prefix = prefix
+        self.length = length
+        self.children = [None, None]
         self.rules = []
 
+
 class RadixTree:
     """
-    Implementazione di una Radix Tree (albero delle radici) per la gestione delle regole.
+    Implementazione di una Radix Tree binaria (Patricia trie) per la ricerca longest-prefix-match
+    di regole associate a prefissi CIDR IPv4 e IPv6.
 
-    La Radix Tree è una struttura dati ottimizzata per la gestione e la ricerca di regole in base a prefissi.
-    Ogni nodo della Radix Tree può contenere più regole e i prefissi sono utilizzati per organizzare le regole.
+    Le chiavi sono convertite una sola volta in interi al momento dell'inserimento; la ricerca
+    scende dalla radice confrontando bit degli indirizzi interi, per cui il costo è al massimo
+    O(32) per IPv4 e O(128) per IPv6, indipendentemente dal numero di regole inserite.
 
     Attributi:
     -----------
-    root (RadixTreeNode): Il nodo radice della Radix Tree.
+    roots (dict): Nodo radice (prefisso di lunghezza 0) per ciascuna famiglia IP (4 e 6).
+    size (int): Numero di associazioni (prefisso, regola) presenti nell'albero.
 
     Metodi:
     --------
     insert(key, rule):
-        Inserisce una regola nella Radix Tree, utilizzando 'key' come prefisso.
-        Ottimizza l'inserimento unendo nodi quando possibile.
+        Inserisce una regola associata al prefisso CIDR 'key' ('any' equivale a /0).
 
     search(key):
-        Cerca tutte le regole che corrispondono al prefisso specificato.
-        Restituisce regole con wildcard 'any' se non trova corrispondenze esatte.
+        Restituisce tutte le regole i cui prefissi contengono l'indirizzo specificato,
+        dal meno specifico al più specifico.
+
+    search_int(version, address):
+        Come search, ma su un indirizzo già convertito in intero.
+
+    longest_match(key):
+        Restituisce solo le regole del prefisso più specifico che contiene l'indirizzo.
 
     remove_rule(key, rule):
         Rimuove una regola associata a un prefisso specifico.
@@ -42,130 +125,173 @@ class RadixTree:
 
     display(node=None, prefix=""):
         Stampa la struttura del Radix Tree (utile per il debug).
-
-    _collect_rules_with_wildcards(node):
-        Raccoglie tutte le regole con wildcard ('any') nel Radix Tree.
-
-    _is_wildcard_rule(rule):
-        Verifica se una regola contiene wildcard ('any').
     """
 
     def __init__(self):
         """
-        Inizializza la Radix Tree con un nodo radice vuoto.
+        Inizializza la Radix Tree con un nodo radice vuoto per IPv4 e uno per IPv6.
         """
-        self.root = RadixTreeNode()
+        self.roots = {4: RadixTreeNode(), 6: RadixTreeNode()}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
 
     def insert(self, key: str, rule: object):
-            """
-            Inserisce una regola nella Radix Tree, utilizzando 'key' come prefisso.
-            Consente regole duplicate solo se l'ID della regola è diverso.
-
-            Argomenti:
-            ----------
-            key (str): Il prefisso (stringa) da utilizzare per l'inserimento della regola.
-            rule (object): La regola da inserire nella struttura dati.
-            """
-            current = self.root
-            i = 0
-            while i < len(key):
-                char = key[i]
-                if char in current.children:
-                    current = current.children[char]
-                else:
-                    new_node = RadixTreeNode()
-                    current.children[char] = new_node
-                    current = new_node
-                i += 1
+        """
+        Inserisce una regola nella Radix Tree, utilizzando 'key' come prefisso.
+        Consente regole duplicate solo se l'ID della regola è diverso.
+
+        Argomenti:
+        ----------
+        key (str): Il prefisso CIDR (o 'any') da utilizzare per l'inserimento della regola.
+        rule (object): La regola da inserire nella struttura dati.
+        """
+        for version, value, length in parse_prefix(key):
+            node = self._find_or_create(version, value, length)
 
             # Verifica duplicati basati sull'ID della regola
-            for existing_rule in current.rules:
-                if getattr(existing_rule, 'rule_id', None) == getattr(rule, 'rule_id', None):
-                    logging.info(f"Regola con ID {rule.id} già presente per il prefisso {key}. Ignorata.")
-                    return
+            rule_id = getattr(rule, 'rule_id', None)
+            if any(getattr(existing, 'rule_id', None) == rule_id for existing in node.rules):
+                logging.debug("Regola con ID %s già presente per il prefisso %s. Ignorata.", rule_id, key)
+                continue
 
-            # Aggiunge la regola se non ci sono duplicati con lo stesso ID
-            current.rules.append(rule)
-            logging.info(f"Regola aggiunta per il prefisso {key}: {rule}")
+            node.rules.append(rule)
+            self.size += 1
+            logging.debug("Regola aggiunta per il prefisso %s (IPv%s): %s", key, version, rule)
 
-    def search(self, key: str) -> list:
+    def _find_or_create(self, version, value, length):
         """
-        Cerca tutte le regole che corrispondono al prefisso specificato.
-        Restituisce regole con wildcard 'any' se non trova corrispondenze esatte.
+        Restituisce il nodo associato esattamente al prefisso (value, length), creandolo se necessario.
+        Quando il nuovo prefisso diverge da un ramo esistente viene inserito un nodo intermedio
+        ("glue") sul primo bit di differenza, mantenendo l'albero compresso.
 
         Argomenti:
         ----------
-        key (str): Il prefisso da cercare nel Radix Tree.
+        version (int): Famiglia IP (4 o 6).
+        value (int): Prefisso intero già mascherato.
+        length (int): Lunghezza del prefisso in bit.
 
         Restituisce:
         -----------
-        list: Una lista delle regole che corrispondono al prefisso.
-              Includendo anche le regole con wildcard ('any') se non trovate corrispondenze esatte.
+        RadixTreeNode: Il nodo del prefisso.
         """
-        logging.debug(f"Inizio ricerca per il prefisso: {key}")
-        current = self.root
-        i = 0
+        width = ADDRESS_WIDTH[version]
+        node = self.roots[version]
+
+        while node.length != length:
+            bit = (value >> (width - node.length - 1)) & 1
+            child = node.children[bit]
+            if child is None:
+                child = RadixTreeNode(value, length)
+                node.children[bit] = child
+                return child
+
+            # Numero di bit iniziali comuni tra il nuovo prefisso e il figlio
+            max_common = min(length, child.length)
+            diff = (value ^ child.prefix) >> (width - max_common)
+            if diff == 0:
+                if child.length <= length:
+                    node = child
+                    continue
+                # Il nuovo prefisso contiene quello del figlio: si inserisce tra i due
+                new_node = RadixTreeNode(value, length)
+                new_node.children[(child.prefix >> (width - length - 1)) & 1] = child
+                node.children[bit] = new_node
+                return new_node
+
+            common = max_common - diff.bit_length()
+            glue = RadixTreeNode(value & (((1 << common) - 1) << (width - common)), common)
+            new_node = RadixTreeNode(value, length)
+            new_bit = (value >> (width - common - 1)) & 1
+            glue.children[new_bit] = new_node
+            glue.children[1 - new_bit] = child
+            node.children[bit] = glue
+            return new_node
+
+        return node
 
-        # Navigazione nel Radix Tree
-        while i < len(key):
-            char = key[i]
-            if char not in current.children:
-                logging.debug(f"Nodo non trovato per il prefisso {key[:i+1]}. Verifica wildcard.")
-                # Se non esiste una corrispondenza esatta, cerca regole con 'any'
-                wildcard_rules = self._collect_rules_with_wildcards(self.root)
-                logging.debug(f"Regole con wildcard trovate: {wildcard_rules}")
-                return wildcard_rules
-            current = current.children[char]
-            i += 1
+    def search(self, key: str) -> list:
+        """
+        Cerca tutte le regole i cui prefissi contengono l'indirizzo specificato.
 
-        # Ritorna le regole del nodo finale, includendo quelle con 'any'
-        logging.debug(f"Regole trovate per il prefisso {key}: {current.rules}")
-        return current.rules + self._collect_rules_with_wildcards(self.root)
+        Argomenti:
+        ----------
+        key (str): L'indirizzo IP (IPv4 o IPv6) da cercare nel Radix Tree.
 
-    def _collect_rules_with_wildcards(self, node) -> list:
+        Restituisce:
+        -----------
+        list: Le regole di tutti i prefissi che contengono l'indirizzo, incluse quelle
+              con wildcard ('any', cioè /0), ordinate dal prefisso meno specifico al più specifico.
+              Lista vuota se l'indirizzo non è valido.
+        """
+        try:
+            version, address = parse_address(key)
+        except ValueError as e:
+            logging.debug("Ricerca ignorata: %s", e)
+            return []
+        return self.search_int(version, address)
+
+    def search_int(self, version: int, address: int) -> list:
         """
-        Raccoglie tutte le regole con wildcard ('any') nel Radix Tree.
+        Cerca tutte le regole i cui prefissi contengono l'indirizzo intero specificato.
 
         Argomenti:
         ----------
-        node (RadixTreeNode): Il nodo corrente da esplorare.
+        version (int): Famiglia IP (4 o 6).
+        address (int): Indirizzo IP come intero.
 
         Restituisce:
         -----------
-        list: Una lista di regole che contengono la wildcard ('any').
+        list: Le regole di tutti i prefissi che contengono l'indirizzo.
         """
-        rules_with_wildcards = []
-        if node.rules:
-            for rule in node.rules:
-                # Aggiungi regole con wildcard 'any'
-                if self._is_wildcard_rule(rule):
-                    rules_with_wildcards.append(rule)
-        for child in node.children.values():
-            rules_with_wildcards.extend(self._collect_rules_with_wildcards(child))
-        return rules_with_wildcards
-
-    def _is_wildcard_rule(self, rule) -> bool:
+        width = ADDRESS_WIDTH[version]
+        node = self.roots[version]
+        matches = []
+        while node is not None:
+            if (address ^ node.prefix) >> (width - node.length):
+                break
+            if node.rules:
+                matches.extend(node.rules)
+            if node.length == width:
+                break
+            node = node.children[(address >> (width - node.length - 1)) & 1]
+        return matches
+
+    def longest_match(self, key: str) -> list:
         """
-        Verifica se una regola contiene wildcard ('any').
+        Restituisce le regole associate al prefisso più specifico che contiene l'indirizzo.
 
         Argomenti:
         ----------
-        rule (object): La regola da verificare.
+        key (str): L'indirizzo IP da cercare.
 
         Restituisce:
         -----------
-        bool: True se la regola contiene una wildcard ('any'), False altrimenti.
+        list: Le regole del prefisso più lungo che contiene l'indirizzo, o una lista vuota.
         """
-        return (
-            getattr(rule, 'src_ip', None) == 'any' or
-            getattr(rule, 'dst_ip', None) == 'any' or
-            getattr(rule, 'src_port', None) == 'any' or
-            getattr(rule, 'dst_port', None) == 'any'
-        )
+        try:
+            version, address = parse_address(key)
+        except ValueError:
+            return []
+
+        width = ADDRESS_WIDTH[version]
+        node = self.roots[version]
+        best = []
+        while node is not None:
+            if (address ^ node.prefix) >> (width - node.length):
+                break
+            if node.rules:
+                best = node.rules
+            if node.length == width:
+                break
+            node = node.children[(address >> (width - node.length - 1)) & 1]
+        return list(best)
 
     def remove_rule(self, key: str, rule: object) -> bool:
         """
         Rimuove una regola associata a un prefisso specifico.
+        I nodi rimasti senza regole vengono potati quando non servono più come diramazione.
 
         Argomenti:
         ----------
@@ -176,18 +302,50 @@ class RadixTree:
         -----------
         bool: True se la regola è stata rimossa, False se non è stata trovata.
         """
-        current = self.root
-        i = 0
-        while i < len(key):
-            char = key[i]
-            if char not in current.children:
-                return False  # Non esiste il nodo per il prefisso
-            current = current.children[char]
-            i += 1
-        if rule in current.rules:
-            current.rules.remove(rule)
-            return True
-        return False
+        try:
+            prefixes = parse_prefix(key)
+        except ValueError:
+            return False
+
+        removed = False
+        for version, value, length in prefixes:
+            width = ADDRESS_WIDTH[version]
+            node = self.roots[version]
+            path = []  # Coppie (genitore, bit) per la potatura
+            while node is not None and node.length < length:
+                bit = (value >> (width - node.length - 1)) & 1
+                path.append((node, bit))
+                node = node.children[bit]
+            if node is None or node.length != length or node.prefix != value:
+                continue
+            if rule not in node.rules:
+                continue
+
+            node.rules.remove(rule)
+            self.size -= 1
+            removed = True
+            self._prune(node, path)
+        return removed
+
+    @staticmethod
+    def _prune(node, path):
+        """
+        Elimina un nodo senza regole se è una foglia, oppure lo sostituisce con il suo unico figlio.
+
+        Argomenti:
+        ----------
+        node (RadixTreeNode): Il nodo da cui è stata appena rimossa una regola.
+        path (list): Percorso (genitore, bit) dalla radice al nodo.
+        """
+        while path and not node.rules:
+            parent, bit = path.pop()
+            children = [child for child in node.children if child is not None]
+            if len(children) > 1:
+                return
+            parent.children[bit] = children[0] if children else None
+            if children or parent.length == 0:
+                return
+            node = parent
 
     def display(self, node=None, prefix=""):
         """
@@ -195,12 +353,18 @@ class RadixTree:
 
         Argomenti:
         ----------
-        node (RadixTreeNode, opzionale): Nodo da cui partire la visualizzazione. Se non fornito, si parte dalla radice.
-        prefix (str, opzionale): Prefisso corrente durante la traversata dell'albero. Default è una stringa vuota.
+        node (RadixTreeNode, opzionale): Nodo da cui partire la visualizzazione. Se non fornito, si parte dalle radici.
+        prefix (str, opzionale): Famiglia IP del nodo ("IPv4" o "IPv6"). Default è una stringa vuota.
         """
         if node is None:
-            node = self.root
+            for version, root in self.roots.items():
+                self.display(root, f"IPv{version}")
+            return
         if node.rules:
-            print(f"Prefisso: {prefix}, Regole: {node.rules}")
-        for char, child in node.children.items():
-            self.display(child, prefix + char)
+            width = ADDRESS_WIDTH[6 if prefix == "IPv6" else 4]
+            family = socket.AF_INET6 if width == 128 else socket.AF_INET
+            address = socket.inet_ntop(family, node.prefix.to_bytes(width // 8, "big"))
+            print(f"Prefisso: {address}/{node.length}, Regole: {node.rules}")
+        for child in node.children:
+            if child is not None:
+                self.display(child, prefix)
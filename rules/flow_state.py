@@ -0,0 +1,29 @@
+# Bit dello stato di un flusso (combinabili in una maschera, come le direzioni delle regole)
+FLOW_NEW = 1          # Visto un solo verso o handshake TCP non completato
+FLOW_ESTABLISHED = 2  # Traffico in entrambi i versi / handshake TCP completato
+FLOW_CLOSING = 4      # FIN TCP visto in un solo verso
+FLOW_CLOSED = 8       # FIN in entrambi i versi o RST
+
+FLOW_STATES = {
+    "new": FLOW_NEW,
+    "established": FLOW_ESTABLISHED,
+    "closing": FLOW_CLOSING,
+    "closed": FLOW_CLOSED,
+}
+FLOW_STATE_NAMES = {bit: name for name, bit in FLOW_STATES.items()}
+
+
+def flow_key(packet):
+    """
+    Chiave simmetrica della 5-tupla: i due versi di una connessione producono la stessa chiave.
+    Usata sia dai threshold "by_flow" sia dalla tabella dei flussi.
+
+    :param packet: Il pacchetto (PacketMeta).
+    :return: Tupla (versione e protocollo, IP minore, porta, IP maggiore, porta).
+    """
+    src, dst = packet.src_int, packet.dst_int
+    sport, dport = packet.src_port or 0, packet.dst_port or 0
+    kind = packet.version << 8 | packet.protocol
+    if src < dst or (src == dst and sport <= dport):
+        return (kind, src, sport, dst, dport)
+    return (kind, dst, dport, src, sport)
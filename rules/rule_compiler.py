@@ -0,0 +1,294 @@
+import logging
+
+from rules.flow_state import FLOW_STATES, flow_key
+from rules.rule_manager import ProtocolRuleIndex
+
+
+# Bit della direzione di un pacchetto rispetto a HOME_NET / EXTERNAL_NET
+DIRECTION_IN = 1   # Da EXTERNAL_NET verso HOME_NET
+DIRECTION_OUT = 2  # Da HOME_NET verso EXTERNAL_NET
+
+DIRECTION_MASKS = {
+    "in": DIRECTION_IN,
+    "out": DIRECTION_OUT,
+    "both": DIRECTION_IN | DIRECTION_OUT,
+}
+
+# Bit dei flag TCP, nello stesso ordine del campo flags dell'header
+TCP_FLAG_BITS = {
+    "F": 0x01,
+    "S": 0x02,
+    "R": 0x04,
+    "P": 0x08,
+    "A": 0x10,
+    "U": 0x20,
+    "E": 0x40,
+    "C": 0x80,
+}
+
+# Protocolli i cui pacchetti hanno porte sorgente/destinazione
+PORT_PROTOCOLS = ("TCP", "UDP")
+
+# Chiavi dei contatori di threshold ("track" del threshold, come track by_src di Snort)
+TRACK_KEYS = {
+    "by_src": lambda packet: packet.src,
+    "by_dst": lambda packet: packet.dst,
+    "by_src_dst": lambda packet: (packet.src, packet.dst),
+    "by_src_dst_port": lambda packet: (packet.src, packet.dst, packet.dst_port),
+    "by_flow": flow_key,
+}
+DEFAULT_TRACK = "by_src"
+
+
+def compile_flags(flags):
+    """
+    Converte i flag TCP di una regola (es. "S", ["S", "A"]) in una maschera di bit.
+
+    :param flags: Stringa o lista di flag TCP.
+    :return: Maschera intera (0 se la regola non richiede flag).
+    :raises ValueError: Se un flag non è riconosciuto.
+    """
+    mask = 0
+    for flag in "".join(flags or []):
+        try:
+            mask |= TCP_FLAG_BITS[flag.upper()]
+        except KeyError:
+            raise ValueError(f"Flag TCP non riconosciuto: {flag}")
+    return mask
+
+
+def compile_track(threshold):
+    """
+    Restituisce la chiave di tracciamento del threshold di una regola.
+
+    :param threshold: Dizionario del threshold (chiave opzionale "track", default "by_src").
+    :return: Nome della chiave, una di TRACK_KEYS.
+    :raises ValueError: Se la chiave non è riconosciuta.
+    """
+    track = threshold.get("track", DEFAULT_TRACK)
+    if track not in TRACK_KEYS:
+        raise ValueError(f"Chiave di tracciamento del threshold non riconosciuta: {track}")
+    return track
+
+
+def compile_flow_state(flow_state):
+    """
+    Converte gli stati del flusso di una regola (es. "established", ["new", "closing"]) in una maschera di bit.
+
+    :param flow_state: Stringa o lista di stati (vuota per tutti gli stati).
+    :return: Maschera intera degli stati ammessi.
+    :raises ValueError: Se uno stato non è riconosciuto.
+    """
+    states = [flow_state] if isinstance(flow_state, str) else flow_state or []
+    if not states:
+        return sum(FLOW_STATES.values())
+    mask = 0
+    for state in states:
+        try:
+            mask |= FLOW_STATES[state.lower()]
+        except KeyError:
+            raise ValueError(f"Stato del flusso non riconosciuto: {state}")
+    return mask
+
+
+def compile_port(port):
+    """
+    Normalizza una porta di una regola: None per "any", altrimenti un intero.
+
+    :param port: Porta (int, stringa numerica o "any").
+    :return: Porta intera o None.
+    :raises ValueError: Se la porta non è valida.
+    """
+    if port is None or port == "any":
+        return None
+    port = int(port)
+    if not 0 <= port <= 65535:
+        raise ValueError(f"Porta non valida: {port}")
+    return port
+
+
+class CompiledRule:
+    """
+    Forma precompilata di una Rule: tutti i confronti con "any", i flag e la direzione
+    sono risolti una sola volta in fase di compilazione.
+
+    Attributi:
+        rule (Rule): La regola originale (per azione, descrizione e threshold).
+        rule_id (str): Identificativo della regola.
+        src_ip (str): Prefisso sorgente della regola (o "any").
+        dst_ip (str): Prefisso di destinazione della regola (o "any").
+        src_port (int|None): Porta sorgente richiesta, None per "any".
+        dst_port (int|None): Porta di destinazione richiesta, None per "any".
+        flags_mask (int): Maschera dei flag TCP che devono essere tutti presenti.
+        direction_mask (int): Direzioni ammesse (DIRECTION_IN, DIRECTION_OUT).
+        any_src (bool): True se la regola non filtra per IP sorgente.
+        track (str): Chiave dei contatori del threshold (una di TRACK_KEYS).
+        flow_mask (int): Stati del flusso ammessi (FLOW_NEW, FLOW_ESTABLISHED, ...).
+    """
+
+    __slots__ = ("rule", "rule_id", "src_ip", "dst_ip", "src_port", "dst_port",
+                 "flags_mask", "direction_mask", "any_src", "track", "flow_mask")
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.rule_id = rule.rule_id
+        self.src_ip = rule.src_ip
+        self.dst_ip = rule.dst_ip
+        self.src_port = compile_port(rule.src_port)
+        self.dst_port = compile_port(rule.dst_port)
+        self.flags_mask = compile_flags(rule.flags)
+        self.direction_mask = DIRECTION_MASKS.get(rule.direction, 0)
+        self.any_src = rule.src_ip == "any"
+        self.track = compile_track(rule.threshold)
+        self.flow_mask = compile_flow_state(getattr(rule, "flow_state", None))
+        if not self.direction_mask:
+            logging.warning(f"Direzione non riconosciuta per la regola {rule.rule_id}: {rule.direction}")
+
+    def __repr__(self):
+        return f"CompiledRule({self.rule!r})"
+
+
+class CompiledRuleSet:
+    """
+    Struttura di decisione prodotta da RuleCompiler.
+
+    Le regole sono distribuite in tabelle hash annidate protocollo -> dst_port -> src_port
+    (None rappresenta "any"); ogni cella è un ProtocolRuleIndex che filtra per prefissi CIDR
+    sorgente/destinazione. Un pacchetto richiede al più quattro accessi alle tabelle
+    (porta esatta e "any" per ciascun campo) più il controllo residuo dei flag TCP,
+    indipendentemente dal numero totale di regole.
+
+    Attributi:
+        tables (dict): Tabelle di dispatch per protocollo.
+        rules (list): Regole compilate, nell'ordine del file di configurazione.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.rules = []
+
+    def __len__(self):
+        return len(self.rules)
+
+    def add(self, compiled_rule):
+        """
+        Inserisce una regola compilata nella cella corrispondente a protocollo e porte.
+
+        :param compiled_rule: CompiledRule da inserire.
+        :raises ValueError: Se i prefissi IP della regola non sono validi.
+        """
+        by_dst_port = self.tables.setdefault(compiled_rule.rule.protocol, {})
+        by_src_port = by_dst_port.setdefault(compiled_rule.dst_port, {})
+        index = by_src_port.get(compiled_rule.src_port)
+        if index is None:
+            index = by_src_port[compiled_rule.src_port] = ProtocolRuleIndex()
+        index.add(compiled_rule, compiled_rule.src_ip, compiled_rule.dst_ip)
+        self.rules.append(compiled_rule)
+
+    def match(self, protocol, src_ip, dst_ip, src_port=None, dst_port=None, tcp_flags=None):
+        """
+        Restituisce le regole compatibili con i campi statici del pacchetto
+        (protocollo, porte, prefissi IP e flag TCP).
+
+        :param protocol: Nome del protocollo del pacchetto (es. "TCP").
+        :param src_ip: Indirizzo IP sorgente.
+        :param dst_ip: Indirizzo IP di destinazione.
+        :param src_port: Porta sorgente (None se il protocollo non ha porte).
+        :param dst_port: Porta di destinazione (None se il protocollo non ha porte).
+        :param tcp_flags: Flag TCP come intero (None se il pacchetto non è TCP).
+        :return: Lista di CompiledRule candidate; restano da verificare direzione e threshold.
+        """
+        by_dst_port = self.tables.get(protocol)
+        if by_dst_port is None:
+            return []
+
+        candidates = []
+        for index in self._port_cells(by_dst_port, src_port, dst_port):
+            candidates.extend(index.match(src_ip, dst_ip))
+        return self.filter_flags(candidates, tcp_flags)
+
+    def match_packet(self, protocol, packet):
+        """
+        Come match, ma usa direttamente i campi di un PacketMeta (indirizzi già interi).
+
+        :param protocol: Nome del protocollo del pacchetto (es. "TCP").
+        :param packet: PacketMeta del pacchetto.
+        :return: Lista di CompiledRule candidate.
+        """
+        return self.filter_flags(self.match_tuple(protocol, packet), packet.tcp_flags)
+
+    def match_tuple(self, protocol, packet):
+        """
+        Restituisce le regole compatibili con la 5-tupla del pacchetto, senza il filtro dei
+        flag TCP: il risultato è lo stesso per tutti i pacchetti dello stesso verso di un
+        flusso e può essere riutilizzato.
+
+        :param protocol: Nome del protocollo del pacchetto (es. "TCP").
+        :param packet: PacketMeta del pacchetto.
+        :return: Lista di CompiledRule candidate (resta da applicare filter_flags).
+        """
+        by_dst_port = self.tables.get(protocol)
+        if by_dst_port is None:
+            return []
+
+        candidates = []
+        for index in self._port_cells(by_dst_port, packet.src_port, packet.dst_port):
+            candidates.extend(index.match_int(packet.version, packet.src_int, packet.dst_int))
+        return candidates
+
+    @staticmethod
+    def _port_cells(by_dst_port, src_port, dst_port):
+        """
+        Restituisce le celle (ProtocolRuleIndex) compatibili con le porte del pacchetto.
+        """
+        cells = []
+        for dport in ((dst_port, None) if dst_port is not None else (None,)):
+            by_src_port = by_dst_port.get(dport)
+            if by_src_port is None:
+                continue
+            for sport in ((src_port, None) if src_port is not None else (None,)):
+                index = by_src_port.get(sport)
+                if index is not None:
+                    cells.append(index)
+        return cells
+
+    @staticmethod
+    def filter_flags(candidates, tcp_flags):
+        """
+        Scarta le regole i cui flag TCP richiesti non sono tutti presenti nel pacchetto.
+        """
+        if tcp_flags is None:
+            return [rule for rule in candidates if not rule.flags_mask]
+        return [rule for rule in candidates if tcp_flags & rule.flags_mask == rule.flags_mask]
+
+
+class RuleCompiler:
+    """
+    Compila le Rule prodotte da RuleParser.parse in un CompiledRuleSet.
+    """
+
+    def compile(self, rules):
+        """
+        Compila una lista di regole. Le regole non valide vengono scartate con un errore nel log.
+
+        :param rules: Iterabile di Rule.
+        :return: CompiledRuleSet pronto per la ricerca.
+        """
+        ruleset = CompiledRuleSet()
+        seen_ids = set()
+        for rule in rules:
+            if rule.rule_id in seen_ids:
+                logging.warning(f"Regola con ID {rule.rule_id} duplicata. Ignorata.")
+                continue
+            try:
+                compiled_rule = CompiledRule(rule)
+                if rule.protocol not in PORT_PROTOCOLS and (compiled_rule.src_port is not None or compiled_rule.dst_port is not None):
+                    logging.warning(f"La regola {rule.rule_id} specifica porte per il protocollo {rule.protocol}: non potrà mai corrispondere.")
+                ruleset.add(compiled_rule)
+            except (ValueError, TypeError) as e:
+                logging.error(f"Impossibile compilare la regola {rule.rule_id}: {e}")
+                continue
+            seen_ids.add(rule.rule_id)
+
+        logging.info(f"Compilate {len(ruleset)} regole.")
+        return ruleset
@@ -2,17 +2,128 @@ import json
 import logging
 from radixTree.radix_tree import RadixTree
 
+class ProtocolRuleIndex:
+    """
+    Indice delle regole di un singolo protocollo.
+
+    Le regole con src_ip e dst_ip entrambi "any" sono mantenute in un bucket di wildcard
+    calcolato una sola volta in fase di inserimento/rimozione, così la ricerca le restituisce
+    senza visitare alcun albero. Le altre regole sono indicizzate nel RadixTree del campo
+    (src e/o dst) in cui specificano un prefisso CIDR.
+
+    Attributi:
+        src_tree (RadixTree): Regole con src_ip specifico, indicizzate per prefisso sorgente.
+        dst_tree (RadixTree): Regole con dst_ip specifico, indicizzate per prefisso di destinazione.
+        wildcard_rules (tuple): Regole con src_ip e dst_ip "any".
+        dst_only_rules (tuple): Regole con src_ip "any" e dst_ip specifico.
+    """
+
+    def __init__(self):
+        self.src_tree = RadixTree()
+        self.dst_tree = RadixTree()
+        self.wildcard_rules = ()
+        self.dst_only_rules = ()
+
+    def add(self, rule, src_prefix="any", dst_prefix="any"):
+        """
+        Indicizza una regola nel bucket di wildcard o nei RadixTree dei campi specifici.
+        :raises ValueError: Se uno dei prefissi non è valido.
+        """
+        if src_prefix == "any" and dst_prefix == "any":
+            if all(existing.rule_id != rule.rule_id for existing in self.wildcard_rules):
+                self.wildcard_rules = self.wildcard_rules + (rule,)
+            return
+
+        if src_prefix != "any":
+            self.src_tree.insert(src_prefix, rule)
+        if dst_prefix != "any":
+            try:
+                self.dst_tree.insert(dst_prefix, rule)
+            except ValueError:
+                # Evita che una regola resti indicizzata solo per sorgente
+                self.src_tree.remove_rule(src_prefix, rule)
+                raise
+            if src_prefix == "any":
+                self.dst_only_rules = self.dst_only_rules + (rule,)
+
+    def remove(self, rule, src_prefix="any", dst_prefix="any"):
+        """
+        Rimuove una regola dall'indice.
+        :return: True se la regola è stata rimossa, False altrimenti.
+        """
+        if src_prefix == "any" and dst_prefix == "any":
+            remaining = tuple(existing for existing in self.wildcard_rules if existing is not rule)
+            removed = len(remaining) != len(self.wildcard_rules)
+            self.wildcard_rules = remaining
+            return removed
+
+        removed = False
+        if src_prefix != "any":
+            removed = self.src_tree.remove_rule(src_prefix, rule)
+        if dst_prefix != "any":
+            removed = self.dst_tree.remove_rule(dst_prefix, rule) or removed
+            self.dst_only_rules = tuple(existing for existing in self.dst_only_rules if existing is not rule)
+        return removed
+
+    def match(self, src_ip, dst_ip=None):
+        """
+        Restituisce le regole candidate per la coppia di indirizzi.
+        I RadixTree vuoti non vengono interrogati, per cui un insieme di sole regole
+        wildcard costa una singola lettura del bucket.
+        :param src_ip: Indirizzo IP sorgente.
+        :param dst_ip: Indirizzo IP di destinazione (opzionale: se assente il prefisso di destinazione non viene verificato).
+        :return: Lista delle regole candidate.
+        """
+        src_hits = self.src_tree.search(src_ip) if self.src_tree.size else ()
+        if dst_ip is None:
+            return list(self.wildcard_rules) + list(src_hits) + list(self.dst_only_rules)
+
+        dst_hits = self.dst_tree.search(dst_ip) if self.dst_tree.size else ()
+        return self._combine(src_hits, dst_hits)
+
+    def match_int(self, version, src_int, dst_int):
+        """
+        Come match, ma su indirizzi già convertiti in interi (es. dal decoder dei pacchetti).
+        :param version: Versione IP (4 o 6).
+        :param src_int: Indirizzo IP sorgente come intero.
+        :param dst_int: Indirizzo IP di destinazione come intero.
+        :return: Lista delle regole candidate.
+        """
+        src_hits = self.src_tree.search_int(version, src_int) if self.src_tree.size else ()
+        dst_hits = self.dst_tree.search_int(version, dst_int) if self.dst_tree.size else ()
+        return self._combine(src_hits, dst_hits)
+
+    def _combine(self, src_hits, dst_hits):
+        """
+        Unisce bucket di wildcard e risultati dei RadixTree, scartando le regole
+        che specificano entrambi i prefissi ma ne soddisfano solo uno.
+        """
+        if not src_hits and not dst_hits:
+            return list(self.wildcard_rules)
+
+        matches = list(self.wildcard_rules)
+        dst_ids = {id(rule) for rule in dst_hits}
+        for rule in src_hits:
+            if rule.dst_ip == "any" or id(rule) in dst_ids:
+                matches.append(rule)
+        for rule in dst_hits:
+            if rule.src_ip == "any":
+                matches.append(rule)
+        return matches
+
+
 class RuleManager:
     def __init__(self, protocol_config_file):
         """
         Inizializza il RuleManager e carica i protocolli da un file di configurazione.
         :param protocol_config_file: Percorso al file di configurazione dei protocolli.
         """
-        self.protocol_rules = {}  # Dizionario che conterrà un RadixTree per ogni protocollo
+        self.protocol_rules = {}  # Dizionario che conterrà un ProtocolRuleIndex per ogni protocollo
+        self.rules = {}  # Regole aggiunte, indicizzate per rule_id
         self.load_protocols(protocol_config_file)
 
     def load_protocols(self, protocol_config_file):
-        logging.info("Sto per caricare i protocolli : ")
+        logging.debug(f"Caricamento dei protocolli da {protocol_config_file}")
         try:
             with open(protocol_config_file, "r") as f:
                 data = json.load(f)
@@ -20,8 +131,8 @@ class RuleManager:
                 logging.debug(f"Protocollo trovati nel file di configurazione: {protocols}")
 
                 for protocol in protocols:
-                    self.protocol_rules[protocol] = RadixTree()
-                    logging.info(f"Protocollo {protocol} aggiunto con RadixTree.")
+                    self.protocol_rules[protocol] = ProtocolRuleIndex()
+                    logging.debug(f"Protocollo {protocol} aggiunto con ProtocolRuleIndex.")
 
         except FileNotFoundError:
             logging.error(f"File di configurazione {protocol_config_file} non trovato.")
@@ -31,44 +142,72 @@ class RuleManager:
             logging.error(f"Errore imprevisto durante il caricamento dei protocolli: {e}")
 
 
-    def add_rule(self, protocol, ip_prefix, rule):
+    def add_rule(self, protocol, ip_prefix, rule, dst_prefix="any"):
         """
-        Aggiunge una regola al RadixTree del protocollo specificato se non esiste già (basato su ID regola).
+        Aggiunge una regola all'indice del protocollo specificato se non esiste già (basato su ID regola).
+        Le regole senza prefissi specifici finiscono nel bucket di wildcard del protocollo.
         :param protocol: Nome del protocollo (es. TCP, UDP).
-        :param ip_prefix: Prefisso IP associato alla regola.
+        :param ip_prefix: Prefisso CIDR sorgente associato alla regola (o "any").
         :param rule: Oggetto regola.
+        :param dst_prefix: Prefisso CIDR di destinazione associato alla regola (default "any").
+        :return: True se la regola è stata aggiunta, False se è stata scartata (prefisso non valido
+                 o protocollo non supportato).
         """
-        if protocol in self.protocol_rules:
-            # Cerca esistente nella Radix Tree del protocollo per verificare duplicati
-            existing_rule = self.protocol_rules[protocol].search(ip_prefix)
-            # Se esiste almeno una regola con lo stesso prefisso, procedi ad aggiungere
-            if existing_rule:
-                logging.debug(f"Regola già presente per {protocol} e IP {ip_prefix}. Verifica ID regola.")
-            # Aggiungi la regola usando il metodo insert
-            self.protocol_rules[protocol].insert(ip_prefix, rule)
-            logging.debug(f"Regola aggiunta al protocollo {protocol}: {rule}")
-        else:
-            logging.warning(f"Protocollo {protocol} non supportato.")
+        if protocol not in self.protocol_rules:
+            logging.warning(f"Protocollo {protocol} non supportato. Regola {rule.rule_id} ignorata.")
+            return False
+        try:
+            self.protocol_rules[protocol].add(rule, ip_prefix, dst_prefix)
+        except ValueError as e:
+            logging.error(f"Regola {rule} ignorata: {e}")
+            return False
+        self.rules.setdefault(rule.rule_id, rule)
+        logging.debug(f"Regola aggiunta al protocollo {protocol}: {rule}")
+        return True
 
-    def get_matching_rules(self, protocol, ip):
-        # Verifica se il protocollo è presente nelle regole
-        if protocol in self.protocol_rules:
-            # Verifica se la struttura è un'istanza di RadixTree
-            if isinstance(self.protocol_rules[protocol], RadixTree):
-                # Cerca le regole utilizzando il metodo search
-                rules = self.protocol_rules[protocol].search(ip)
-                if rules is None:
-                    logging.debug(f"Nessuna regola trovata per protocollo {protocol} e IP {ip}.")
-                else:
-                    logging.debug(f"Regole trovate per protocollo {protocol} e IP {ip}: {rules}")
-                return rules or []  # Restituisce una lista vuota se non ci sono regole
-            else:
-                logging.error(f"La struttura per il protocollo {protocol} non è un'istanza di RadixTree.")
-                return []
-        else:
-            logging.warning(f"Protocollo {protocol} non supportato.")
-            return []
+    def remove_rule(self, protocol, ip_prefix, rule, dst_prefix="any"):
+        """
+        Rimuove una regola dall'indice del protocollo specificato.
+        :param protocol: Nome del protocollo.
+        :param ip_prefix: Prefisso CIDR sorgente con cui la regola è stata aggiunta.
+        :param rule: Oggetto regola da rimuovere.
+        :param dst_prefix: Prefisso CIDR di destinazione con cui la regola è stata aggiunta.
+        :return: True se la regola è stata rimossa, False altrimenti.
+        """
+        index = self.protocol_rules.get(protocol)
+        if index is None:
+            return False
+        removed = index.remove(rule, ip_prefix, dst_prefix)
+        if removed and self.rules.get(rule.rule_id) is rule:
+            del self.rules[rule.rule_id]
+        return removed
 
+    def get_all_rules(self):
+        """
+        Restituisce tutte le regole aggiunte, nell'ordine di inserimento.
+        :return: Lista delle regole.
+        """
+        return list(self.rules.values())
 
+    def get_matching_rules(self, protocol, ip, dst_ip=None):
+        """
+        Restituisce le regole del protocollo il cui prefisso sorgente contiene 'ip' e,
+        se specificato, il cui prefisso di destinazione contiene 'dst_ip'.
+        :param protocol: Nome del protocollo (es. TCP, UDP).
+        :param ip: Indirizzo IP sorgente del pacchetto.
+        :param dst_ip: Indirizzo IP di destinazione del pacchetto (opzionale).
+        :return: Lista delle regole candidate (vuota se nessuna corrisponde).
+        """
+        index = self.protocol_rules.get(protocol)
+        if index is None:
+            logging.warning(f"Protocollo {protocol} non supportato.")
+            return []
 
+        rules = index.match(ip, dst_ip)
 
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            if not rules:
+                logging.debug("Nessuna regola trovata per protocollo %s e IP %s -> %s.", protocol, ip, dst_ip)
+            else:
+                logging.debug("Regole trovate per protocollo %s e IP %s -> %s: %s", protocol, ip, dst_ip, rules)
+        return rules
@@ -14,11 +14,17 @@ class RuleParser:
         self.config_file = rules_config_file
         self.rule_manager = rule_manager
         self.rules = []
+        self.error = None  # Errore dell'ultimo parsing (None se il file è stato letto per intero)
 
     def parse(self):
         """
         Esegue il parsing del file di configurazione JSON e carica le regole nel RuleManager.
+
+        Returns:
+            list: Le regole caricate (disponibili anche in self.rules), pronte per RuleCompiler.
         """
+        self.rules = []
+        self.error = None
         try:
             with open(self.config_file, "r") as f:
                 data = json.load(f)
@@ -34,24 +40,34 @@ class RuleParser:
                     # Estrai flag e threshold, assegna valori di default se assenti
                     flags = rule_data.get("flags", [])
                     threshold = rule_data.get("threshold", {"count": 1, "time": 10})
+                    flow_state = rule_data.get("flow_state", [])
 
                     # Crea un oggetto Rule con il parametro direction, flags e threshold
-                    rule = Rule(
-                        rule_data["rule_id"],
-                        rule_data["protocol"],
-                        src_ip,
-                        dst_ip,
-                        src_port,
-                        dst_port,
-                        rule_data.get("action"),
-                        rule_data.get("description"),
-                        direction,  # Passa la direzione alla regola
-                        flags,      # Passa i flags alla regola
-                        threshold   # Passa il threshold alla regola
-                    )
+                    try:
+                        rule = Rule(
+                            rule_data["rule_id"],
+                            rule_data["protocol"],
+                            src_ip,
+                            dst_ip,
+                            src_port,
+                            dst_port,
+                            rule_data.get("action"),
+                            rule_data.get("description"),
+                            direction,  # Passa la direzione alla regola
+                            flags,      # Passa i flags alla regola
+                            threshold,  # Passa il threshold alla regola
+                            flow_state  # Stati del flusso in cui la regola si applica
+                        )
+                    except ValueError as e:
+                        logging.error(f"Regola {rule_data['rule_id']} ignorata: {e}")
+                        continue
 
-                    # Aggiungi la regola al RuleManager
-                    self.rule_manager.add_rule(rule.protocol, src_ip, rule)
+                    # Aggiungi la regola al RuleManager; quelle scartate non vengono nemmeno compilate
+                    if not self.rule_manager.add_rule(rule.protocol, src_ip, rule, dst_ip):
+                        continue
+                    self.rules.append(rule)
                     logging.debug(f"Regola caricata: {rule}")
         except Exception as e:
             logging.error(f"Errore nel parsing del file di configurazione: {e}")
+            self.error = e
+        return self.rules
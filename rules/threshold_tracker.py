@@ -0,0 +1,104 @@
+import logging
+from collections import OrderedDict
+
+
+class ThresholdTracker:
+    """
+    Contatori di frequenza per i threshold delle regole, indicizzati per (rule_id, chiave).
+
+    Ogni contatore è una finestra scorrevole approssimata con due bucket fissi della durata
+    della finestra: il conteggio stimato è quello del bucket corrente più la quota del
+    bucket precedente ancora coperta dalla finestra. L'aggiornamento costa O(1) e ogni
+    contatore occupa spazio costante, indipendentemente dal numero di pacchetti.
+
+    I contatori sono mantenuti in ordine LRU: quando si supera `max_entries` viene eliminato
+    quello usato meno di recente, e i contatori rimasti inattivi per più di due finestre
+    (quindi a zero) vengono eliminati dalla testa a ogni aggiornamento.
+
+    Attributi:
+        max_entries (int): Numero massimo di contatori mantenuti.
+        evictions (int): Contatori eliminati per superamento del limite.
+        expirations (int): Contatori eliminati per inattività.
+    """
+
+    def __init__(self, max_entries=100000):
+        """
+        Args:
+            max_entries (int): Numero massimo di contatori mantenuti.
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (rule_id, chiave) -> [inizio bucket, conteggio corrente, conteggio precedente, scadenza]
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def hit(self, rule_id, key, threshold, timestamp):
+        """
+        Registra un pacchetto per la regola e la chiave indicate e verifica il threshold.
+
+        Args:
+            rule_id (str): Identificativo della regola.
+            key: Chiave del contatore (es. l'IP sorgente).
+            threshold (dict): Threshold della regola, con "count" e "time" (secondi).
+            timestamp (float): Istante del pacchetto in secondi.
+
+        Returns:
+            bool: True se i pacchetti nella finestra superano "count".
+        """
+        window = threshold["time"]
+        entries = self.entries
+        entry_key = (rule_id, key)
+        entry = entries.get(entry_key)
+
+        if entry is None:
+            entry = [timestamp, 0, 0, 0.0]
+            entries[entry_key] = entry
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            entries.move_to_end(entry_key)
+            elapsed = timestamp - entry[0]
+            if elapsed >= window:
+                # Avanza di uno o più bucket: oltre due finestre il bucket precedente è vuoto
+                entry[2] = entry[1] if elapsed < 2 * window else 0
+                entry[1] = 0
+                entry[0] += (elapsed // window) * window if window > 0 else elapsed
+
+        entry[1] += 1
+        entry[3] = timestamp + 2 * window
+        self._expire(timestamp)
+
+        if window > 0:
+            weight = 1.0 - (timestamp - entry[0]) / window
+            estimate = entry[1] + entry[2] * max(weight, 0.0)
+        else:
+            estimate = entry[1]
+
+        if estimate > threshold["count"]:
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("Superato il threshold di %s pacchetti in %s secondi per %s.", threshold["count"], window, entry_key)
+            return True
+        return False
+
+    def _expire(self, timestamp):
+        """
+        Elimina dalla testa della coda LRU i contatori scaduti (al più qualche voce per chiamata).
+        """
+        entries = self.entries
+        for _ in range(4):
+            if not entries:
+                return
+            entry_key, entry = next(iter(entries.items()))
+            if entry[3] > timestamp:
+                return
+            del entries[entry_key]
+            self.expirations += 1
+
+    def clear(self):
+        """
+        Elimina tutti i contatori.
+        """
+        self.entries.clear()
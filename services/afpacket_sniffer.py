@@ -0,0 +1,248 @@
+import logging
+import mmap
+import select
+import socket
+import struct
+import time
+
+from services.bpf_filter import attach_filter, compile_filter, detach_filter
+from services.packet_decoder import LINKTYPE_ETHERNET, decode_frame
+from services.packet_sniffer import PacketSniffer
+
+
+# Costanti di <linux/if_packet.h> e <linux/if_ether.h>
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V2 = 1
+ETH_P_ALL = 0x0003
+
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+# struct tpacket_req e struct tpacket2_hdr
+_TPACKET_REQ = struct.Struct("IIII")
+_TPACKET2_HDR = struct.Struct("IIIHHIIHH4x")
+_TPACKET_STATS = struct.Struct("II")
+_STATUS = struct.Struct("I")
+
+
+class AFPacketSniffer(PacketSniffer):
+    """
+    Backend di cattura basato su un unico socket AF_PACKET di lunga durata.
+
+    Quando possibile il socket usa un ring PACKET_MMAP (TPACKET_V2) condiviso con il kernel,
+    da cui i frame vengono letti senza system call per pacchetto; altrimenti ripiega su
+    letture non bloccanti. In entrambi i casi i pacchetti vengono decodificati e consegnati
+    alla coda a lotti di al massimo `batch_size`.
+
+    Attributi:
+        batch_size (int): Numero massimo di pacchetti consegnati per lotto.
+        kernel_packets (int): Pacchetti ricevuti dal kernel (da PACKET_STATISTICS).
+        kernel_drops (int): Pacchetti scartati dal kernel per ring/buffer pieno.
+        use_ring (bool): True se il ring PACKET_MMAP è attivo.
+    """
+
+    def __init__(self, interface, packet_queue, batch_size=64, frame_size=2048, frame_count=4096, use_ring=True,
+                 socket_buffer=4 * 1024 * 1024):
+        """
+        Inizializza il backend AF_PACKET.
+
+        Args:
+            interface (str): L'interfaccia di rete da monitorare.
+            packet_queue (queue.Queue): La coda condivisa per i pacchetti catturati.
+            batch_size (int): Numero massimo di pacchetti per lotto.
+            frame_size (int): Dimensione di uno slot del ring (multiplo di 16).
+            frame_count (int): Numero di slot del ring.
+            use_ring (bool): Se False usa sempre le letture non bloccanti.
+            socket_buffer (int): Dimensione del buffer di ricezione del socket senza ring.
+        """
+        super().__init__(interface, packet_queue)
+        self.batch_size = batch_size
+        self.frame_size = frame_size
+        self.frame_count = frame_count
+        self.use_ring = use_ring
+        self.socket_buffer = socket_buffer
+        self.kernel_packets = 0
+        self.kernel_drops = 0
+        self.sock = None
+        self.ring = None
+        self._ring_index = 0
+        self._block_size = 0
+        self._frames_per_block = 0
+
+    def open(self):
+        """
+        Apre e collega il socket AF_PACKET e, se richiesto, configura il ring PACKET_MMAP.
+
+        Raises:
+            OSError: Se il socket non può essere creato (es. privilegi insufficienti o sistema non Linux).
+        """
+        if not hasattr(socket, "AF_PACKET"):
+            raise OSError("AF_PACKET non è disponibile su questo sistema.")
+
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        # Il filtro va collegato prima del bind, così nessun frame non filtrato entra nel ring
+        self._apply_filter()
+        self.sock.bind((self.interface, ETH_P_ALL))
+
+        if self.use_ring:
+            try:
+                self._setup_ring()
+            except OSError as e:
+                logging.warning(f"Ring PACKET_MMAP non disponibile ({e}), uso letture non bloccanti.")
+                self.use_ring = False
+        if not self.use_ring:
+            # Senza ring i frame restano nel buffer del socket: lo si ingrandisce per assorbire i picchi
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.socket_buffer)
+        self.sock.setblocking(False)
+
+    def _setup_ring(self):
+        """
+        Configura un ring TPACKET_V2 e lo mappa in memoria.
+        """
+        block_size = max(mmap.PAGESIZE, self.frame_size)
+        while block_size % self.frame_size:
+            block_size += mmap.PAGESIZE
+        frames_per_block = block_size // self.frame_size
+        block_count = max(1, self.frame_count // frames_per_block)
+        self.frame_count = block_count * frames_per_block
+
+        self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V2)
+        self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING,
+                             _TPACKET_REQ.pack(block_size, block_count, self.frame_size, self.frame_count))
+        self.ring = mmap.mmap(self.sock.fileno(), block_size * block_count,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self._block_size = block_size
+        self._frames_per_block = frames_per_block
+        logging.info(f"Ring PACKET_MMAP attivo: {self.frame_count} slot da {self.frame_size} byte.")
+
+    def set_filter(self, expression):
+        """
+        Imposta il filtro BPF; se il socket è già aperto il programma viene sostituito
+        direttamente, senza interrompere la cattura.
+
+        Args:
+            expression (str|None): Espressione pcap, oppure None per catturare tutto il traffico.
+        """
+        if expression == self.capture_filter:
+            return
+        self.capture_filter = expression
+        logging.info(f"Filtro di cattura aggiornato: {expression or 'nessuno'}")
+        if self.sock is not None:
+            self._apply_filter()
+
+    def _apply_filter(self):
+        """
+        Compila e collega al socket il filtro corrente. In caso di errore la cattura prosegue senza filtro.
+        """
+        if not self.capture_filter:
+            detach_filter(self.sock)
+            return
+        try:
+            attach_filter(self.sock, compile_filter(self.capture_filter, self.interface))
+        except OSError as e:
+            logging.warning(f"Impossibile applicare il filtro BPF '{self.capture_filter}': {e}. Cattura senza filtro.")
+            detach_filter(self.sock)
+
+    def close(self):
+        """
+        Rilascia il ring e chiude il socket.
+        """
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def start(self, stop_event):
+        """
+        Avvia la cattura sul socket AF_PACKET fino all'impostazione di `stop_event`.
+
+        Args:
+            stop_event (threading.Event): Evento che segnala la terminazione della cattura.
+        """
+        logging.debug(f"Avvio del packet sniffer AF_PACKET su {self.interface}...")
+        self.open()
+        read_batch = self._read_ring_batch if self.use_ring else self._read_socket_batch
+        next_stats = time.monotonic() + 1
+        try:
+            while not stop_event.is_set():
+                batch = read_batch()
+                if batch:
+                    self.enqueue_batch(batch)
+                else:
+                    select.select([self.sock], [], [], 0.1)
+
+                if time.monotonic() >= next_stats:
+                    self.update_kernel_stats()
+                    next_stats = time.monotonic() + 1
+        finally:
+            self.update_kernel_stats()
+            self.close()
+        logging.debug(f"Sniffer AF_PACKET terminato. Scartati dal kernel: {self.kernel_drops}")
+
+    def _read_ring_batch(self):
+        """
+        Legge dal ring tutti gli slot pronti (fino a `batch_size`) e li restituisce al kernel.
+
+        Returns:
+            list: PacketMeta dei frame IP letti.
+        """
+        ring = self.ring
+        batch = []
+        index = self._ring_index
+        for _ in range(self.batch_size):
+            offset = (index // self._frames_per_block) * self._block_size + (index % self._frames_per_block) * self.frame_size
+            status, _, snaplen, mac, _, sec, nsec, _, _ = _TPACKET2_HDR.unpack_from(ring, offset)
+            if not status & TP_STATUS_USER:
+                break
+            start = offset + mac
+            packet = decode_frame(ring[start:start + snaplen], sec + nsec * 1e-9, LINKTYPE_ETHERNET)
+            _STATUS.pack_into(ring, offset, TP_STATUS_KERNEL)
+            index = (index + 1) % self.frame_count
+            if packet is None:
+                self.non_ip_packets += 1
+            else:
+                batch.append(packet)
+        self._ring_index = index
+        return batch
+
+    def _read_socket_batch(self):
+        """
+        Legge dal socket fino a `batch_size` frame senza bloccare.
+
+        Returns:
+            list: PacketMeta dei frame IP letti.
+        """
+        batch = []
+        for _ in range(self.batch_size):
+            try:
+                frame = self.sock.recv(65535)
+            except (BlockingIOError, InterruptedError):
+                break
+            packet = decode_frame(frame, time.time(), LINKTYPE_ETHERNET)
+            if packet is None:
+                self.non_ip_packets += 1
+            else:
+                batch.append(packet)
+        return batch
+
+    def update_kernel_stats(self):
+        """
+        Aggiorna i contatori di pacchetti ricevuti e scartati dal kernel.
+        PACKET_STATISTICS azzera i contatori a ogni lettura, quindi i valori vengono accumulati.
+        """
+        if self.sock is None:
+            return
+        try:
+            packets, drops = _TPACKET_STATS.unpack(self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, _TPACKET_STATS.size))
+        except OSError as e:
+            logging.debug(f"Impossibile leggere PACKET_STATISTICS: {e}")
+            return
+        self.kernel_packets += packets
+        self.kernel_drops += drops
+        if drops:
+            logging.warning(f"Il kernel ha scartato {drops} pacchetti. Totale scartati dal kernel: {self.kernel_drops}")
@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+
+# Riepilogo delle occorrenze di una regola per una sorgente in una finestra di soppressione
+AlertSummary = namedtuple("AlertSummary", ["action", "rule_id", "description", "src", "count",
+                                           "first_seen", "last_seen"])
+
+
+class AlertAggregator:
+    """
+    Soppressione delle allerte ripetute per coppia (rule_id, sorgente).
+
+    La prima occorrenza di una coppia viene riportata subito e apre una finestra di
+    `window` secondi durante la quale le occorrenze successive vengono solo contate.
+    Alla chiusura della finestra, se ci sono state occorrenze soppresse, viene prodotto un
+    AlertSummary con il numero totale di occorrenze e l'intervallo in cui sono avvenute:
+    durante un flood una regola produce così una riga per sorgente e finestra invece di
+    una per pacchetto, senza perdere il conteggio.
+
+    Le finestre sono mantenute in un OrderedDict in ordine di apertura, quindi quelle
+    scadute sono sempre in testa e `expire` esamina solo quelle. Oltre `max_entries`
+    coppie la finestra più vecchia viene chiusa in anticipo.
+
+    Attributi:
+        window (float): Durata in secondi di una finestra di soppressione.
+        reported (int): Allerte riportate.
+        suppressed (int): Allerte soppresse (incluse nei riepiloghi).
+    """
+
+    def __init__(self, window=60.0, max_entries=100000):
+        """
+        Args:
+            window (float): Durata in secondi di una finestra di soppressione.
+            max_entries (int): Numero massimo di finestre aperte.
+        """
+        self.window = window
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (rule_id, src) -> [apertura, occorrenze, ultima occorrenza, evento]
+        self._lock = threading.Lock()
+        self._closed = []
+        self.reported = 0
+        self.suppressed = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def submit(self, event):
+        """
+        Registra un'occorrenza.
+
+        Args:
+            event (RuleEvent): L'evento prodotto da una regola.
+
+        Returns:
+            bool: True se l'evento va riportato, False se è stato soppresso.
+        """
+        key = (event.rule_id, event.src)
+        timestamp = event.timestamp
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and timestamp < entry[0] + self.window:
+                entry[1] += 1
+                entry[2] = timestamp
+                self.suppressed += 1
+                return False
+
+            if entry is not None:
+                # Finestra scaduta ma non ancora chiusa da expire
+                del self.entries[key]
+                self._close(entry)
+            self.entries[key] = [timestamp, 1, timestamp, event]
+            if len(self.entries) > self.max_entries:
+                _, oldest = self.entries.popitem(last=False)
+                self._close(oldest)
+            self.reported += 1
+            return True
+
+    def expire(self, now=None):
+        """
+        Chiude le finestre scadute.
+
+        Args:
+            now (float): Istante corrente (None per chiudere tutte le finestre).
+
+        Returns:
+            list: Gli AlertSummary delle finestre chiuse con occorrenze soppresse.
+        """
+        with self._lock:
+            entries = self.entries
+            while entries:
+                entry = next(iter(entries.values()))
+                if now is not None and entry[0] + self.window > now:
+                    break
+                entries.popitem(last=False)
+                self._close(entry)
+            summaries, self._closed = self._closed, []
+        return summaries
+
+    def _close(self, entry):
+        opened, count, last_seen, event = entry
+        if count > 1:
+            self._closed.append(AlertSummary(event.action, event.rule_id, event.description, event.src,
+                                             count, opened, last_seen))
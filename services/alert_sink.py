@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from queue import Empty, Full, Queue
+
+from services.alert_aggregator import AlertSummary
+from services.config_service import PROTOCOL_NAMES
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="microseconds")
+
+
+def eve_record(event):
+    """
+    Converte un RuleEvent (o un AlertSummary) in un record in stile EVE JSON (Suricata).
+
+    Args:
+        event (RuleEvent|AlertSummary): L'evento prodotto da una regola o il riepilogo
+                                        delle occorrenze soppresse.
+
+    Returns:
+        dict: Record con timestamp ISO 8601, 5-tupla e dettagli della regola.
+    """
+    if isinstance(event, AlertSummary):
+        return {
+            "timestamp": _isoformat(event.last_seen),
+            "event_type": "alert_summary",
+            "src_ip": event.src,
+            "alert": {
+                "action": event.action,
+                "signature_id": event.rule_id,
+                "signature": event.description,
+            },
+            "summary": {
+                "count": event.count,
+                "first_seen": _isoformat(event.first_seen),
+                "last_seen": _isoformat(event.last_seen),
+            },
+        }
+
+    record = {
+        "timestamp": _isoformat(event.timestamp),
+        "event_type": "alert",
+        "src_ip": event.src,
+        "dest_ip": event.dst,
+        "proto": PROTOCOL_NAMES.get(event.protocol, str(event.protocol)),
+    }
+    if event.src_port is not None:
+        record["src_port"] = event.src_port
+        record["dest_port"] = event.dst_port
+    record["alert"] = {
+        "action": event.action,
+        "signature_id": event.rule_id,
+        "signature": event.description,
+    }
+    return record
+
+
+class AlertSink:
+    """
+    Uscita strutturata delle allerte: ogni RuleEvent (o AlertSummary) viene scritto come
+    una riga JSON (formato EVE) da un thread dedicato.
+
+    Chi produce le allerte esegue solo un inserimento non bloccante in una coda limitata:
+    durante una tempesta di allerte, se il writer non tiene il passo, le allerte in eccesso
+    vengono scartate e contate invece di rallentare l'analisi dei pacchetti. Il writer
+    preleva le allerte a lotti, le serializza e le scrive con una sola write per lotto;
+    quando il file supera `max_bytes` viene ruotato (file.1, file.2, ... fino a `backup_count`).
+
+    Attributi:
+        path (str): File delle allerte.
+        written (int): Allerte scritte.
+        dropped (int): Allerte scartate perché la coda era piena.
+        rotations (int): Rotazioni del file eseguite.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, backup_count=5, max_pending=65536, batch_size=512,
+                 flush_interval=0.5):
+        """
+        Args:
+            path (str): File JSON-lines delle allerte.
+            max_bytes (int): Dimensione oltre la quale il file viene ruotato (0 per non ruotare mai).
+            backup_count (int): Numero di file ruotati conservati.
+            max_pending (int): Numero massimo di allerte in attesa di scrittura.
+            batch_size (int): Numero massimo di allerte scritte per lotto.
+            flush_interval (float): Intervallo massimo in secondi tra un'allerta e la sua scrittura.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = Queue(maxsize=max_pending)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._file = None
+        self._size = 0
+
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+
+    def emit(self, event):
+        """
+        Accoda un'allerta per la scrittura (non bloccante).
+
+        Args:
+            event (RuleEvent): L'evento da scrivere.
+
+        Returns:
+            bool: False se l'allerta è stata scartata perché la coda era piena.
+        """
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except Full:
+            self.dropped += 1
+            return False
+
+    def start(self):
+        """
+        Apre il file delle allerte e avvia il thread di scrittura.
+        """
+        self._open()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="alert-sink", daemon=True)
+        self._thread.start()
+        logging.info(f"Allerte strutturate scritte in {self.path}.")
+
+    def stop(self):
+        """
+        Scrive le allerte ancora in coda, arresta il thread e chiude il file.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._write_batch(self._take_batch(None))
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        logging.info(f"Alert sink terminato. Allerte scritte: {self.written}, scartate: {self.dropped}, rotazioni: {self.rotations}.")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except Empty:
+                continue
+            batch = self._take_batch(self.batch_size - 1)
+            batch.insert(0, first)
+            self._write_batch(batch)
+
+    def _take_batch(self, limit):
+        """
+        Preleva senza attendere al più `limit` allerte dalla coda (tutte se None).
+        """
+        batch = []
+        while limit is None or len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        """
+        Serializza un lotto di allerte e lo scrive con una sola operazione, ruotando il file se necessario.
+        """
+        if not batch or self._file is None:
+            return
+        data = "".join(json.dumps(eve_record(event), separators=(",", ":")) + "\n" for event in batch).encode("utf-8")
+        if self.max_bytes and self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        try:
+            self._file.write(data)
+            self._file.flush()
+        except OSError as e:
+            logging.error(f"Impossibile scrivere le allerte in {self.path}: {e}")
+            return
+        self._size += len(data)
+        self.written += len(batch)
+
+    def _open(self):
+        try:
+            self._file = open(self.path, "ab")
+            self._size = self._file.tell()
+        except OSError as e:
+            self._file = None
+            logging.error(f"Impossibile aprire il file delle allerte {self.path}: {e}")
+
+    def _rotate(self):
+        """
+        Ruota il file delle allerte: path -> path.1 -> path.2 ... (il più vecchio viene eliminato).
+        """
+        self._file.close()
+        try:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            if self.backup_count > 0:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+        except OSError as e:
+            logging.error(f"Rotazione del file delle allerte {self.path} non riuscita: {e}")
+        self.rotations += 1
+        self._open()
+
+    def pending(self):
+        """
+        Returns:
+            int: Numero di allerte in attesa di scrittura.
+        """
+        return self._queue.qsize()
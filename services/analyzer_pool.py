@@ -0,0 +1,494 @@
+import logging
+import logging.handlers
+import multiprocessing
+import threading
+import time
+from collections import namedtuple
+from queue import Empty
+
+from rules.rule_manager import RuleManager
+from services.blacklist_store import BlacklistStore
+from services.packet_analyzer import PacketAnalyzer
+from services.shm_ring import DROP_NEWEST, DROP_OLDEST, SharedRingBuffer
+
+
+# Contatori di un worker inviati periodicamente sulla coda delle azioni, insieme ai RuleEvent
+WorkerStats = namedtuple("WorkerStats", ["index", "blocked_hits", "allowed_hits", "flows", "rule_profile"])
+STATS_INTERVAL = 1.0
+# Attesa tra due tentativi di scrittura in una corsia piena, con backpressure attiva
+BACKPRESSURE_POLL = 0.0005
+
+
+def flow_hash(packet):
+    """
+    Hash simmetrico della 5-tupla: i due versi di una connessione producono lo stesso valore.
+
+    Args:
+        packet (PacketMeta): Il pacchetto.
+
+    Returns:
+        int: Valore di hash non negativo.
+    """
+    value = (packet.src_int ^ packet.dst_int) ^ ((packet.src_port or 0) ^ (packet.dst_port or 0)) ^ (packet.protocol << 16)
+    return _mix(value)
+
+
+def source_hash(packet):
+    """
+    Hash dell'indirizzo sorgente: tutti i pacchetti di una sorgente producono lo stesso valore.
+
+    Args:
+        packet (PacketMeta): Il pacchetto.
+
+    Returns:
+        int: Valore di hash non negativo.
+    """
+    return _mix(packet.src_int)
+
+
+def _mix(value):
+    # Ripiega gli indirizzi IPv6 su 32 bit e rimescola i bit bassi
+    value ^= value >> 64
+    value ^= value >> 32
+    value = (value & 0xFFFFFFFF) * 0x9E3779B1
+    return (value >> 16) & 0xFFFFFFFF
+
+
+SHARD_FUNCTIONS = {
+    "src": source_hash,
+    "flow": flow_hash,
+}
+
+
+def select_shard_key(rules, shard_by="auto"):
+    """
+    Sceglie la chiave di sharding compatibile con le regole.
+
+    Le regole con `flow_state` o con threshold `by_flow` richiedono che entrambi i versi di
+    una connessione arrivino allo stesso worker, altrimenti la sua tabella dei flussi vede
+    un solo verso e la connessione non diventa mai ESTABLISHED: in loro presenza lo
+    sharding per sorgente viene sostituito da quello per flusso. Con lo sharding per flusso
+    i threshold degli altri tipi (es. `by_src`) sono contati separatamente da ogni worker.
+
+    Args:
+        rules (list): Regole parsate (Rule).
+        shard_by (str): "auto", "src" oppure "flow".
+
+    Returns:
+        str: "src" oppure "flow".
+    """
+    flow_rules = [rule.rule_id for rule in rules if rule.flow_state or rule.threshold.get("track") == "by_flow"]
+    if shard_by == "auto":
+        shard_by = "flow" if flow_rules else "src"
+    elif shard_by == "src" and flow_rules:
+        logging.warning(f"Sharding per sorgente incompatibile con le regole {', '.join(str(rule_id) for rule_id in flow_rules)} "
+                        f"(flow_state o track by_flow): i due versi di una connessione finirebbero su worker diversi. "
+                        f"Viene usato lo sharding per flusso.")
+        shard_by = "flow"
+    if shard_by == "flow" and len(flow_rules) < len(rules):
+        logging.info("Sharding per flusso: i threshold non by_flow sono contati separatamente da ciascun worker.")
+    return shard_by
+
+
+def _setup_worker_logging(event_queue, level):
+    """
+    Sostituisce gli handler del logger radice ereditati dal processo principale con un
+    QueueHandler sulla coda delle azioni: il processo principale riceve i record insieme ai
+    RuleEvent e li passa ai propri handler. Gli handler ereditati con il fork puntano a
+    una coda senza listener nel worker (i record andrebbero persi) e a lock copiati nello
+    stato in cui si trovavano al momento del fork.
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(event_queue))
+    root.setLevel(level)
+
+
+def _worker_main(index, ring, event_queue, rules, protocol_config_file, config_dir, debug_sample_rate=1,
+                 rule_profile=False, rules_generation=None, rule_queue=None, block_timeout=3600, max_blocked=10000,
+                 log_level=logging.INFO):
+    """
+    Punto di ingresso di un processo worker: costruisce il proprio PacketAnalyzer con le
+    regole già lette dal processo principale e analizza i lotti di pacchetti letti dalla
+    propria corsia del ring condiviso, inviando le azioni delle regole al processo
+    principale. Quando il processo principale incrementa `rules_generation` il worker
+    applica, tra un lotto e l'altro, l'ultimo insieme di regole ricevuto su `rule_queue`:
+    tutti i worker eseguono così le stesse regole del processo principale, anche se il file
+    è stato modificato nel frattempo. Ogni STATS_INTERVAL secondi e alla chiusura invia i propri contatori
+    (WorkerStats) al processo principale, che li espone nelle metriche. Termina quando il
+    ring viene chiuso e la corsia è vuota.
+
+    La blacklist del worker serve solo al fast path (i blocchi sul firewall sono del
+    processo principale) e ha la stessa durata dei blocchi di quella principale: le voci
+    scadute vengono rimosse tra un lotto e l'altro, così il traffico di una sorgente
+    sbloccata torna a essere analizzato.
+
+    I record di log del worker sono inviati anch'essi sulla coda delle azioni e scritti dal
+    processo principale.
+    """
+    _setup_worker_logging(event_queue, log_level)
+    rule_manager, rules = _index_rules(protocol_config_file, rules)
+    generation = rules_generation.value if rules_generation is not None else 0
+    blacklist = BlacklistStore(default_ttl=block_timeout, max_entries=max_blocked)
+    analyzer = PacketAnalyzer(None, rule_manager, config_dir=config_dir, rules=rules, blacklist=blacklist,
+                              debug_sample_rate=debug_sample_rate)
+    analyzer.event_sink = event_queue
+    analyzer.enable_rule_profile(rule_profile)
+    logging.info(f"Worker di analisi {index} avviato.")
+
+    next_stats = time.monotonic() + STATS_INTERVAL
+    while True:
+        batch = ring.wait_batch(index)
+        if not batch and ring.closed:
+            break
+        blacklist.expire()
+        if time.monotonic() >= next_stats:
+            event_queue.put(_worker_stats(index, analyzer))
+            next_stats = time.monotonic() + STATS_INTERVAL
+        if rules_generation is not None and rules_generation.value != generation:
+            # Un insieme di regole per ogni incremento, inserito prima dell'incremento: si applica l'ultimo
+            current = rules_generation.value
+            for _ in range(current - generation):
+                rules = rule_queue.get()
+            generation = current
+            _reload_worker_rules(index, analyzer, protocol_config_file, rules)
+        for packet in batch:
+            analyzer.analyze_packet(packet)
+    event_queue.put(_worker_stats(index, analyzer))
+    logging.info(f"Worker di analisi {index} terminato.")
+    analyzer.log_rule_profile()
+
+
+def _worker_stats(index, analyzer):
+    # Il costo per regola viene inviato solo se la misura è attiva: con molte regole il dizionario è grande
+    profile = {rule_id: tuple(entry) for rule_id, entry in analyzer.rule_profile.items()} if analyzer.rule_profile else None
+    return WorkerStats(index, analyzer.blocked_hits, analyzer.allowed_hits, len(analyzer.flow_table), profile)
+
+
+def _index_rules(protocol_config_file, rules):
+    # Le regole arrivano già lette e validate dal processo principale: il worker le indicizza soltanto
+    rule_manager = RuleManager(protocol_config_file)
+    rules = [rule for rule in rules if rule_manager.add_rule(rule.protocol, rule.src_ip, rule, rule.dst_ip)]
+    return rule_manager, rules
+
+
+def _reload_worker_rules(index, analyzer, protocol_config_file, rules):
+    rule_manager, rules = _index_rules(protocol_config_file, rules)
+    preserved = analyzer.set_rules(rules, rule_manager=rule_manager)
+    logging.info(f"Worker di analisi {index}: regole ricaricate ({preserved} threshold conservati).")
+
+
+class AnalyzerPool:
+    """
+    Pool di processi PacketAnalyzer con sharding per affinità.
+
+    Ogni pacchetto viene assegnato a un worker tramite un hash: con shard_by="src" tutti i
+    pacchetti di una sorgente (e quindi la sua cronologia per i threshold) restano sullo
+    stesso worker; con shard_by="flow" l'hash simmetrico della 5-tupla mantiene entrambi i
+    versi di una connessione sullo stesso worker. I pacchetti sono scritti a lotti in un
+    SharedRingBuffer con una corsia per worker, senza serializzazione né lock tra processi,
+    e le azioni (allerte e blocchi) tornano al processo principale su una coda comune, dove
+    vengono eseguite da `event_handler`.
+
+    L'oggetto espone la stessa interfaccia di inserimento di queue.Queue usata da
+    PacketSniffer, quindi può sostituire direttamente la coda dei pacchetti.
+
+    A corsia piena i pacchetti vengono scartati secondo la politica del ring, come nella
+    cattura live; con `backpressure` l'inserimento attende invece il worker, così la
+    riproduzione di un file alla massima velocità non perde pacchetti.
+
+    Attributi:
+        workers (int): Numero di processi worker.
+        ring (SharedRingBuffer): Ring condiviso tra il processo principale e i worker.
+        dropped_packets (int): Pacchetti persi perché la corsia del worker era piena.
+        processed_events (int): Azioni ricevute dai worker ed eseguite.
+        worker_stats (dict): Ultimi WorkerStats ricevuti, per indice del worker.
+    """
+
+    def __init__(self, workers, rules, protocol_config_file, event_handler,
+                 config_dir="./configuration", shard_by="src", batch_size=64, ring_capacity=16384,
+                 drop_policy=DROP_OLDEST, flush_interval=0.05, debug_sample_rate=1, rule_profile=False,
+                 block_timeout=3600, max_blocked=10000, backpressure=False):
+        """
+        Inizializza il pool (i processi vengono creati da `start_workers`).
+
+        Args:
+            workers (int): Numero di processi worker.
+            rules (list): Regole lette dal processo principale, eseguite da ciascun worker.
+            protocol_config_file (str): File dei protocolli caricato da ciascun worker.
+            event_handler (callable): Funzione chiamata nel processo principale per ogni RuleEvent.
+            config_dir (str): Directory dei file di configurazione.
+            shard_by (str): Chiave di sharding, "src" oppure "flow".
+            batch_size (int): Pacchetti per lotto scritto nella corsia di un worker.
+            ring_capacity (int): Numero massimo di pacchetti in attesa per worker.
+            drop_policy (str): Politica a corsia piena, DROP_OLDEST oppure DROP_NEWEST.
+            flush_interval (float): Intervallo massimo in secondi prima dell'invio di un lotto incompleto.
+            debug_sample_rate (int): Con DEBUG attivo, ogni worker registra i dettagli di un pacchetto ogni N.
+            rule_profile (bool): Se True ogni worker misura il costo di ciascuna regola e lo riporta nel log alla chiusura.
+            block_timeout (int): Durata dei blocchi in secondi, applicata anche al fast path dei worker.
+            max_blocked (int): Numero massimo di indirizzi nella blacklist di ciascun worker.
+            backpressure (bool): Se True, a corsia piena l'inserimento attende che il worker liberi
+                spazio invece di scartare pacchetti (richiede DROP_NEWEST; usato dalla riproduzione
+                di un file alla massima velocità).
+        """
+        if shard_by not in SHARD_FUNCTIONS:
+            raise ValueError(f"Chiave di sharding non supportata: {shard_by}")
+        if backpressure and drop_policy != DROP_NEWEST:
+            raise ValueError("La backpressure richiede la politica DROP_NEWEST.")
+        self.workers = workers
+        self.rules = rules
+        self.protocol_config_file = protocol_config_file
+        self.event_handler = event_handler
+        self.config_dir = config_dir
+        self.shard_by = shard_by
+        self.shard = SHARD_FUNCTIONS[shard_by]
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.debug_sample_rate = debug_sample_rate
+        self.rule_profile = rule_profile
+        self.block_timeout = block_timeout
+        self.max_blocked = max_blocked
+        self.backpressure = backpressure
+
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else multiprocessing
+        self._context = context
+        self.ring = SharedRingBuffer(lanes=workers, capacity=ring_capacity, policy=drop_policy)
+        self.event_queue = context.Queue()
+        self.rules_generation = context.Value("L", 0, lock=False)  # Incrementato da reload_rules, letto dai worker
+        self.rule_queues = [context.Queue() for _ in range(workers)]  # Regole ricaricate, una coda per worker
+        self.processes = []
+        self._pending = [[] for _ in range(workers)]
+        self._lock = threading.Lock()
+        self.processed_events = 0
+        self.worker_stats = {}
+
+        self._released_drops = 0
+
+    @property
+    def dropped_packets(self):
+        if self.ring is None:
+            return self._released_drops
+        stats = self.ring.stats()
+        return stats["dropped"] + stats["overwritten"]
+
+    def start_workers(self):
+        """
+        Crea i processi worker. Va chiamato prima di avviare altri thread, perché i worker
+        vengono creati con fork dove disponibile.
+        """
+        for index in range(self.workers):
+            process = self._context.Process(
+                target=_worker_main,
+                args=(index, self.ring, self.event_queue, self.rules,
+                      self.protocol_config_file, self.config_dir, self.debug_sample_rate, self.rule_profile,
+                      self.rules_generation, self.rule_queues[index], self.block_timeout, self.max_blocked,
+                      logging.getLogger().getEffectiveLevel()),
+                name=f"analyzer-{index}",
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        logging.info(f"Pool di analisi avviato con {self.workers} worker.")
+
+    def start(self, stop_event):
+        """
+        Raccoglie ed esegue le azioni dei worker finché `stop_event` non viene impostato,
+        inviando periodicamente i lotti incompleti. Alla fine arresta i worker.
+        I worker vengono creati qui se `start_workers` non è stato chiamato.
+
+        Args:
+            stop_event (threading.Event): Evento che segnala la terminazione.
+        """
+        if not self.processes:
+            self.start_workers()
+
+        while not stop_event.is_set():
+            self.flush()
+            self._drain_events(timeout=self.flush_interval)
+
+        self.stop()
+
+    def stop(self):
+        """
+        Scrive i lotti residui e chiude il ring, attende la terminazione dei worker
+        ed esegue le ultime azioni ricevute.
+        """
+        self.flush()
+        self.ring.close()
+
+        # Le azioni vanno consumate mentre si attende: un worker non termina finché la coda delle azioni non è svuotata
+        deadline = time.monotonic() + 5
+        while any(process.is_alive() for process in self.processes) and time.monotonic() < deadline:
+            self._drain_events(timeout=0.1)
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self._drain_events(timeout=0)
+        for rule_queue in self.rule_queues:
+            # Un worker terminato non legge più le regole in sospeso: la chiusura non deve attenderle
+            rule_queue.cancel_join_thread()
+            rule_queue.close()
+        self.processes = []
+        self._released_drops = self.dropped_packets
+        logging.info(f"Pool di analisi terminato. Pacchetti scartati: {self._released_drops}")
+        self.ring.release()
+        self.ring = None
+
+    def _drain_events(self, timeout):
+        """
+        Esegue le azioni arrivate dai worker; attende al più `timeout` secondi la prima.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                event = self.event_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except Empty:
+                return
+            if isinstance(event, WorkerStats):
+                self.worker_stats[event.index] = event
+                continue
+            if isinstance(event, logging.LogRecord):
+                # Record di log di un worker, già filtrato per livello nel worker
+                logging.getLogger(event.name).handle(event)
+                continue
+            try:
+                self.event_handler(event)
+            except Exception as e:
+                logging.error(f"Errore durante l'esecuzione dell'azione {event}: {e}")
+            self.processed_events += 1
+
+    def fast_path_hits(self):
+        """
+        Pacchetti scartati dal fast path dei worker, secondo gli ultimi contatori ricevuti.
+
+        Returns:
+            dict: Chiavi "blocked" (sorgenti in blacklist) e "allowed" (sorgenti in ALLOWLIST).
+        """
+        stats = list(self.worker_stats.values())
+        return {"blocked": sum(item.blocked_hits for item in stats),
+                "allowed": sum(item.allowed_hits for item in stats)}
+
+    def active_flows(self):
+        """
+        Returns:
+            int: Flussi nelle tabelle dei worker, secondo gli ultimi contatori ricevuti.
+        """
+        return sum(item.flows for item in list(self.worker_stats.values()))
+
+    def rule_profile_report(self, limit=None):
+        """
+        Costo delle regole sommato su tutti i worker (vedi PacketAnalyzer.rule_profile_report),
+        secondo gli ultimi contatori ricevuti.
+
+        Args:
+            limit (int): Numero massimo di regole restituite (None per tutte).
+
+        Returns:
+            list: Tuple (rule_id, valutazioni, match, secondi cumulativi), dalla regola più costosa.
+        """
+        totals = {}
+        for stats in list(self.worker_stats.values()):
+            for rule_id, (evaluations, matches, seconds) in (stats.rule_profile or {}).items():
+                total = totals.setdefault(rule_id, [0, 0, 0.0])
+                total[0] += evaluations
+                total[1] += matches
+                total[2] += seconds
+        report = sorted(((rule_id, *entry) for rule_id, entry in totals.items()), key=lambda item: item[3], reverse=True)
+        return report[:limit] if limit is not None else report
+
+    def reload_rules(self, rules):
+        """
+        Invia ai worker le regole ricaricate dal processo principale. Ogni worker le applica
+        tra due lotti, mentre i pacchetti continuano ad accumularsi nella sua corsia.
+
+        Args:
+            rules (list): Nuove regole lette dal processo principale.
+        """
+        self.rules = rules
+        for rule_queue in self.rule_queues:
+            rule_queue.put(rules)
+        self.rules_generation.value += 1
+
+    def set_shard_by(self, shard_by):
+        """
+        Cambia la chiave di sharding (es. dopo un ricaricamento con regole per flusso). I
+        pacchetti successivi possono andare a un worker diverso da quello che ne ha
+        visto la cronologia, che viene quindi ricostruita.
+
+        Args:
+            shard_by (str): "src" oppure "flow".
+        """
+        if shard_by not in SHARD_FUNCTIONS:
+            raise ValueError(f"Chiave di sharding non supportata: {shard_by}")
+        if shard_by == self.shard_by:
+            return
+        with self._lock:
+            self.shard_by = shard_by
+            self.shard = SHARD_FUNCTIONS[shard_by]
+        logging.warning(f"Chiave di sharding del pool cambiata in '{shard_by}'.")
+
+    def full(self):
+        """
+        Il pool gestisce internamente le corsie piene (secondo la politica di scarto o con la
+        backpressure): non è mai pieno.
+        """
+        return False
+
+    def put(self, packet):
+        """
+        Assegna un pacchetto al worker della sua shard; il lotto viene inviato quando è completo.
+        Con la backpressure attiva l'invio attende che la corsia abbia spazio.
+
+        Args:
+            packet (PacketMeta): Il pacchetto da analizzare.
+        """
+        index = self.shard(packet) % self.workers
+        with self._lock:
+            pending = self._pending[index]
+            pending.append(packet)
+            if len(pending) >= self.batch_size:
+                self._pending[index] = []
+                self._send(index, pending)
+
+    put_nowait = put
+
+    def flush(self):
+        """
+        Invia ai worker tutti i lotti incompleti.
+        """
+        with self._lock:
+            for index, pending in enumerate(self._pending):
+                if pending:
+                    self._pending[index] = []
+                    self._send(index, pending)
+
+    def _send(self, index, batch):
+        if self.ring is None:
+            # Pool già arrestato: lo sniffer può consegnare ancora qualche pacchetto durante la chiusura
+            return
+        if self.backpressure:
+            written = self._send_waiting(index, batch)
+        else:
+            written = self.ring.put_batch(index, batch)
+        if written < len(batch):
+            logging.warning(f"Corsia del worker {index} piena, {len(batch) - written} pacchetti scartati. Totale scartati: {self.dropped_packets}")
+
+    def _send_waiting(self, index, batch):
+        """
+        Scrive il lotto a parti, attendendo che il worker liberi spazio. Rinuncia (e i
+        pacchetti restanti vengono scartati) solo se nessun worker è più in esecuzione.
+        """
+        ring = self.ring
+        written = 0
+        while written < len(batch):
+            free = ring.free_slots(index)
+            if free:
+                written += ring.put_batch(index, batch[written:written + free])
+                continue
+            if not any(process.is_alive() for process in self.processes):
+                written += ring.put_batch(index, batch[written:])
+                break
+            time.sleep(BACKPRESSURE_POLL)
+        return written
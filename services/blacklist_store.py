@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class BlacklistStore:
+    """
+    Blacklist degli indirizzi bloccati, con scadenza per voce, limite massimo e snapshot su disco.
+
+    Le scadenze sono gestite da una timer wheel: ogni voce è registrata nello slot
+    corrispondente al suo istante di scadenza e a ogni tick vengono esaminati solo gli slot
+    trascorsi, quindi la scadenza costa O(1) per voce indipendentemente dalla dimensione
+    della blacklist. Le voci con scadenza oltre l'orizzonte della ruota restano nello slot
+    e vengono ricontrollate al giro successivo.
+
+    Raggiunto `max_entries`, il blocco più vecchio (per ultimo inserimento o rinnovo) viene
+    rimosso per fare spazio al nuovo. Ogni inserimento e rimozione viene inoltrato
+    all'EnforcementExecutor, tranne la scadenza delle voci quando il backend applica lo
+    stesso timeout nel kernel (`expires_natively`): l'elemento è già stato rimosso e uno
+    sblocco esplicito fallirebbe. Lo snapshot JSON viene riscritto periodicamente quando la
+    blacklist cambia e, all'avvio, i blocchi non ancora scaduti vengono riapplicati al
+    firewall in un'unica operazione.
+
+    Attributi:
+        default_ttl (int|None): Durata dei blocchi in secondi (None per blocchi senza scadenza).
+        max_entries (int): Numero massimo di indirizzi bloccati.
+        expired (int): Voci rimosse per scadenza.
+        evicted (int): Voci rimosse per superamento del limite.
+    """
+
+    def __init__(self, enforcer=None, default_ttl=3600, max_entries=10000, snapshot_path=None,
+                 resolution=1.0, wheel_slots=4096, snapshot_interval=30.0):
+        """
+        Args:
+            enforcer (EnforcementExecutor): Esecutore dei blocchi sul firewall (None: solo registrazione).
+            default_ttl (int|None): Durata dei blocchi in secondi (None o 0 per blocchi senza scadenza).
+            max_entries (int): Numero massimo di indirizzi bloccati.
+            snapshot_path (str|None): File JSON dello snapshot (None per disattivare la persistenza).
+            resolution (float): Durata in secondi di uno slot della timer wheel.
+            wheel_slots (int): Numero di slot della timer wheel.
+            snapshot_interval (float): Intervallo minimo in secondi tra due scritture dello snapshot.
+        """
+        self.enforcer = enforcer
+        self.default_ttl = default_ttl or None
+        self.max_entries = max_entries
+        self.snapshot_path = snapshot_path
+        self.resolution = resolution
+        self.snapshot_interval = snapshot_interval
+
+        self.entries = OrderedDict()  # IP -> istante di scadenza (epoch) o None
+        self._wheel = [set() for _ in range(wheel_slots)]
+        self._last_tick = int(time.time() / resolution)
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.expired = 0
+        self.evicted = 0
+
+    def __contains__(self, ip):
+        return ip in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def add(self, ip, ttl=None, now=None):
+        """
+        Blocca un indirizzo o ne rinnova la scadenza.
+
+        Args:
+            ip (str): Indirizzo da bloccare.
+            ttl (int|None): Durata in secondi (default: `default_ttl`).
+            now (float): Istante corrente (default: time.time()).
+        """
+        ttl = ttl or self.default_ttl
+        now = time.time() if now is None else now
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            if ip in self.entries:
+                self.entries.move_to_end(ip)
+            elif len(self.entries) >= self.max_entries:
+                oldest, _ = self.entries.popitem(last=False)
+                self.evicted += 1
+                logging.warning(f"Blacklist piena ({self.max_entries} voci): rimosso il blocco di {oldest}.")
+                self._unblock(oldest)
+            self.entries[ip] = expires_at
+            self._schedule(ip, expires_at)
+            self._dirty = True
+        if self.enforcer is not None:
+            self.enforcer.block(ip, ttl)
+
+    def remove(self, ip):
+        """
+        Rimuove il blocco di un indirizzo.
+
+        Returns:
+            bool: True se l'indirizzo era bloccato.
+        """
+        with self._lock:
+            if self.entries.pop(ip, False) is False:
+                return False
+            self._dirty = True
+        self._unblock(ip)
+        return True
+
+    def clear(self, keep_snapshot=True):
+        """
+        Rimuove tutti i blocchi dal firewall e dalla memoria.
+
+        Args:
+            keep_snapshot (bool): Se True lo snapshot viene aggiornato prima della rimozione e
+                                  non più modificato, così i blocchi vengono riapplicati al riavvio.
+        """
+        with self._lock:
+            if keep_snapshot and self._dirty:
+                self.save()
+            ips = list(self.entries)
+            self.entries.clear()
+            for slot in self._wheel:
+                slot.clear()
+            self._dirty = not keep_snapshot
+        for ip in ips:
+            self._unblock(ip)
+
+    def _unblock(self, ip):
+        if self.enforcer is not None:
+            self.enforcer.unblock(ip)
+
+    def _schedule(self, ip, expires_at):
+        if expires_at is not None:
+            # Una scadenza in uno slot già superato viene esaminata al prossimo tick
+            tick = max(int(expires_at / self.resolution), self._last_tick + 1)
+            self._wheel[tick % len(self._wheel)].add(ip)
+
+    def _slot_of(self, expires_at):
+        return int(expires_at / self.resolution) % len(self._wheel)
+
+    def expire(self, now=None):
+        """
+        Avanza la timer wheel fino all'istante corrente e rimuove le voci scadute.
+
+        Args:
+            now (float): Istante corrente (default: time.time()).
+
+        Returns:
+            int: Numero di voci scadute.
+        """
+        now = time.time() if now is None else now
+        tick = int(now / self.resolution)
+        expired = []
+        with self._lock:
+            # Dopo una pausa più lunga di un giro basta esaminare ogni slot una volta
+            first = max(self._last_tick + 1, tick - len(self._wheel) + 1)
+            for current in range(first, tick + 1):
+                index = current % len(self._wheel)
+                slot = self._wheel[index]
+                for ip in list(slot):
+                    expires_at = self.entries.get(ip)
+                    if expires_at is None:
+                        # Voce rimossa o resa permanente
+                        slot.discard(ip)
+                    elif expires_at <= now:
+                        slot.discard(ip)
+                        del self.entries[ip]
+                        expired.append(ip)
+                    elif self._slot_of(expires_at) != index:
+                        # Voce rinnovata: è già registrata nel nuovo slot
+                        slot.discard(ip)
+            self._last_tick = max(self._last_tick, tick)
+            if expired:
+                self._dirty = True
+                self.expired += len(expired)
+        # Con i timeout del kernel il firewall ha già rimosso (o sta per rimuovere) questi blocchi
+        unblock = self.enforcer is not None and not self.enforcer.expires_natively
+        for ip in expired:
+            logging.info(f"Blocco di {ip} scaduto.")
+            if unblock:
+                self._unblock(ip)
+        return len(expired)
+
+    def save(self):
+        """
+        Scrive lo snapshot della blacklist (scrittura atomica tramite file temporaneo).
+        """
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            data = {"version": 1, "entries": [[ip, expires_at] for ip, expires_at in self.entries.items()]}
+            self._dirty = False
+        temporary = f"{self.snapshot_path}.tmp"
+        try:
+            with open(temporary, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(temporary, self.snapshot_path)
+        except OSError as e:
+            logging.error(f"Impossibile salvare lo snapshot della blacklist in {self.snapshot_path}: {e}")
+
+    def load(self, now=None):
+        """
+        Carica lo snapshot, scarta i blocchi scaduti e riapplica gli altri al firewall
+        (l'EnforcementExecutor li invia al backend in un solo lotto).
+
+        Returns:
+            int: Numero di blocchi ripristinati.
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        try:
+            with open(self.snapshot_path, "r") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Impossibile leggere lo snapshot della blacklist {self.snapshot_path}: {e}")
+            return 0
+
+        now = time.time() if now is None else now
+        restored = 0
+        for ip, expires_at in data.get("entries", [])[-self.max_entries:]:
+            if expires_at is not None and expires_at <= now:
+                continue
+            ttl = max(1, int(expires_at - now)) if expires_at is not None else None
+            with self._lock:
+                self.entries[ip] = expires_at
+                self._schedule(ip, expires_at)
+            if self.enforcer is not None:
+                self.enforcer.block(ip, ttl)
+            restored += 1
+        logging.info(f"Ripristinati {restored} blocchi dallo snapshot {self.snapshot_path}.")
+        return restored
+
+    def start(self):
+        """
+        Ripristina lo snapshot e avvia il thread che gestisce scadenze e salvataggi.
+        """
+        self.load()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="blacklist-store", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Arresta il thread e salva lo snapshot se la blacklist è cambiata.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._dirty:
+            self.save()
+
+    def _run(self):
+        next_save = time.monotonic() + self.snapshot_interval
+        while not self._stop_event.wait(self.resolution):
+            self.expire()
+            if self._dirty and time.monotonic() >= next_save:
+                self.save()
+                next_save = time.monotonic() + self.snapshot_interval
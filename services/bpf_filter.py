@@ -0,0 +1,155 @@
+import ctypes
+import logging
+import socket
+import struct
+import subprocess
+
+from rules.rule_compiler import PORT_PROTOCOLS, compile_port
+from services.config_service import PROTOCOL_NAMES
+
+
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+
+# Primitive pcap dedicate per i protocolli più comuni (coprono sia IPv4 sia IPv6 dove previsto)
+PROTOCOL_PRIMITIVES = {
+    "TCP": "tcp",
+    "UDP": "udp",
+    "ICMP": "icmp",
+    "ICMPv6": "icmp6",
+}
+
+_SOCK_FILTER = struct.Struct("HBBI")
+_SOCK_FPROG = struct.Struct("HP")
+
+
+def build_filter_expression(rules):
+    """
+    Calcola un'espressione di filtro pcap che lascia passare solo il traffico che almeno
+    una regola potrebbe selezionare (protocollo, prefissi IP e porte).
+
+    Il filtro è volutamente un soprainsieme: direzione, flag TCP e threshold restano
+    verificati dal PacketAnalyzer. Per ogni regola passano entrambi i versi della
+    connessione (anche le risposte, con indirizzi e porte scambiati): la tabella dei
+    flussi deve vederli per portare le connessioni in ESTABLISHED, altrimenti le regole
+    con `flow_state` e i threshold `by_flow` non funzionerebbero con il filtro attivo.
+
+    Args:
+        rules (list): Regole parsate (Rule).
+
+    Returns:
+        str|None: L'espressione del filtro, oppure None se non è possibile filtrare
+                  (nessuna regola) e va catturato tutto il traffico.
+    """
+    protocol_numbers = {name: number for number, name in PROTOCOL_NAMES.items()}
+    terms_by_protocol = {}
+
+    for rule in rules:
+        if rule.protocol not in protocol_numbers:
+            logging.debug(f"Regola {rule.rule_id} esclusa dal filtro BPF: il protocollo {rule.protocol} non corrisponde mai a un pacchetto.")
+            continue
+        try:
+            src_port, dst_port = compile_port(rule.src_port), compile_port(rule.dst_port)
+        except (ValueError, TypeError):
+            continue
+        if rule.protocol not in PORT_PROTOCOLS and (src_port is not None or dst_port is not None):
+            continue
+
+        primitive = PROTOCOL_PRIMITIVES.get(rule.protocol)
+        if primitive is None:
+            number = protocol_numbers[rule.protocol]
+            primitive = f"(ip proto {number} or ip6 proto {number})"
+
+        terms = terms_by_protocol.setdefault(primitive, set())
+        terms.add(_endpoint_conditions(rule.src_ip, rule.dst_ip, src_port, dst_port))
+        terms.add(_endpoint_conditions(rule.dst_ip, rule.src_ip, dst_port, src_port))  # Risposte
+
+    if not terms_by_protocol:
+        return None
+
+    clauses = []
+    for primitive, conditions in sorted(terms_by_protocol.items()):
+        if "" in conditions:
+            # Una regola senza vincoli per il protocollo rende superflue le altre
+            clauses.append(primitive)
+        else:
+            alternatives = " or ".join(f"({condition})" for condition in sorted(conditions))
+            clauses.append(f"({primitive} and ({alternatives}))")
+    return " or ".join(clauses)
+
+
+def _endpoint_conditions(src_ip, dst_ip, src_port, dst_port):
+    conditions = []
+    if src_ip != "any":
+        conditions.append(f"src net {src_ip}")
+    if dst_ip != "any":
+        conditions.append(f"dst net {dst_ip}")
+    if src_port is not None:
+        conditions.append(f"src port {src_port}")
+    if dst_port is not None:
+        conditions.append(f"dst port {dst_port}")
+    return " and ".join(conditions)
+
+
+def compile_filter(expression, interface=None):
+    """
+    Compila un'espressione pcap in istruzioni BPF classiche.
+
+    Usa libpcap tramite Scapy se disponibile, altrimenti `tcpdump -ddd`.
+
+    Args:
+        expression (str): Espressione del filtro.
+        interface (str): Interfaccia su cui il filtro verrà applicato (per il tipo di link).
+
+    Returns:
+        list: Istruzioni come tuple (code, jt, jf, k).
+
+    Raises:
+        OSError: Se nessun compilatore BPF è disponibile o l'espressione non è valida.
+    """
+    try:
+        from scapy.arch.common import compile_filter as scapy_compile_filter
+
+        program = scapy_compile_filter(expression, iface=interface)
+        return [(ins.code, ins.jt, ins.jf, ins.k) for ins in program.bf_insns[:program.bf_len]]
+    except ImportError:
+        pass
+    except Exception as e:
+        logging.debug(f"Compilazione BPF tramite Scapy non riuscita: {e}")
+
+    command = ["tcpdump", "-ddd", "-y", "EN10MB"] + (["-i", interface] if interface else []) + [expression]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        raise OSError(f"Impossibile compilare il filtro BPF '{expression}': {e}")
+
+    lines = output.split("\n")
+    count = int(lines[0])
+    return [tuple(int(value) for value in line.split()) for line in lines[1:count + 1]]
+
+
+def attach_filter(sock, instructions):
+    """
+    Collega un programma BPF classico a un socket (SO_ATTACH_FILTER).
+    Un programma già presente viene sostituito atomicamente dal kernel.
+
+    Args:
+        sock (socket.socket): Socket di cattura.
+        instructions (list): Istruzioni (code, jt, jf, k).
+    """
+    program = ctypes.create_string_buffer(b"".join(_SOCK_FILTER.pack(*ins) for ins in instructions))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER,
+                    _SOCK_FPROG.pack(len(instructions), ctypes.addressof(program)))
+
+
+def detach_filter(sock):
+    """
+    Rimuove il programma BPF eventualmente collegato al socket.
+
+    Args:
+        sock (socket.socket): Socket di cattura.
+    """
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_DETACH_FILTER, 0)
+    except OSError:
+        pass
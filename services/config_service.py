@@ -1,18 +1,132 @@
+import bisect
+import functools
 import json
 import ipaddress
 import logging
 import os
 
 
+# Mappatura dei numeri di protocollo IP ai nomi utilizzati nelle regole
+PROTOCOL_NAMES = {
+    1: "ICMP",
+    6: "TCP",
+    17: "UDP",
+    58: "ICMPv6",
+    2: "IGMP",
+    3: "GGP",
+    4: "IP",
+    50: "ESP (Encapsulating Security Payload)",
+    51: "AH (Authentication Header)",
+    88: "EIGRP (Enhanced Interior Gateway Routing Protocol)",
+    89: "OSPF (Open Shortest Path First)",
+    132: "SCTP (Stream Control Transmission Protocol)"
+}
+
+
+class NetworkSet:
+    """
+    Insieme di reti IPv4/IPv6 nella sintassi di HOME_NET/EXTERNAL_NET, compilato in
+    intervalli interi disgiunti e ordinati per ciascuna famiglia.
+
+    La specifica è una lista di CIDR separati da virgole (o una lista JSON), eventualmente
+    tra parentesi quadre; "any" indica tutti gli indirizzi e "!" esclude una rete. L'insieme
+    è l'unione delle reti positive meno quella delle reti escluse; se ci sono solo esclusioni
+    si parte da tutti gli indirizzi. L'appartenenza costa una ricerca binaria sugli intervalli.
+    """
+
+    def __init__(self, spec=None):
+        """
+        :param spec: Specifica delle reti (stringa o lista), None per l'insieme vuoto.
+        :raises ValueError: Se una rete non è valida.
+        """
+        self.starts = {4: [], 6: []}
+        self.ends = {4: [], 6: []}
+        if spec is None:
+            return
+
+        entries = spec if isinstance(spec, list) else str(spec).strip().strip("[]").split(",")
+        included = {4: [], 6: []}
+        excluded = {4: [], 6: []}
+        for entry in entries:
+            entry = str(entry).strip()
+            if not entry:
+                continue
+            target = included
+            if entry.startswith("!"):
+                target, entry = excluded, entry[1:].strip()
+            if entry == "any":
+                networks = (ipaddress.ip_network("0.0.0.0/0"), ipaddress.ip_network("::/0"))
+            else:
+                networks = (ipaddress.ip_network(entry, strict=False),)
+            for network in networks:
+                target[network.version].append((int(network.network_address), int(network.broadcast_address)))
+
+        only_exclusions = not included[4] and not included[6]
+        for version, width in ((4, 32), (6, 128)):
+            ranges = included[version] or ([(0, (1 << width) - 1)] if only_exclusions else [])
+            for start, end in _subtract_ranges(_merge_ranges(ranges), _merge_ranges(excluded[version])):
+                self.starts[version].append(start)
+                self.ends[version].append(end)
+
+    def contains(self, version, address):
+        """
+        :param version: Versione IP (4 o 6).
+        :param address: Indirizzo come intero.
+        :return: True se l'indirizzo appartiene all'insieme.
+        """
+        starts = self.starts.get(version)
+        if not starts:
+            return False
+        index = bisect.bisect_right(starts, address) - 1
+        return index >= 0 and address <= self.ends[version][index]
+
+    def __bool__(self):
+        return bool(self.starts[4] or self.starts[6])
+
+
+def _merge_ranges(ranges):
+    """
+    Ordina e unisce intervalli sovrapposti o adiacenti.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _subtract_ranges(ranges, excluded):
+    """
+    Rimuove dagli intervalli (ordinati e disgiunti) quelli esclusi (ordinati e disgiunti).
+    """
+    result = []
+    for start, end in ranges:
+        for ex_start, ex_end in excluded:
+            if ex_end < start or ex_start > end:
+                continue
+            if ex_start > start:
+                result.append((start, ex_start - 1))
+            start = ex_end + 1
+            if start > end:
+                break
+        if start <= end:
+            result.append((start, end))
+    return result
+
+
 class ConfigService:
 
-    def __init__(self, config_dir="./configuration"):
+    def __init__(self, config_dir="./configuration", classification_cache_size=65536):
         """
         Inizializza il ConfigService e carica le configurazioni dalla directory specificata.
 
         :param config_dir: Directory contenente i file JSON di configurazione.
+        :param classification_cache_size: Numero massimo di indirizzi nella cache delle classificazioni.
         """
         self.config_dir = config_dir
+        self.classification_cache_size = classification_cache_size
         self.protocols = []
         self.settings = {}
         self._load_all_configs()
@@ -23,6 +137,7 @@ class ConfigService:
         """
         self.protocols = self._load_protocols()
         self.settings = self._load_settings()
+        self._compile_networks()
         logging.info("Tutte le configurazioni sono state caricate con successo.")
 
     def _load_protocols(self):
@@ -65,79 +180,63 @@ class ConfigService:
             logging.error(f"Errore imprevisto durante il caricamento dei settings: {e}")
         return {}
 
-    def is_in_home_net(self, ip):
+    def _compile_networks(self):
         """
-        Verifica se un IP appartiene alla rete HOME_NET.
+        Compila HOME_NET, EXTERNAL_NET e ALLOWLIST in tabelle di intervalli interi e azzera le
+        cache delle classificazioni. Va richiamato se i settings cambiano.
+        """
+        self.home_net = self._compile_network_setting("HOME_NET")
+        self.external_net = self._compile_network_setting("EXTERNAL_NET")
+        self.allowlist = self._compile_network_setting("ALLOWLIST", required=False)
+        self._has_allowlist = bool(self.allowlist)
+        self._classify_cached = functools.lru_cache(maxsize=self.classification_cache_size)(self._classify)
+        self._allowlisted_cached = functools.lru_cache(maxsize=self.classification_cache_size)(self.allowlist.contains)
 
-        :param ip: Indirizzo IP da verificare.
-        :return: True se l'IP è in HOME_NET, False altrimenti.
+    def _compile_network_setting(self, name, required=True):
         """
-        home_net = self.settings.get("HOME_NET")
-        if not home_net:
-            logging.warning("HOME_NET non configurata.")
-            return False
+        Compila un setting di rete; se assente o non valido restituisce un insieme vuoto.
 
+        :param name: Nome del setting (es. "HOME_NET").
+        :param required: Se True un setting assente viene segnalato nel log.
+        :return: NetworkSet compilato.
+        """
+        value = self.settings.get(name)
+        if not value:
+            if required:
+                logging.warning(f"{name} non configurata.")
+            return NetworkSet()
         try:
-            network = ipaddress.ip_network(home_net, strict=False)
-            result = ipaddress.ip_address(ip) in network
-            logging.debug(f"Verifica HOME_NET: {ip} in {home_net} -> {result}")
-            return result
+            return NetworkSet(value)
         except ValueError as e:
-            logging.error(f"Errore nel parsing di HOME_NET o IP: {e}")
-            return False
+            logging.error(f"Errore nel parsing di {name}: {e}")
+            return NetworkSet()
 
-    def is_in_external_net(self, ip):
-        """
-        Verifica se un IP appartiene a EXTERNAL_NET, supportando la negazione.
+    def _classify(self, version, address):
+        return self.home_net.contains(version, address), self.external_net.contains(version, address)
 
-        :param ip: Indirizzo IP da verificare.
-        :return: True se l'IP appartiene a EXTERNAL_NET, False altrimenti.
+    def classify(self, version, address):
         """
-        external_net = self.settings.get("EXTERNAL_NET")
-        if not external_net:
-            logging.warning("EXTERNAL_NET non configurata.")
-            return False
+        Classifica un indirizzo intero rispetto a HOME_NET ed EXTERNAL_NET, con cache LRU limitata.
 
-        result = ConfigService._check_external_net(ip, external_net)
-        logging.debug(f"Verifica EXTERNAL_NET: {ip} in {external_net} -> {result}")
-        return result
-
-
-    @staticmethod
-    def _check_external_net(ip, external_net_config):
+        :param version: Versione IP (4 o 6).
+        :param address: Indirizzo come intero.
+        :return: Tupla (in HOME_NET, in EXTERNAL_NET).
         """
-        Verifica se un indirizzo IP appartiene a EXTERNAL_NET con supporto per la negazione.
+        return self._classify_cached(version, address)
 
-        :param ip: Indirizzo IP da verificare.
-        :param external_net_config: Configurazione EXTERNAL_NET.
-        :return: True se l'IP appartiene a EXTERNAL_NET, False altrimenti.
+    def is_allowlisted(self, version, address):
         """
-        if not external_net_config:
-            logging.warning("EXTERNAL_NET non configurata.")
-            return False
-
-        try:
-            ip_obj = ipaddress.ip_address(ip)
-            rules = [rule.strip() for rule in external_net_config.split(",")]
-            excluded = []
-
-            for rule in rules:
-                if rule.startswith("!"):
-                    excluded.append(ipaddress.ip_network(rule[1:].strip(), strict=False))
-                else:
-                    network = ipaddress.ip_network(rule.strip(), strict=False)
-                    if ip_obj in network:
-                        return True
-
-            for excluded_network in excluded:
-                if ip_obj in excluded_network:
-                    return False
+        Verifica se un indirizzo intero appartiene ad ALLOWLIST (reti mai analizzate né bloccate),
+        con cache LRU limitata.
 
+        :param version: Versione IP (4 o 6).
+        :param address: Indirizzo come intero.
+        :return: True se l'indirizzo è in ALLOWLIST.
+        """
+        # Senza ALLOWLIST non si passa dalla cache: sorgenti sempre nuove la rinnoverebbero a ogni pacchetto
+        if not self._has_allowlist:
             return False
-
-        except ValueError as e:
-            logging.error(f"Errore nel parsing di EXTERNAL_NET o IP: {e}")
-            return False
+        return self._allowlisted_cached(version, address)
 
     def get_protocol_name(self, protocol):
         """
@@ -146,19 +245,4 @@ class ConfigService:
         :param protocol: Numero del protocollo.
         :return: Nome del protocollo come stringa.
         """
-        protocol_names = {
-            1: "ICMP",
-            6: "TCP",
-            17: "UDP",
-            58: "ICMPv6",
-            2: "IGMP",
-            3: "GGP",
-            4: "IP",
-            50: "ESP (Encapsulating Security Payload)",
-            51: "AH (Authentication Header)",
-            88: "EIGRP (Enhanced Interior Gateway Routing Protocol)",
-            89: "OSPF (Open Shortest Path First)",
-            132: "SCTP (Stream Control Transmission Protocol)"
-        }
-
-        return protocol_names.get(protocol, f"Unknown protocol {protocol}")
+        return PROTOCOL_NAMES.get(protocol, f"Unknown protocol {protocol}")
@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+
+BLOCK = "block"
+UNBLOCK = "unblock"
+
+# Operazione sul firewall in attesa: `submitted_at` è l'istante della prima richiesta (per la latenza)
+EnforcementAction = namedtuple("EnforcementAction", ["operation", "ip", "timeout", "submitted_at", "attempts", "not_before"])
+
+
+class EnforcementExecutor:
+    """
+    Esegue le azioni di enforcement (blocco e sblocco degli indirizzi) su un thread dedicato,
+    separato dal ciclo di analisi.
+
+    Le richieste vengono solo registrate in una tabella delle operazioni in attesa, indicizzata
+    per indirizzo: richieste ripetute per lo stesso IP (tipico durante un flood) vengono
+    fuse e prevale l'ultima operazione richiesta. Il thread preleva periodicamente la tabella
+    e applica le operazioni a lotti, con una chiamata al backend per tipo di operazione.
+    Le operazioni fallite vengono ritentate con attesa esponenziale fino a `max_retries` volte.
+
+    Chi invia le richieste (PacketAnalyzer o il collector del pool) non attende mai il firewall.
+
+    Attributi:
+        backend (FirewallBackend): Backend che applica le operazioni.
+        submitted (int): Richieste ricevute.
+        coalesced (int): Richieste fuse con un'operazione già in attesa per lo stesso IP.
+        rejected (int): Richieste scartate perché la tabella delle operazioni in attesa era piena.
+        applied (int): Operazioni applicate con successo.
+        retries (int): Tentativi ripetuti dopo un errore.
+        failed (int): Operazioni abbandonate dopo `max_retries` tentativi.
+    """
+
+    def __init__(self, backend, flush_interval=0.2, batch_size=1024, max_pending=100000, max_retries=3, retry_delay=0.5):
+        """
+        Args:
+            backend (FirewallBackend): Backend che applica le operazioni.
+            flush_interval (float): Intervallo massimo in secondi tra una richiesta e la sua applicazione.
+            batch_size (int): Numero massimo di operazioni applicate per ciclo.
+            max_pending (int): Numero massimo di indirizzi con operazioni in attesa.
+            max_retries (int): Tentativi massimi per un'operazione fallita.
+            retry_delay (float): Attesa in secondi prima del primo nuovo tentativo (raddoppia a ogni errore).
+        """
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        self._pending = {}  # IP -> EnforcementAction
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.applied = 0
+        self.retries = 0
+        self.failed = 0
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.call_histogram = None  # Se impostato (Histogram), riceve la durata di ogni chiamata al backend
+
+    def start(self):
+        """
+        Prepara il backend e avvia il thread di esecuzione.
+        """
+        try:
+            self.backend.setup()
+        except OSError as e:
+            logging.error(f"Inizializzazione del firewall {self.backend.name} non riuscita: {e}")
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="enforcement-executor", daemon=True)
+        self._thread.start()
+        logging.info(f"Enforcement attivo con backend {self.backend.name}.")
+
+    def stop(self, teardown=False):
+        """
+        Applica le operazioni in attesa (senza ulteriori tentativi) e arresta il thread.
+
+        Args:
+            teardown (bool): Se True rimuove anche le strutture del firewall.
+        """
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._execute(force=True)
+        if teardown:
+            try:
+                self.backend.teardown()
+            except OSError as e:
+                logging.error(f"Rimozione delle strutture del firewall non riuscita: {e}")
+        logging.info(f"Enforcement terminato. {self.stats()}")
+
+    @property
+    def expires_natively(self):
+        """
+        True se il backend rimuove da sé i blocchi scaduti (timeout dei set del kernel).
+        """
+        return self.backend.expires_natively
+
+    def block(self, ip, timeout=None):
+        """
+        Richiede il blocco di un indirizzo (non bloccante).
+
+        Args:
+            ip (str): Indirizzo da bloccare.
+            timeout (int|None): Durata del blocco in secondi.
+        """
+        self.submit(BLOCK, ip, timeout)
+
+    def unblock(self, ip):
+        """
+        Richiede lo sblocco di un indirizzo (non bloccante).
+        """
+        self.submit(UNBLOCK, ip)
+
+    def submit(self, operation, ip, timeout=None):
+        """
+        Registra un'operazione per un indirizzo, fondendola con quella eventualmente in attesa.
+
+        Args:
+            operation (str): BLOCK oppure UNBLOCK.
+            ip (str): Indirizzo interessato.
+            timeout (int|None): Durata del blocco in secondi (solo per BLOCK).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.submitted += 1
+            previous = self._pending.get(ip)
+            if previous is not None:
+                self.coalesced += 1
+                if previous.operation == operation and previous.timeout == timeout and not previous.attempts:
+                    return
+                submitted_at = previous.submitted_at
+            elif len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                logging.error(f"Troppe operazioni di enforcement in attesa, {operation} per {ip} scartato.")
+                return
+            else:
+                submitted_at = now
+            self._pending[ip] = EnforcementAction(operation, ip, timeout, submitted_at, 0, 0.0)
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            # Breve attesa per raccogliere in un solo lotto le richieste arrivate insieme
+            if not self._stop_event.wait(min(self.flush_interval, 0.05)):
+                self._execute()
+
+    def _take_ready(self, force):
+        """
+        Estrae dalla tabella le operazioni pronte (al più `batch_size`, tutte se `force`).
+        """
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for ip, action in list(self._pending.items()):
+                if not force and (action.not_before > now or len(ready) >= self.batch_size):
+                    continue
+                ready.append(action)
+                del self._pending[ip]
+        return ready
+
+    def _execute(self, force=False):
+        """
+        Applica le operazioni pronte con una chiamata al backend per tipo di operazione
+        (i blocchi con timeout diversi viaggiano nello stesso lotto).
+        """
+        ready = self._take_ready(force)
+        if not ready:
+            return
+        groups = {}
+        for action in ready:
+            groups.setdefault(action.operation, []).append(action)
+
+        for operation, actions in groups.items():
+            ips = [action.ip for action in actions]
+            started = time.monotonic()
+            try:
+                if operation == BLOCK:
+                    self.backend.block_entries([(action.ip, action.timeout) for action in actions])
+                else:
+                    self.backend.unblock(ips)
+            except OSError as e:
+                logging.error(f"Operazione {operation} sul firewall non riuscita per {len(ips)} indirizzi: {e}")
+                self._reschedule(actions, give_up=force)
+                continue
+
+            done = time.monotonic()
+            if self.call_histogram is not None:
+                self.call_histogram.observe(done - started)
+            self.applied += len(actions)
+            for action in actions:
+                latency = done - action.submitted_at
+                self.latency_count += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+
+    def _reschedule(self, actions, give_up):
+        """
+        Riaccoda le operazioni fallite con attesa esponenziale, a meno che nel frattempo
+        sia arrivata una nuova richiesta per lo stesso indirizzo.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for action in actions:
+                attempts = action.attempts + 1
+                if give_up or attempts > self.max_retries:
+                    self.failed += 1
+                    logging.error(f"Operazione {action.operation} per {action.ip} abbandonata dopo {attempts} tentativi.")
+                    continue
+                if action.ip in self._pending:
+                    continue
+                self.retries += 1
+                self._pending[action.ip] = action._replace(
+                    attempts=attempts, not_before=now + self.retry_delay * 2 ** (attempts - 1)
+                )
+
+    def pending(self):
+        """
+        Returns:
+            int: Numero di indirizzi con operazioni in attesa.
+        """
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self):
+        """
+        Restituisce i contatori e la latenza (dalla richiesta all'applicazione) delle operazioni.
+
+        Returns:
+            dict: Contatori, latenza media e massima in secondi.
+        """
+        return {
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "applied": self.applied,
+            "retries": self.retries,
+            "failed": self.failed,
+            "pending": self.pending(),
+            "latency_avg": self.latency_total / self.latency_count if self.latency_count else 0.0,
+            "latency_max": self.latency_max,
+        }
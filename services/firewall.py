@@ -0,0 +1,341 @@
+import ipaddress
+import logging
+import subprocess
+
+
+NFT_TABLE = "defnet"
+IPSET_NAMES = {4: "defnet4", 6: "defnet6"}
+
+
+def _split_by_family(ips):
+    """
+    Divide gli indirizzi per famiglia scartando quelli non validi.
+
+    Returns:
+        dict: {4: [...], 6: [...]} con gli indirizzi in forma normalizzata.
+    """
+    families = {4: [], 6: []}
+    for version, (ip, _) in _entries_by_family((ip, None) for ip in ips):
+        families[version].append(ip)
+    return families
+
+
+def _entries_by_family(entries):
+    """
+    Normalizza coppie (indirizzo, timeout) scartando gli indirizzi non validi.
+
+    Returns:
+        list: Tuple (versione, (indirizzo normalizzato, timeout)).
+    """
+    result = []
+    for ip, timeout in entries:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            logging.error(f"Indirizzo non valido per il firewall: {ip}")
+            continue
+        result.append((address.version, (str(address), timeout)))
+    return result
+
+
+class FirewallBackend:
+    """
+    Interfaccia comune dei backend di enforcement.
+
+    Ogni metodo riceve un lotto di indirizzi e deve applicarlo con il minor numero
+    possibile di invocazioni dei comandi di sistema. I timeout sono in secondi
+    (None per un blocco senza scadenza).
+
+    Attributi:
+        expires_natively (bool): True se i blocchi con timeout vengono rimossi dal kernel alla
+            scadenza, senza bisogno di uno sblocco esplicito.
+    """
+
+    name = "base"
+    expires_natively = False
+
+    def setup(self):
+        """
+        Prepara le strutture del firewall (tabelle, set, regole di drop).
+        """
+
+    def teardown(self):
+        """
+        Rimuove tutte le strutture create da `setup`.
+        """
+
+    def block(self, ips, timeout=None):
+        """
+        Blocca un lotto di indirizzi.
+
+        Args:
+            ips (list): Indirizzi IP da bloccare.
+            timeout (int|None): Durata del blocco in secondi.
+        """
+        raise NotImplementedError
+
+    def block_entries(self, entries):
+        """
+        Blocca un lotto di indirizzi, ciascuno con il proprio timeout.
+        I backend che lo supportano lo applicano con una sola invocazione.
+
+        Args:
+            entries (list): Coppie (indirizzo, timeout in secondi o None).
+        """
+        by_timeout = {}
+        for ip, timeout in entries:
+            by_timeout.setdefault(timeout, []).append(ip)
+        for timeout, ips in by_timeout.items():
+            self.block(ips, timeout)
+
+    def unblock(self, ips):
+        """
+        Rimuove il blocco da un lotto di indirizzi.
+
+        Args:
+            ips (list): Indirizzi IP da sbloccare.
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Rimuove tutti i blocchi attivi.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _run(command, script=None):
+        """
+        Esegue un comando passando l'eventuale script su stdin.
+
+        Raises:
+            OSError: Se il comando non esiste o termina con errore.
+        """
+        try:
+            subprocess.run(command, input=script, capture_output=True, text=True, check=True, timeout=30)
+        except subprocess.CalledProcessError as e:
+            raise OSError(f"{' '.join(command)} terminato con codice {e.returncode}: {e.stderr.strip()}")
+        except (OSError, subprocess.SubprocessError) as e:
+            raise OSError(f"Impossibile eseguire {' '.join(command)}: {e}")
+
+
+class NftablesBackend(FirewallBackend):
+    """
+    Backend nftables: gli indirizzi bloccati sono elementi di due set (IPv4 e IPv6) con
+    supporto ai timeout, controllati da una sola regola per catena. Ogni lotto è applicato
+    in un'unica transazione `nft -f -`.
+    """
+
+    name = "nftables"
+    expires_natively = True
+
+    def __init__(self, table=NFT_TABLE):
+        self.table = table
+
+    def setup(self):
+        table = self.table
+        script = (
+            f"add table inet {table}\n"
+            f"delete table inet {table}\n"
+            f"table inet {table} {{\n"
+            f"  set blacklist4 {{ type ipv4_addr; flags timeout; }}\n"
+            f"  set blacklist6 {{ type ipv6_addr; flags timeout; }}\n"
+            f"  chain input {{ type filter hook input priority -10; policy accept;\n"
+            f"    ip saddr @blacklist4 drop\n"
+            f"    ip6 saddr @blacklist6 drop\n"
+            f"  }}\n"
+            f"  chain forward {{ type filter hook forward priority -10; policy accept;\n"
+            f"    ip saddr @blacklist4 drop\n"
+            f"    ip daddr @blacklist4 drop\n"
+            f"    ip6 saddr @blacklist6 drop\n"
+            f"    ip6 daddr @blacklist6 drop\n"
+            f"  }}\n"
+            f"  chain output {{ type filter hook output priority -10; policy accept;\n"
+            f"    ip daddr @blacklist4 drop\n"
+            f"    ip6 daddr @blacklist6 drop\n"
+            f"  }}\n"
+            f"}}\n"
+        )
+        self._run(["nft", "-f", "-"], script)
+
+    def teardown(self):
+        self._run(["nft", "delete", "table", "inet", self.table])
+
+    def block(self, ips, timeout=None):
+        self.block_entries([(ip, timeout) for ip in ips])
+
+    def block_entries(self, entries):
+        elements = {4: [], 6: []}
+        for version, (ip, timeout) in _entries_by_family(entries):
+            elements[version].append(f"{ip} timeout {int(timeout)}s" if timeout else ip)
+        script = "".join(
+            f"add element inet {self.table} blacklist{version} {{ {', '.join(items)} }}\n"
+            for version, items in elements.items() if items
+        )
+        if script:
+            self._run(["nft", "-f", "-"], script)
+
+    def unblock(self, ips):
+        families = _split_by_family(ips)
+        script = "".join(
+            f"delete element inet {self.table} blacklist{version} {{ {', '.join(addresses)} }}\n"
+            for version, addresses in families.items() if addresses
+        )
+        if not script:
+            return
+        try:
+            self._run(["nft", "-f", "-"], script)
+        except OSError:
+            # La transazione fallisce se un elemento è già scaduto: si riprova un indirizzo alla volta
+            for version, addresses in families.items():
+                for ip in addresses:
+                    try:
+                        self._run(["nft", "delete", "element", "inet", self.table, f"blacklist{version}", f"{{ {ip} }}"])
+                    except OSError as e:
+                        logging.debug(f"Elemento {ip} non rimosso: {e}")
+
+    def flush(self):
+        self._run(["nft", "-f", "-"], f"flush set inet {self.table} blacklist4\nflush set inet {self.table} blacklist6\n")
+
+
+class IpsetBackend(FirewallBackend):
+    """
+    Backend ipset: gli indirizzi bloccati sono in due set hash:ip (IPv4 e IPv6) con timeout,
+    referenziati da una regola iptables/ip6tables per catena. Ogni lotto è applicato con
+    un solo `ipset restore`.
+    """
+
+    name = "ipset"
+    expires_natively = True
+
+    # (catena, direzione del match) per le regole di drop
+    CHAINS = (("INPUT", "src"), ("FORWARD", "src"), ("FORWARD", "dst"), ("OUTPUT", "dst"))
+
+    def setup(self):
+        self._run(["ipset", "restore", "-exist"], "".join(
+            f"create {name} hash:ip family {'inet' if version == 4 else 'inet6'} timeout 0\n"
+            for version, name in IPSET_NAMES.items()
+        ))
+        for version, name in IPSET_NAMES.items():
+            iptables = "iptables" if version == 4 else "ip6tables"
+            for chain, match in self.CHAINS:
+                rule = [chain, "-m", "set", "--match-set", name, match, "-j", "DROP"]
+                try:
+                    self._run([iptables, "-C"] + rule)
+                except OSError:
+                    self._run([iptables, "-I"] + rule)
+
+    def teardown(self):
+        for version, name in IPSET_NAMES.items():
+            iptables = "iptables" if version == 4 else "ip6tables"
+            for chain, match in self.CHAINS:
+                try:
+                    self._run([iptables, "-D", chain, "-m", "set", "--match-set", name, match, "-j", "DROP"])
+                except OSError as e:
+                    logging.debug(f"Regola {chain} per {name} non rimossa: {e}")
+            self._run(["ipset", "destroy", name])
+
+    def block(self, ips, timeout=None):
+        self.block_entries([(ip, timeout) for ip in ips])
+
+    def block_entries(self, entries):
+        script = "".join(
+            f"add {IPSET_NAMES[version]} {ip} timeout {int(timeout or 0)}\n"
+            for version, (ip, timeout) in _entries_by_family(entries)
+        )
+        if script:
+            self._run(["ipset", "restore", "-exist"], script)
+
+    def unblock(self, ips):
+        script = "".join(
+            f"del {IPSET_NAMES[version]} {ip}\n"
+            for version, addresses in _split_by_family(ips).items() for ip in addresses
+        )
+        if script:
+            self._run(["ipset", "restore", "-exist"], script)
+
+    def flush(self):
+        self._run(["ipset", "restore", "-exist"], "".join(f"flush {name}\n" for name in IPSET_NAMES.values()))
+
+
+class IptablesBackend(FirewallBackend):
+    """
+    Backend iptables classico: due regole DROP (INPUT e OUTPUT) per indirizzo.
+    Non supporta i timeout e produce catene lineari; resta per i sistemi senza nftables né ipset.
+    """
+
+    name = "iptables"
+
+    def __init__(self):
+        self.blocked = set()
+
+    def block(self, ips, timeout=None):
+        for version, addresses in _split_by_family(ips).items():
+            iptables = "iptables" if version == 4 else "ip6tables"
+            for ip in addresses:
+                if ip in self.blocked:
+                    continue
+                self._run([iptables, "-A", "INPUT", "-s", ip, "-j", "DROP"])
+                self._run([iptables, "-A", "OUTPUT", "-d", ip, "-j", "DROP"])
+                self.blocked.add(ip)
+
+    def unblock(self, ips):
+        for version, addresses in _split_by_family(ips).items():
+            iptables = "iptables" if version == 4 else "ip6tables"
+            for ip in addresses:
+                if ip not in self.blocked:
+                    continue
+                self.blocked.discard(ip)
+                for rule in (["INPUT", "-s", ip, "-j", "DROP"], ["OUTPUT", "-d", ip, "-j", "DROP"]):
+                    try:
+                        self._run([iptables, "-D"] + rule)
+                    except OSError as e:
+                        logging.debug(f"Regola per {ip} non rimossa: {e}")
+
+    def flush(self):
+        self.unblock(list(self.blocked))
+
+    def teardown(self):
+        self.flush()
+
+
+class DryRunBackend(FirewallBackend):
+    """
+    Backend che non modifica il firewall: registra i blocchi in memoria e nel log.
+    Utile per i test e per eseguire il servizio in sola rilevazione.
+
+    Attributi:
+        blocked (dict): Indirizzo -> timeout del blocco.
+        calls (list): Operazioni ricevute, come tuple (operazione, indirizzi).
+    """
+
+    name = "dry-run"
+
+    def __init__(self):
+        self.blocked = {}
+        self.calls = []
+
+    def block(self, ips, timeout=None):
+        self.calls.append(("block", list(ips)))
+        for ip in ips:
+            self.blocked[ip] = timeout
+        logging.info(f"[dry-run] Blocco di {len(ips)} indirizzi (timeout: {timeout}): {', '.join(ips)}")
+
+    def unblock(self, ips):
+        self.calls.append(("unblock", list(ips)))
+        for ip in ips:
+            self.blocked.pop(ip, None)
+        logging.info(f"[dry-run] Sblocco di {len(ips)} indirizzi: {', '.join(ips)}")
+
+    def flush(self):
+        self.calls.append(("flush", []))
+        self.blocked.clear()
+
+
+# Backend di enforcement selezionabili
+FIREWALL_BACKENDS = {
+    "nftables": NftablesBackend,
+    "ipset": IpsetBackend,
+    "iptables": IptablesBackend,
+    "dry-run": DryRunBackend,
+}
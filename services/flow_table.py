@@ -0,0 +1,269 @@
+from array import array
+from collections import OrderedDict
+
+from rules.flow_state import FLOW_CLOSED, FLOW_CLOSING, FLOW_ESTABLISHED, FLOW_NEW, FLOW_STATE_NAMES, flow_key
+
+
+_TCP = 6
+_FIN = 0x01
+_SYN = 0x02
+_RST = 0x04
+_ACK = 0x10
+
+
+class FlowTable:
+    """
+    Tabella delle connessioni (connection tracking) indicizzata per 5-tupla.
+
+    Ogni flusso occupa uno slot di array preallocati (stato, contatori di pacchetti e byte
+    per verso, istanti del primo e dell'ultimo pacchetto, scadenza): per flusso restano
+    in memoria solo la chiave e il numero di slot, e gli slot dei flussi scaduti vengono
+    riutilizzati. La chiave è simmetrica, quindi entrambi i versi aggiornano lo stesso
+    flusso; il verso "originale" è quello del primo pacchetto visto.
+
+    Per TCP lo stato segue l'handshake e la chiusura (SYN, FIN, RST); per gli altri
+    protocolli un flusso diventa ESTABLISHED alla prima risposta. I flussi scadono dopo un
+    periodo di inattività che dipende dallo stato (`new_timeout`, `idle_timeout`,
+    `closed_timeout`). Le chiavi sono tenute in una coda per stato, in ordine di ultima
+    attività: nello stesso stato il timeout è unico, quindi l'ordine di attività coincide con
+    quello delle scadenze e la ricerca dei flussi scaduti esamina solo la testa di ogni coda
+    (una sola coda per tutti i flussi farebbe attendere i flussi nuovi o chiusi dietro uno
+    stabilito inattivo, fino a `idle_timeout`). Raggiunto `max_flows` viene rimosso, tra le
+    teste delle code, il flusso con la scadenza più vicina.
+
+    `rule_cache` offre a chi analizza i pacchetti due voci per flusso, una per verso
+    (indice `slot * 2 + from_low`), azzerate quando lo slot viene assegnato a un nuovo flusso.
+
+    Attributi:
+        max_flows (int): Numero massimo di flussi.
+        created (int): Flussi creati.
+        expired (int): Flussi rimossi per inattività.
+        evicted (int): Flussi rimossi per fare spazio a uno nuovo.
+    """
+
+    def __init__(self, max_flows=65536, idle_timeout=300.0, new_timeout=30.0, closed_timeout=10.0):
+        """
+        Args:
+            max_flows (int): Numero massimo di flussi.
+            idle_timeout (float): Inattività in secondi dopo cui scade un flusso stabilito.
+            new_timeout (float): Inattività in secondi dopo cui scade un flusso non stabilito.
+            closed_timeout (float): Secondi dopo l'ultimo pacchetto per i flussi in chiusura o chiusi.
+        """
+        self.max_flows = max_flows
+        self.timeouts = {
+            FLOW_NEW: new_timeout,
+            FLOW_ESTABLISHED: idle_timeout,
+            FLOW_CLOSING: closed_timeout,
+            FLOW_CLOSED: closed_timeout,
+        }
+
+        self.slots = {}  # chiave -> slot
+        self.queues = {state: OrderedDict() for state in self.timeouts}  # stato -> (chiave -> slot), in ordine di ultima attività
+        self.keys = [None] * max_flows
+        self.state = bytearray(max_flows)
+        self.fin = bytearray(max_flows)  # FIN visti: bit 1 verso originale, bit 2 risposta
+        self.origin = bytearray(max_flows)  # 1 se il verso originale va dall'estremo minore della chiave
+        self.packets_fwd = array("Q", bytes(8 * max_flows))
+        self.packets_rev = array("Q", bytes(8 * max_flows))
+        self.bytes_fwd = array("Q", bytes(8 * max_flows))
+        self.bytes_rev = array("Q", bytes(8 * max_flows))
+        self.first_seen = array("d", bytes(8 * max_flows))
+        self.last_seen = array("d", bytes(8 * max_flows))
+        self.deadline = array("d", bytes(8 * max_flows))
+        self.rule_cache = [None] * (2 * max_flows)  # Dati per verso del flusso riutilizzati dall'analyzer
+        self._free = list(range(max_flows - 1, -1, -1))
+
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def update(self, packet, key=None):
+        """
+        Registra un pacchetto nel suo flusso, creandolo se necessario, e ne aggiorna lo stato.
+
+        Args:
+            packet (PacketMeta): Il pacchetto.
+            key (tuple): Chiave del flusso, se già calcolata con flow_key.
+
+        Returns:
+            int: Lo slot del flusso.
+        """
+        if key is None:
+            key = flow_key(packet)
+        timestamp = packet.timestamp
+        flags = packet.tcp_flags if packet.protocol == _TCP else None
+        slots = self.slots
+        state = self.state
+        slot = slots.get(key)
+
+        if slot is not None:
+            expired = self.deadline[slot] <= timestamp
+            if expired or (flags is not None and state[slot] == FLOW_CLOSED and flags & (_SYN | _ACK) == _SYN):
+                # Flusso scaduto ma non ancora rimosso, o nuova connessione sulla 5-tupla di una già chiusa
+                self.expired += expired
+                self._remove(key, slot)
+                slot = None
+
+        if slot is None:
+            # La ricerca dei flussi scaduti avviene solo quando la tabella cresce
+            self._expire(timestamp, 2)
+            slot = self._create(key, packet, flags)
+        else:
+            forward = self.from_low(packet, key) == self.origin[slot]
+            if forward:
+                self.packets_fwd[slot] += 1
+                self.bytes_fwd[slot] += packet.length
+            else:
+                self.packets_rev[slot] += 1
+                self.bytes_rev[slot] += packet.length
+            current = state[slot]
+            if flags is None:
+                if current == FLOW_NEW and not forward:
+                    state[slot] = FLOW_ESTABLISHED
+            elif flags & (_FIN | _RST) or current == FLOW_NEW:
+                self._transition(slot, flags, forward)
+            if state[slot] == current:
+                self.queues[current].move_to_end(key)
+            else:
+                # Cambio di stato: il flusso passa in coda a quella del nuovo timeout
+                del self.queues[current][key]
+                self.queues[state[slot]][key] = slot
+
+        self.last_seen[slot] = timestamp
+        self.deadline[slot] = timestamp + self.timeouts[state[slot]]
+        return slot
+
+    @staticmethod
+    def from_low(packet, key):
+        """
+        True se il pacchetto proviene dall'estremo minore della chiave (cioè dal primo
+        indirizzo e porta di flow_key).
+        """
+        if key[1] != key[3]:
+            return packet.src_int == key[1]
+        return (packet.src_port or 0) == key[2]
+
+    def _create(self, key, packet, flags):
+        if not self._free:
+            self._remove(*self._next_deadline())
+            self.evicted += 1
+        slot = self._free.pop()
+        self.slots[key] = slot
+        self.keys[slot] = key
+        self.origin[slot] = self.from_low(packet, key)
+        self.fin[slot] = 0
+        self.packets_fwd[slot] = 1
+        self.bytes_fwd[slot] = packet.length
+        self.packets_rev[slot] = 0
+        self.bytes_rev[slot] = 0
+        self.first_seen[slot] = packet.timestamp
+        self.rule_cache[2 * slot] = self.rule_cache[2 * slot + 1] = None
+        if flags is None or flags & (_SYN | _ACK) == _SYN:
+            self.state[slot] = FLOW_NEW
+        elif flags & _RST:
+            self.state[slot] = FLOW_CLOSED
+        else:
+            # Connessione TCP già in corso all'avvio della cattura
+            self.state[slot] = FLOW_ESTABLISHED
+        self.queues[self.state[slot]][key] = slot
+        self.created += 1
+        return slot
+
+    def _transition(self, slot, flags, forward):
+        """
+        Aggiorna lo stato di un flusso TCP con i flag del pacchetto corrente.
+        """
+        state = self.state[slot]
+        if flags & _RST:
+            self.state[slot] = FLOW_CLOSED
+        elif flags & _FIN:
+            fin = self.fin[slot] | (1 if forward else 2)
+            self.fin[slot] = fin
+            self.state[slot] = FLOW_CLOSED if fin == 3 else FLOW_CLOSING
+        elif state == FLOW_NEW and flags & _ACK and not flags & _SYN and self.packets_rev[slot]:
+            # Terzo pacchetto dell'handshake (o qualunque ACK dopo una risposta)
+            self.state[slot] = FLOW_ESTABLISHED
+
+    def _remove(self, key, slot):
+        del self.slots[key]
+        del self.queues[self.state[slot]][key]
+        self.keys[slot] = None
+        self._free.append(slot)
+
+    def _next_deadline(self):
+        """
+        Restituisce (chiave, slot) del flusso con la scadenza più vicina, cercandolo tra le teste
+        delle code degli stati, oppure None se la tabella è vuota.
+        """
+        deadline = self.deadline
+        best = None
+        for queue in self.queues.values():
+            if queue:
+                head = next(iter(queue.items()))
+                if best is None or deadline[head[1]] < deadline[best[1]]:
+                    best = head
+        return best
+
+    def _expire(self, now, limit=None):
+        """
+        Rimuove i flussi scaduti in ordine di scadenza (al più `limit`).
+        """
+        removed = 0
+        while limit is None or removed < limit:
+            head = self._next_deadline()
+            if head is None or self.deadline[head[1]] > now:
+                break
+            self._remove(*head)
+            removed += 1
+        self.expired += removed
+        return removed
+
+    def expire(self, now):
+        """
+        Rimuove tutti i flussi scaduti.
+
+        Args:
+            now (float): Istante corrente.
+
+        Returns:
+            int: Numero di flussi rimossi.
+        """
+        return self._expire(now)
+
+    def lookup(self, packet):
+        """
+        Returns:
+            int|None: Lo slot del flusso del pacchetto, None se non è tracciato.
+        """
+        return self.slots.get(flow_key(packet))
+
+    def flow(self, slot):
+        """
+        Restituisce lo stato e i contatori di un flusso.
+
+        Args:
+            slot (int): Slot del flusso.
+
+        Returns:
+            dict: Chiave, stato, pacchetti e byte per verso, primo e ultimo pacchetto.
+        """
+        return {
+            "key": self.keys[slot],
+            "state": FLOW_STATE_NAMES[self.state[slot]],
+            "packets_fwd": self.packets_fwd[slot],
+            "packets_rev": self.packets_rev[slot],
+            "bytes_fwd": self.bytes_fwd[slot],
+            "bytes_rev": self.bytes_rev[slot],
+            "first_seen": self.first_seen[slot],
+            "last_seen": self.last_seen[slot],
+        }
+
+    def stats(self):
+        """
+        Returns:
+            dict: Numero di flussi attivi, creati, scaduti e rimossi per il limite.
+        """
+        return {"active": len(self.slots), "created": self.created, "expired": self.expired, "evicted": self.evicted}
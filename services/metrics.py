@@ -0,0 +1,265 @@
+import bisect
+import logging
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+# Limiti superiori (in secondi) dei bucket predefiniti degli istogrammi di latenza
+ANALYSIS_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2, 0.1)
+FIREWALL_BUCKETS = (1e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Histogram:
+    """
+    Istogramma cumulativo a bucket fissi, in stile Prometheus.
+
+    `observe` esegue una ricerca binaria sui limiti e due incrementi, senza lock: è pensato
+    per essere aggiornato da un solo thread (quello che misura), mentre la lettura per
+    l'esportazione copia i contatori e tollera un'osservazione in corso.
+
+    Attributi:
+        bounds (tuple): Limiti superiori dei bucket, crescenti (il bucket +Inf è implicito).
+        counts (list): Osservazioni per bucket (non cumulative; l'ultimo è +Inf).
+        sum (float): Somma dei valori osservati.
+        count (int): Numero di osservazioni.
+    """
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        """
+        Args:
+            bounds (tuple): Limiti superiori dei bucket, crescenti.
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Registra un'osservazione.
+
+        Args:
+            value (float): Valore osservato (es. una latenza in secondi).
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name):
+        counts = list(self.counts)
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += count
+            yield f"{name}_bucket", {"le": "+Inf" if bound == float("inf") else repr(float(bound))}, cumulative
+        yield f"{name}_sum", None, self.sum
+        yield f"{name}_count", None, cumulative
+
+
+class MetricsRegistry:
+    """
+    Registro delle metriche del servizio, esportate nel formato testuale di Prometheus.
+
+    Per non aggiungere lavoro al percorso dei pacchetti, contatori e gauge sono funzioni
+    lette solo al momento dell'esportazione: i componenti continuano a incrementare i propri
+    attributi interi (pacchetti catturati, scartati, ...) e il registro si limita a leggerli.
+    Le famiglie con etichette (es. occorrenze per rule_id) sono funzioni che restituiscono
+    un dizionario valore dell'etichetta -> valore. Gli istogrammi sono invece oggetti
+    aggiornati da chi misura (vedi Histogram).
+
+    Attributi:
+        metrics (list): Tuple (nome, tipo, descrizione, sorgente) in ordine di registrazione.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self._names = set()
+
+    def _register(self, name, kind, help_text, source):
+        if name in self._names:
+            raise ValueError(f"Metrica già registrata: {name}")
+        self._names.add(name)
+        self.metrics.append((name, kind, help_text, source))
+
+    def counter(self, name, help_text, function, label=None):
+        """
+        Registra un contatore letto da `function` all'esportazione.
+
+        Args:
+            name (str): Nome della metrica (con suffisso _total).
+            help_text (str): Descrizione.
+            function (callable): Restituisce il valore, oppure un dizionario etichetta -> valore se `label` è indicata.
+            label (str): Nome dell'etichetta per le famiglie di contatori.
+        """
+        self._register(name, "counter", help_text, (function, label))
+
+    def gauge(self, name, help_text, function, label=None):
+        """
+        Registra un gauge letto da `function` all'esportazione (stessi argomenti di counter).
+        """
+        self._register(name, "gauge", help_text, (function, label))
+
+    def histogram(self, name, help_text, bounds):
+        """
+        Crea e registra un istogramma.
+
+        Args:
+            name (str): Nome della metrica.
+            help_text (str): Descrizione.
+            bounds (tuple): Limiti superiori dei bucket.
+
+        Returns:
+            Histogram: L'istogramma da aggiornare con observe.
+        """
+        histogram = Histogram(bounds)
+        self._register(name, "histogram", help_text, histogram)
+        return histogram
+
+    def collect(self):
+        """
+        Legge tutte le metriche. Una sorgente che solleva un'eccezione viene omessa.
+
+        Yields:
+            tuple: (nome, tipo, descrizione, lista di campioni (nome, etichette, valore)).
+        """
+        for name, kind, help_text, source in self.metrics:
+            try:
+                if kind == "histogram":
+                    samples = list(source.samples(name))
+                else:
+                    function, label = source
+                    value = function()
+                    if label is None:
+                        samples = [(name, None, value)]
+                    else:
+                        samples = [(name, {label: key}, item) for key, item in sorted(value.items())]
+            except Exception as e:
+                logging.debug(f"Metrica {name} non disponibile: {e}")
+                continue
+            yield name, kind, help_text, samples
+
+    def render(self):
+        """
+        Returns:
+            str: Tutte le metriche nel formato testuale di Prometheus (versione 0.0.4).
+        """
+        lines = []
+        for name, kind, help_text, samples in self.collect():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _TCPMetricsServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _UnixMetricsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    server_name = "localhost"
+    server_port = 0
+
+
+class MetricsServer:
+    """
+    Espone un MetricsRegistry via HTTP (GET /metrics) su un indirizzo locale o su un socket unix.
+
+    Indirizzi accettati:
+        "9108" o ":9108"       porta TCP su 127.0.0.1
+        "host:porta"           indirizzo TCP esplicito
+        "unix:/percorso" o "/percorso"  socket unix (es. curl --unix-socket /percorso http://localhost/metrics)
+
+    Attributi:
+        address (str): Indirizzo richiesto.
+        registry (MetricsRegistry): Metriche esportate.
+    """
+
+    def __init__(self, registry, address):
+        """
+        Args:
+            registry (MetricsRegistry): Metriche da esportare.
+            address (str): Indirizzo di ascolto (vedi sopra).
+        """
+        self.registry = registry
+        self.address = address
+        self.socket_path = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """
+        Apre il socket di ascolto e avvia il thread che risponde alle richieste.
+
+        Raises:
+            OSError: Se l'indirizzo non può essere usato.
+            ValueError: Se l'indirizzo non è valido.
+        """
+        address = self.address
+        if address.startswith("unix:") or address.startswith("/"):
+            self.socket_path = address[5:] if address.startswith("unix:") else address
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)  # Socket rimasto da un'esecuzione precedente
+            server = _UnixMetricsServer(self.socket_path, _MetricsHandler)
+        else:
+            host, _, port = address.rpartition(":")
+            server = _TCPMetricsServer((host or "127.0.0.1", int(port)), _MetricsHandler)
+        server.registry = self.registry
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        logging.info(f"Metriche esportate su {address}.")
+
+    def stop(self):
+        """
+        Arresta il server e rimuove l'eventuale socket unix.
+        """
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
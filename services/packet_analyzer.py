@@ -1,16 +1,29 @@
-from collections import defaultdict
+from collections import namedtuple
 import logging
-import os
-from scapy.layers.inet import IP
-from scapy.layers.inet6 import IPv6
+import time
 from queue import Empty
-from rules.rule_manager import RuleManager
+from rules.flow_state import flow_key
 from rules.rule import Rule
+from rules.rule_compiler import DIRECTION_IN, DIRECTION_OUT, TRACK_KEYS, RuleCompiler
+from rules.threshold_tracker import ThresholdTracker
+from services.blacklist_store import BlacklistStore
+from services.flow_table import FlowTable
+from services.packet_decoder import describe_packet
 import ipaddress
 from services.config_service import ConfigService  # Importa ConfigService
 
+# Azione prodotta da una regola con la 5-tupla e l'istante del pacchetto; in modalità
+# multi-processo viene inviata al processo principale
+RuleEvent = namedtuple("RuleEvent", ["action", "rule_id", "description", "src",
+                                     "timestamp", "protocol", "src_port", "dst", "dst_port"])
+
+_root_logger = logging.getLogger()
+
+
 class PacketAnalyzer:
-    def __init__(self, packet_queue, rule_manager, config_dir="./configuration", home_net="192.168.145.0/24"):
+    def __init__(self, packet_queue, rule_manager, config_dir="./configuration", home_net="192.168.145.0/24", rules=None,
+                 max_threshold_entries=100000, blacklist=None, debug_sample_rate=1, alert_sink=None,
+                 alert_aggregator=None, flow_table=None):
         """
         Inizializza il PacketAnalyzer con una coda di pacchetti, RuleManager e configurazione.
 
@@ -19,83 +32,291 @@ class PacketAnalyzer:
             rule_manager (RuleManager): Oggetto RuleManager che gestisce i protocolli e le regole.
             config_dir (str): Directory per i file di configurazione JSON.
             home_net (str): Intervallo di IP per la rete locale (HOME_NET).
+            rules (list): Regole da compilare (default: tutte le regole del RuleManager).
+            max_threshold_entries (int): Numero massimo di contatori di threshold mantenuti in memoria.
+            blacklist (BlacklistStore): Blacklist con scadenze che inoltra i blocchi al firewall
+                                        (default: blacklist in memoria senza enforcement).
+            debug_sample_rate (int): Con il livello DEBUG attivo registra i dettagli di un pacchetto
+                                     ogni `debug_sample_rate` (default: 1, tutti i pacchetti).
+            alert_sink (AlertSink): Uscita strutturata delle allerte (default: allerte solo nel log).
+            alert_aggregator (AlertAggregator): Soppressione delle allerte ripetute per regola e sorgente
+                                                (default: tutte le allerte vengono riportate).
+            flow_table (FlowTable): Tabella delle connessioni aggiornata a ogni pacchetto
+                                    (default: tabella con i limiti predefiniti).
         """
         self.packet_queue = packet_queue
         self.rule_manager = rule_manager
         self.config_service = ConfigService(config_dir)  # Inizializza ConfigService
         self.home_net = ipaddress.IPv4Network(home_net)  # Converte l'IP in un oggetto di rete
-        self.packet_history = defaultdict(list)  # Crea un dizionario per la cronologia dei pacchetti
-        self.blacklist = set()  # Inizializza la blacklist
+        self.threshold_tracker = ThresholdTracker(max_threshold_entries)  # Contatori dei threshold per (regola, chiave di tracciamento)
+        self.blacklist = blacklist if blacklist is not None else BlacklistStore()  # Inizializza la blacklist
+        self.flow_table = flow_table if flow_table is not None else FlowTable()  # Stato e contatori per connessione
+        self.blocked_hits = 0  # Pacchetti scartati dal fast path perché la sorgente è in blacklist
+        self.allowed_hits = 0  # Pacchetti scartati dal fast path perché la sorgente è in ALLOWLIST
+        self.compiled_rules = RuleCompiler().compile(rules if rules is not None else rule_manager.get_all_rules())
+        self.ruleset_generation = 0  # Incrementata a ogni cambio di regole: invalida le regole candidate dei flussi
+        self.flow_cache_hits = 0
+        self.rule_events = 0  # Eventi prodotti dalle regole (allerte e blocchi), prima della soppressione
+        self.rule_hits = {}  # rule_id -> eventi prodotti dalla regola
+        self.latency_histogram = None  # Se impostato (Histogram), riceve la durata dell'analisi di ogni pacchetto
+        self.rule_profile = None  # rule_id -> [valutazioni, match, secondi]; None se la misura è disattivata
+        self.event_sink = None  # Se impostata, le azioni vengono inviate qui come RuleEvent invece di essere eseguite
+        self.alert_sink = alert_sink  # Se impostato, le allerte sono scritte come JSON dal suo thread invece che nel log
+        self.alert_aggregator = alert_aggregator  # Se impostato, le allerte ripetute sono riassunte periodicamente
+        self.debug_sample_rate = max(1, debug_sample_rate)  # Log di DEBUG per un pacchetto ogni N
+        self._debug_countdown = 1
 
     def analyze_packet(self, packet):
+        """
+        Analizza un pacchetto confrontandolo in un solo passaggio con il set di regole compilato.
+
+        Prima di qualsiasi lavoro sulle regole, un fast path scarta i pacchetti la cui sorgente
+        è già in blacklist (il verdetto è già stato applicato) o in ALLOWLIST, con una sola
+        ricerca in tabella hash ciascuno: durante un flood da sorgenti bloccate il costo per
+        pacchetto resta minimo.
+
+        Il pacchetto arriva già decodificato (PacketMeta): il CompiledRuleSet restituisce solo
+        le regole compatibili con protocollo, indirizzi, porte e flag, e la direzione del
+        pacchetto rispetto a HOME_NET/EXTERNAL_NET viene calcolata una sola volta per tutte
+        le regole candidate. Anche le chiavi dei threshold (sorgente, destinazione, ...) sono
+        calcolate una sola volta per pacchetto e condivise dalle regole con lo stesso "track".
+        La dissezione Scapy non avviene mai su questo percorso.
+
+        Ogni pacchetto analizzato aggiorna il proprio flusso nella FlowTable: le regole con
+        "flow_state" vengono valutate solo negli stati del flusso indicati e il threshold
+        con track "by_flow" conta i pacchetti per connessione.
+
+        La parte della valutazione che dipende solo dalla 5-tupla (regole candidate per
+        protocollo, indirizzi e porte, già filtrate per direzione) viene calcolata al primo
+        pacchetto di ciascun verso del flusso e conservata nella FlowTable insieme alla
+        generazione del set di regole: per i pacchetti successivi restano solo i controlli
+        dei flag, dello stato del flusso e dei threshold. Un cambio di regole incrementa
+        `ruleset_generation` e invalida tutte le voci.
+
+        Args:
+            packet (PacketMeta): I metadati del pacchetto da analizzare.
+        """
         try:
-            # Verifica la presenza di un layer IP (IPv4 o IPv6)
-            ip_layer = packet.getlayer(IP)
-            if ip_layer is None:
-                ip_layer = packet.getlayer(IPv6)
+            # Fast path: verdetto già noto per la sorgente
+            if packet.src in self.blacklist:
+                self.blocked_hits += 1
+                return
+            if self.config_service.is_allowlisted(packet.version, packet.src_int):
+                self.allowed_hits += 1
+                return
 
-            if ip_layer is None:
-                logging.warning(f"Pacchetto senza layer IP o IPv6: {packet.summary()}")
-                return  # Ignora pacchetto se non ha layer IP o IPv6
+            # I messaggi di DEBUG vengono costruiti solo se il pacchetto è selezionato per il log
+            debug = self._debug_enabled()
+
+            # Aggiorna il flusso del pacchetto (stato TCP e contatori)
+            flow_table = self.flow_table
+            key = flow_key(packet)
+            slot = flow_table.update(packet, key)
+            flow_state = flow_table.state[slot]
+
+            # Regole candidate per questo verso del flusso, calcolate al primo pacchetto
+            # (la generazione è letta prima delle regole: un cambio concorrente invalida la voce)
+            generation = self.ruleset_generation
+            cache_index = 2 * slot + flow_table.from_low(packet, key)
+            cached = flow_table.rule_cache[cache_index]
+            if cached is not None and cached[0] == generation:
+                candidates = cached[1]
+                self.flow_cache_hits += 1
+            else:
+                candidates = self._flow_candidates(packet, debug)
+                flow_table.rule_cache[cache_index] = (generation, candidates)
+            if not candidates:
+                return
 
-            # Log dettagliato per il protocollo
-            if isinstance(ip_layer, IP):
-                protocol = ip_layer.proto  # protocollo per IPv4
-            elif isinstance(ip_layer, IPv6):
-                protocol = ip_layer.nh  # protocollo per IPv6
+            rules = self.compiled_rules.filter_flags(candidates, packet.tcp_flags)
+            if debug:
+                logging.debug("Regole candidate per il pacchetto: %s", rules)
+            if self.rule_profile is not None:
+                self._evaluate_profiled(rules, packet, key, flow_state)
+                return
 
-            logging.debug(f"Protocollo del pacchetto: {protocol}")
+            ip_src = packet.src
+            timestamp = packet.timestamp
+            track_keys = {"by_flow": key}
+            for compiled_rule in rules:
+                # Verifica lo stato del flusso
+                if not compiled_rule.flow_mask & flow_state:
+                    if debug:
+                        logging.debug("Stato del flusso non corrispondente per la regola %s", compiled_rule.rule_id)
+                    continue
+
+                track_key = track_keys.get(compiled_rule.track)
+                if track_key is None:
+                    track_key = track_keys[compiled_rule.track] = TRACK_KEYS[compiled_rule.track](packet)
+
+                # Procedi ad applicare la regola se il threshold è superato
+                if Rule.check_threshold(compiled_rule.rule, track_key, self.threshold_tracker, timestamp):
+                    self.apply_rule(compiled_rule.rule, packet, ip_src)
+                elif debug:
+                    logging.debug("Threshold non superato per la regola %s", compiled_rule.rule_id)
 
-            # Mappatura numeri di protocollo ai nomi
-            protocol_name = self._map_protocol(protocol=protocol)
+        except Exception as e:
+            logging.error(f"Errore durante l'analisi del pacchetto: {e}")
 
-            logging.debug(f"Protocollo del pacchetto identificato: {protocol_name}")
+    def _flow_candidates(self, packet, debug):
+        """
+        Calcola le regole compatibili con la 5-tupla del pacchetto e con la sua direzione
+        rispetto a HOME_NET/EXTERNAL_NET (senza il filtro dei flag TCP).
 
-            # Cerca le regole per il protocollo
-            if isinstance(self.rule_manager, RuleManager):
-                rules = self.rule_manager.get_matching_rules(protocol_name, ip_layer.src)
-            else:
-                logging.error("Il RuleManager non è stato inizializzato correttamente.")
-                return
+        Args:
+            packet (PacketMeta): Il primo pacchetto di un verso del flusso.
+            debug (bool): True se il pacchetto è selezionato per il log di DEBUG.
 
-            if not rules:
-                logging.debug(f"Nessuna regola trovata per il pacchetto con protocollo {protocol_name} e IP {ip_layer.src}.")
-                return
-            
+        Returns:
+            list: Le CompiledRule candidate per tutti i pacchetti di questo verso del flusso.
+        """
+        # Mappatura numeri di protocollo ai nomi
+        protocol_name = self._map_protocol(protocol=packet.protocol)
+        if debug:
+            logging.debug("Protocollo del pacchetto identificato: %s", protocol_name)
+
+        candidates = self.compiled_rules.match_tuple(protocol_name, packet)
+        if not candidates:
+            if debug:
+                logging.debug("Nessuna regola trovata per il pacchetto con protocollo %s e IP %s.", protocol_name, packet.src)
+            return candidates
+
+        packet_direction = self.packet_direction(packet)
+        if not packet_direction:
+            if debug:
+                logging.debug("Il pacchetto %s -> %s non attraversa HOME_NET/EXTERNAL_NET.", packet.src, packet.dst)
+            return []
+
+        matching = [rule for rule in candidates if rule.direction_mask & packet_direction]
+        if debug and len(matching) < len(candidates):
+            logging.debug("Regole scartate per direzione: %s", [rule.rule_id for rule in candidates if rule not in matching])
+        return matching
+
+    def _evaluate_profiled(self, rules, packet, key, flow_state):
+        """
+        Valuta le regole candidate come analyze_packet, registrando per ciascuna il numero di
+        valutazioni, di match (threshold superato) e il tempo cumulativo. Usato solo quando
+        la misura per regola è attiva, così il ciclo normale non ne paga il costo.
+        """
+        profile = self.rule_profile
+        clock = time.perf_counter
+        timestamp = packet.timestamp
+        track_keys = {"by_flow": key}
+        for compiled_rule in rules:
+            started = clock()
+            entry = profile.get(compiled_rule.rule_id)
+            if entry is None:
+                entry = profile[compiled_rule.rule_id] = [0, 0, 0.0]
+            entry[0] += 1
+            if compiled_rule.flow_mask & flow_state:
+                track_key = track_keys.get(compiled_rule.track)
+                if track_key is None:
+                    track_key = track_keys[compiled_rule.track] = TRACK_KEYS[compiled_rule.track](packet)
+                if Rule.check_threshold(compiled_rule.rule, track_key, self.threshold_tracker, timestamp):
+                    entry[1] += 1
+                    self.apply_rule(compiled_rule.rule, packet, packet.src)
+            entry[2] += clock() - started
+
+    def enable_rule_profile(self, enabled=True):
+        """
+        Attiva (azzerando i contatori) o disattiva la misura del costo di ciascuna regola.
 
-            logging.debug(f"Voglio visualizzare tutte le regole che ci sono : {rules}")
+        Args:
+            enabled (bool): True per attivare la misura.
+        """
+        self.rule_profile = {} if enabled else None
 
-            # Applica le regole trovate
-            for rule in rules:
-                logging.debug(f"Controllando la regola: {rule} per pacchetto: {packet.summary()}")
+    def rule_profile_report(self, limit=None):
+        """
+        Restituisce il costo misurato delle regole, dalla più costosa.
 
-                # Verifica la direzione del pacchetto
-                if not self.check_direction(rule, ip_layer.src, ip_layer.dst):
-                    logging.debug(f"Direzione non corrispondente per la regola {rule} con il pacchetto {packet.summary()}")
-                    continue  # Ignora pacchetto se la direzione non corrisponde alla regola
-                else:
-                    logging.debug(f"Direzione corrispondente per la regola {rule} con il pacchetto {packet.summary()}")
-
-                # Procedi a verificare e applicare la regola se c'è una corrispondenza
-                if Rule.match_rule(rule, packet, self.packet_history):
-                    # Verifica se l'IP rientra in HOME_NET o EXTERNAL_NET
-                    if self.is_home_net(ip_layer.src) and rule.src_ip != "any":
-                        logging.debug(f"Pacchetto {packet.summary()} corrisponde a HOME_NET.")
-                        self.apply_rule(rule, packet, ip_layer.src)
-                    
-                    elif self.is_external_net(ip_layer.src) and rule.src_ip != "any":
-                        logging.debug(f"Pacchetto {packet.summary()} corrisponde a EXTERNAL_NET.")
-                        self.apply_rule(rule, packet, ip_layer.src)
-
-                    elif rule.src_ip == "any":
-                        logging.debug(f"Regola applicata senza filtro per src_ip ('any') in {packet.summary()}")
-                        self.apply_rule(rule, packet, ip_layer.src)
-                
-                else:
-                    logging.debug(f"Nessun match per la regola {rule} con il pacchetto {packet.summary()}")
+        Args:
+            limit (int): Numero massimo di regole restituite (None per tutte).
 
-        except Exception as e:
-            logging.error(f"Errore durante l'analisi del pacchetto: {e}")
+        Returns:
+            list: Tuple (rule_id, valutazioni, match, secondi cumulativi); vuota se la misura è disattivata.
+        """
+        profile = self.rule_profile
+        if not profile:
+            return []
+        report = sorted(((rule_id, *entry) for rule_id, entry in list(profile.items())),
+                        key=lambda item: item[3], reverse=True)
+        return report[:limit] if limit is not None else report
+
+    def set_rules(self, rules, compiled_rules=None, rule_manager=None):
+        """
+        Sostituisce il set di regole compilato e invalida le regole candidate memorizzate nei flussi.
+
+        Il cambio è atomico per l'analisi: ogni pacchetto viene valutato interamente con il
+        vecchio o con il nuovo set. Le regole con lo stesso rule_id e la stessa firma di una
+        regola attiva ne ereditano i contatori del threshold; quelle nuove o modificate
+        ricevono contatori nuovi (i vecchi scadono da soli nel ThresholdTracker).
+
+        Args:
+            rules (list): Le nuove regole.
+            compiled_rules (CompiledRuleSet): Le stesse regole già compilate (default: compilate qui).
+            rule_manager (RuleManager): RuleManager caricato con le nuove regole (default: invariato).
+
+        Returns:
+            int: Numero di regole invariate che conservano i contatori del threshold.
+        """
+        generation = self.ruleset_generation + 1
+        previous = {compiled_rule.rule_id: compiled_rule.rule for compiled_rule in self.compiled_rules.rules}
+        preserved = 0
+        for rule in rules:
+            old = previous.get(rule.rule_id)
+            if old is not None and old.signature() == rule.signature():
+                rule.threshold_id = old.threshold_id
+                preserved += 1
+            else:
+                rule.threshold_id = (rule.rule_id, generation)
+        if compiled_rules is None:
+            compiled_rules = RuleCompiler().compile(rules)
+
+        if rule_manager is not None:
+            self.rule_manager = rule_manager
+        # Le regole vanno sostituite prima di cambiare generazione (vedi analyze_packet)
+        self.compiled_rules = compiled_rules
+        self.ruleset_generation = generation
+        return preserved
+
+    def _debug_enabled(self):
+        """
+        Indica se registrare i messaggi di DEBUG per il pacchetto corrente: il livello DEBUG
+        deve essere attivo e, in modalità campionata, viene selezionato un pacchetto ogni
+        `debug_sample_rate`. Con DEBUG disattivato il costo è un solo controllo del livello.
+
+        Returns:
+            bool: True se il pacchetto corrente va registrato.
+        """
+        if not _root_logger.isEnabledFor(logging.DEBUG):
+            return False
+        self._debug_countdown -= 1
+        if self._debug_countdown > 0:
+            return False
+        self._debug_countdown = self.debug_sample_rate
+        return True
+
+    def packet_direction(self, packet):
+        """
+        Calcola la direzione del pacchetto rispetto a HOME_NET ed EXTERNAL_NET, usando le
+        reti precompilate e la cache delle classificazioni di ConfigService.
+
+        Args:
+            packet (PacketMeta): Il pacchetto.
+
+        Returns:
+            int: Combinazione di DIRECTION_IN e DIRECTION_OUT (0 se nessuna delle due).
+        """
+        classify = self.config_service.classify
+        src_home, src_external = classify(packet.version, packet.src_int)
+        dst_home, dst_external = classify(packet.version, packet.dst_int)
+        direction = 0
+        if src_external and dst_home:
+            direction |= DIRECTION_IN
+        if src_home and dst_external:
+            direction |= DIRECTION_OUT
+        return direction
 
 
     def apply_rule(self, rule, packet, ip_layer_src):
@@ -104,81 +325,95 @@ class PacketAnalyzer:
 
         Args:
             rule (Rule): La regola che è stata corrisposta al pacchetto.
-            packet: Il pacchetto che ha corrisposto alla regola.
+            packet (PacketMeta): Il pacchetto che ha corrisposto alla regola.
+            ip_layer_src (str): Indirizzo IP sorgente del pacchetto.
         """
-        if rule.action == "alert":
-            logging.warning(f"Allerta: {rule.description} per pacchetto {packet.summary()}")
+        event = RuleEvent(rule.action, rule.rule_id, rule.description, ip_layer_src, packet.timestamp,
+                          packet.protocol, packet.src_port, packet.dst, packet.dst_port)
+        if self.event_sink is not None:
+            self.event_sink.put(event)
+            if rule.action == "block":
+                # Il blocco è applicato dal processo principale: qui serve solo ad attivare il fast path
+                self.blacklist.add(ip_layer_src)
             return
-        elif rule.action == "block":
-            logging.info(f"Bloccato: {rule.description} per pacchetto {packet.summary()}")
-            self.add_to_blacklist(ip_layer_src)
-            return
-        else:
-            logging.debug(f"Regola applicata senza azione: {rule.description}")
+        self.handle_event(event)
 
-    def _map_protocol(self, protocol):
+    def handle_event(self, event):
         """
-        Mappa i numeri di protocollo ai nomi utilizzati nel sistema.
+        Esegue un RuleEvent. Con un AlertAggregator le occorrenze ripetute della stessa regola
+        per la stessa sorgente vengono solo contate (l'azione di blocco viene comunque eseguita).
+        Con un AlertSink l'allerta viene solo accodata per la scrittura strutturata (il blocco
+        resta immediato); altrimenti viene registrata nel log.
 
         Args:
-            protocol (int): Numero del protocollo.
-
-        Returns:
-            str: Nome del protocollo.
+            event (RuleEvent): L'evento prodotto da una regola.
         """
-        return self.config_service.get_protocol_name(protocol)
+        self.rule_events += 1
+        self.rule_hits[event.rule_id] = self.rule_hits.get(event.rule_id, 0) + 1
+        aggregator = self.alert_aggregator
+        if aggregator is not None:
+            self.flush_alerts(event.timestamp)
+            if not aggregator.submit(event):
+                if event.action == "block":
+                    self.add_to_blacklist(event.src)
+                return
 
-    def check_direction(self, rule, ip_src, ip_dst):
-        """
-        Verifica la direzione del pacchetto in base alla regola.
-        
-        Args:
-            rule (Rule): La regola che stiamo valutando.
-            ip_src (str): Indirizzo IP di origine del pacchetto.
-            ip_dst (str): Indirizzo IP di destinazione del pacchetto.
+        if self.alert_sink is not None:
+            self.alert_sink.emit(event)
+            if event.action == "block":
+                self.add_to_blacklist(event.src)
+            return
+        # Solo il log testuale richiede la descrizione del pacchetto: viene costruita qui e non per ogni evento
+        summary = describe_packet(event.protocol, event.src, event.src_port, event.dst, event.dst_port)
+        self.apply_action(event.action, event.description, summary, event.src)
 
-        Returns:
-            bool: True se la direzione della regola corrisponde al pacchetto, altrimenti False.
+    def flush_alerts(self, now=None):
         """
-        logging.debug(f"Verifica direzione per il pacchetto: {ip_src} -> {ip_dst}, direzione regola: {rule.direction}")
+        Chiude le finestre di soppressione scadute e riporta i riepiloghi delle allerte soppresse.
 
-        if rule.direction == "in":
-            if self.is_external_net(ip_src) and self.is_home_net(ip_dst):
-                logging.debug(f"Direzione 'in' corrisponde: {ip_src} è esterno, {ip_dst} è interno.")
-                return True
-            else:
-                logging.debug(f"Direzione 'in' non corrisponde: {ip_src} non è esterno o {ip_dst} non è interno.")
-            
-        elif rule.direction == "out":
-            if self.is_home_net(ip_src) and self.is_external_net(ip_dst):
-                logging.debug(f"Direzione 'out' corrisponde: {ip_src} è interno, {ip_dst} è esterno.")
-                return True
-            else:
-                logging.debug(f"Direzione 'out' non corrisponde: {ip_src} non è interno o {ip_dst} non è esterno.")
-            
-        elif rule.direction == "both":
-            if (self.is_home_net(ip_src) and self.is_external_net(ip_dst)) or \
-            (self.is_external_net(ip_src) and self.is_home_net(ip_dst)):
-                logging.debug(f"Direzione 'both' corrisponde: pacchetto da {ip_src} a {ip_dst}.")
-                return True
+        Args:
+            now (float): Istante corrente (None per chiudere tutte le finestre, ad esempio all'arresto).
+        """
+        if self.alert_aggregator is None:
+            return
+        for summary in self.alert_aggregator.expire(now):
+            if self.alert_sink is not None:
+                self.alert_sink.emit(summary)
             else:
-                logging.debug(f"Direzione 'both' non corrisponde per {ip_src} -> {ip_dst}.")
-        
-        logging.debug(f"Direzione non valida per {rule.direction} con pacchetto {ip_src} -> {ip_dst}.")
-        return False
-
+                logging.warning(f"Riepilogo: {summary.description} da {summary.src}: {summary.count} occorrenze "
+                                f"in {summary.last_seen - summary.first_seen:.1f} secondi")
 
-    def is_home_net(self, ip):
+    def apply_action(self, action, description, summary, ip_src):
         """
-        Verifica se l'IP è parte della rete HOME_NET.
+        Esegue l'azione di una regola (allerta o blocco della sorgente).
+
+        Args:
+            action (str): Azione della regola ("alert", "block").
+            description (str): Descrizione della regola.
+            summary (str): Descrizione sintetica del pacchetto.
+            ip_src (str): Indirizzo IP sorgente del pacchetto.
         """
-        return self.config_service.is_in_home_net(ip)
+        if action == "alert":
+            logging.warning(f"Allerta: {description} per pacchetto {summary}")
+            return
+        elif action == "block":
+            logging.info(f"Bloccato: {description} per pacchetto {summary}")
+            self.add_to_blacklist(ip_src)
+            return
+        else:
+            logging.debug(f"Regola applicata senza azione: {description}")
 
-    def is_external_net(self, ip):
+    def _map_protocol(self, protocol):
         """
-        Verifica se l'IP è parte della rete EXTERNAL_NET.
+        Mappa i numeri di protocollo ai nomi utilizzati nel sistema.
+
+        Args:
+            protocol (int): Numero del protocollo.
+
+        Returns:
+            str: Nome del protocollo.
         """
-        return self.config_service.is_in_external_net(ip)
+        return self.config_service.get_protocol_name(protocol)
 
     def start(self, stop_event):
         """
@@ -188,34 +423,51 @@ class PacketAnalyzer:
             stop_event (threading.Event): Un evento che segnala quando terminare il processo di analisi.
         """
         logging.info("Modulo di analisi avviato...")
+        latency = self.latency_histogram
         while not stop_event.is_set() or not self.packet_queue.empty():
             try:
                 packet = self.packet_queue.get(timeout=1)
-                self.analyze_packet(packet)
+                if latency is None:
+                    self.analyze_packet(packet)
+                else:
+                    started = time.perf_counter()
+                    self.analyze_packet(packet)
+                    latency.observe(time.perf_counter() - started)
             except Empty:
                 logging.debug("La coda è vuota, nessun pacchetto da elaborare.")
                 continue
             except Exception as e:
                 logging.error(f"Errore durante l'analisi del pacchetto: {e}")
                 continue
-        logging.info("Analyzer terminato.")
+        logging.info(f"Analyzer terminato. Fast path: {self.blocked_hits} pacchetti da sorgenti bloccate, {self.allowed_hits} da sorgenti in ALLOWLIST.")
+        logging.info(f"Flussi: {self.flow_table.stats()}, regole candidate riutilizzate per {self.flow_cache_hits} pacchetti.")
+        self.log_rule_profile()
+
+    def log_rule_profile(self, limit=10):
+        """
+        Registra nel log le regole più costose, se la misura per regola è attiva.
+
+        Args:
+            limit (int): Numero di regole riportate.
+        """
+        for rule_id, evaluations, matches, seconds in self.rule_profile_report(limit):
+            logging.info(f"Regola {rule_id}: {evaluations} valutazioni, {matches} match, "
+                         f"{seconds * 1e3:.1f} ms ({seconds / evaluations * 1e9:.0f} ns per valutazione)")
 
     def add_to_blacklist(self, ip):
         """
-        Aggiunge un indirizzo IP alla blacklist e blocca il traffico tramite iptables.
+        Aggiunge un indirizzo IP alla blacklist, che ne richiede il blocco al firewall.
+        Non attende l'applicazione del blocco.
         """
         if ip not in self.blacklist:
             self.blacklist.add(ip)
             logging.info(f"Aggiunto {ip} alla blacklist. Blocco attivo.")
-            os.system(f"sudo iptables -A INPUT -s {ip} -j DROP")
-            os.system(f"sudo iptables -A OUTPUT -d {ip} -j DROP")
 
     def clear_blacklist(self):
         """
-        Rimuove tutti gli IP dalla blacklist e pulisce le regole di iptables.
+        Rimuove tutti gli IP dalla blacklist e dal firewall. Lo snapshot su disco viene
+        conservato, così i blocchi ancora validi sono riapplicati al riavvio.
         """
         for ip in self.blacklist:
             logging.info(f"Rimuovendo {ip} dalla blacklist.")
-            os.system(f"sudo iptables -D INPUT -s {ip} -j DROP")
-            os.system(f"sudo iptables -D OUTPUT -d {ip} -j DROP")
         self.blacklist.clear()
@@ -0,0 +1,232 @@
+import socket
+import struct
+
+from services.config_service import PROTOCOL_NAMES
+
+
+# Tipi di link (valori DLT/LINKTYPE di libpcap) supportati dal decoder
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+VLAN_ETHERTYPES = (0x8100, 0x88A8, 0x9100)
+
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPPROTO_ICMPV6 = 58
+
+# Extension header IPv6 attraversati per raggiungere l'header di trasporto
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT_HEADER = 44
+IPV6_AUTH_HEADER = 51
+
+_IPV4_HEADER = struct.Struct("!BBHHHBBH4s4s")
+_IPV6_HEADER = struct.Struct("!IHBB16s16s")
+_PORTS = struct.Struct("!HH")
+_ETHERTYPE = struct.Struct("!H")
+
+
+class PacketMeta:
+    """
+    Metadati compatti di un pacchetto, estratti direttamente dai byte del frame.
+
+    Contiene solo ciò che serve alla pipeline di analisi (5-tupla, flag TCP, lunghezza);
+    la dissezione completa con Scapy viene eseguita solo se qualcuno accede a `packet`.
+
+    Attributi:
+        timestamp (float): Istante di cattura in secondi.
+        version (int): Versione IP (4 o 6).
+        protocol (int): Numero del protocollo di trasporto.
+        src (str): Indirizzo IP sorgente.
+        dst (str): Indirizzo IP di destinazione.
+        src_int (int): Indirizzo IP sorgente come intero.
+        dst_int (int): Indirizzo IP di destinazione come intero.
+        src_port (int|None): Porta sorgente (TCP/UDP).
+        dst_port (int|None): Porta di destinazione (TCP/UDP).
+        tcp_flags (int|None): Flag TCP come intero, None se il pacchetto non è TCP.
+        icmp_type (int|None): Tipo ICMP/ICMPv6.
+        icmp_code (int|None): Codice ICMP/ICMPv6.
+        length (int): Lunghezza del frame in byte.
+        linktype (int): Tipo di link del frame (LINKTYPE_*).
+        raw (bytes): Byte del frame, usati per la dissezione lazy.
+    """
+
+    __slots__ = ("timestamp", "version", "protocol", "src", "dst", "src_int", "dst_int",
+                 "src_port", "dst_port", "tcp_flags", "icmp_type", "icmp_code",
+                 "length", "linktype", "raw", "_packet")
+
+    def __init__(self, timestamp, version, protocol, src_int, dst_int, raw, linktype=LINKTYPE_ETHERNET):
+        family = socket.AF_INET if version == 4 else socket.AF_INET6
+        size = 4 if version == 4 else 16
+        self.timestamp = timestamp
+        self.version = version
+        self.protocol = protocol
+        self.src_int = src_int
+        self.dst_int = dst_int
+        self.src = socket.inet_ntop(family, src_int.to_bytes(size, "big"))
+        self.dst = socket.inet_ntop(family, dst_int.to_bytes(size, "big"))
+        self.src_port = None
+        self.dst_port = None
+        self.tcp_flags = None
+        self.icmp_type = None
+        self.icmp_code = None
+        self.length = len(raw)
+        self.linktype = linktype
+        self.raw = raw
+        self._packet = None
+
+    @property
+    def packet(self):
+        """
+        Pacchetto Scapy completamente dissezionato, costruito solo al primo accesso.
+        """
+        if self._packet is None:
+            from scapy.config import conf
+            from scapy.packet import Raw
+
+            layer = conf.l2types.num2layer.get(self.linktype, Raw)
+            self._packet = layer(self.raw)
+        return self._packet
+
+    def __getstate__(self):
+        # Il pacchetto Scapy eventualmente già costruito non viene serializzato
+        return tuple(None if slot == "_packet" else getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def summary(self):
+        """
+        Descrizione sintetica del pacchetto, senza ricorrere alla dissezione Scapy.
+        """
+        return describe_packet(self.protocol, self.src, self.src_port, self.dst, self.dst_port)
+
+    def __repr__(self):
+        return f"PacketMeta({self.summary()}, len={self.length})"
+
+
+def describe_packet(protocol, src, src_port, dst, dst_port):
+    """
+    Descrizione sintetica di un pacchetto a partire dalla 5-tupla (es. "TCP 10.0.0.1:1234 > 10.0.0.2:80").
+
+    Args:
+        protocol (int): Numero del protocollo.
+        src, dst (str): Indirizzi in forma testuale.
+        src_port, dst_port (int|None): Porte (None per i protocolli senza porte).
+
+    Returns:
+        str: La descrizione.
+    """
+    name = PROTOCOL_NAMES.get(protocol, str(protocol))
+    if src_port is None:
+        return f"{name} {src} > {dst}"
+    if ":" in src:
+        return f"{name} [{src}]:{src_port} > [{dst}]:{dst_port}"
+    return f"{name} {src}:{src_port} > {dst}:{dst_port}"
+
+
+def decode_frame(frame, timestamp, linktype=LINKTYPE_ETHERNET):
+    """
+    Decodifica gli header di un frame e costruisce il relativo PacketMeta.
+
+    Gli header sono letti con struct su una memoryview, senza copie intermedie;
+    sono supportati Ethernet (anche con tag VLAN), Linux cooked capture e IP raw,
+    IPv4/IPv6 (con extension header) e TCP/UDP/ICMP/ICMPv6.
+
+    Args:
+        frame (bytes): Byte del frame catturato.
+        timestamp (float): Istante di cattura.
+        linktype (int): Tipo di link del frame (LINKTYPE_*).
+
+    Returns:
+        PacketMeta|None: I metadati del pacchetto, o None se il frame non è IP o è troncato.
+    """
+    data = memoryview(frame)
+    try:
+        if linktype == LINKTYPE_ETHERNET:
+            ethertype = _ETHERTYPE.unpack_from(data, 12)[0]
+            offset = 14
+            while ethertype in VLAN_ETHERTYPES:
+                ethertype = _ETHERTYPE.unpack_from(data, offset + 2)[0]
+                offset += 4
+        elif linktype == LINKTYPE_LINUX_SLL:
+            ethertype = _ETHERTYPE.unpack_from(data, 14)[0]
+            offset = 16
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+            offset = 0
+            ethertype = ETH_P_IPV6 if data[0] >> 4 == 6 else ETH_P_IP
+        else:
+            return None
+
+        if ethertype == ETH_P_IP:
+            return _decode_ipv4(data, offset, frame, timestamp, linktype)
+        if ethertype == ETH_P_IPV6:
+            return _decode_ipv6(data, offset, frame, timestamp, linktype)
+    except (struct.error, IndexError):
+        pass
+    return None
+
+
+def _decode_ipv4(data, offset, frame, timestamp, linktype):
+    version_ihl, _, _, _, fragment, _, protocol, _, src, dst = _IPV4_HEADER.unpack_from(data, offset)
+    if version_ihl >> 4 != 4:
+        return None
+    meta = PacketMeta(timestamp, 4, protocol, int.from_bytes(src, "big"), int.from_bytes(dst, "big"),
+                      _as_bytes(frame), linktype)
+    # I frammenti successivi al primo non contengono l'header di trasporto
+    if fragment & 0x1FFF == 0:
+        _decode_transport(meta, data, offset + (version_ihl & 0x0F) * 4)
+    return meta
+
+
+def _decode_ipv6(data, offset, frame, timestamp, linktype):
+    version_class_flow, _, next_header, _, src, dst = _IPV6_HEADER.unpack_from(data, offset)
+    if version_class_flow >> 28 != 6:
+        return None
+
+    offset += 40
+    transport = True
+    while True:
+        if next_header in IPV6_EXTENSION_HEADERS:
+            next_header, header_length = data[offset], (data[offset + 1] + 1) * 8
+        elif next_header == IPV6_AUTH_HEADER:
+            next_header, header_length = data[offset], (data[offset + 1] + 2) * 4
+        elif next_header == IPV6_FRAGMENT_HEADER:
+            transport = _ETHERTYPE.unpack_from(data, offset + 2)[0] >> 3 == 0
+            next_header, header_length = data[offset], 8
+        else:
+            break
+        offset += header_length
+
+    meta = PacketMeta(timestamp, 6, next_header, int.from_bytes(src, "big"), int.from_bytes(dst, "big"),
+                      _as_bytes(frame), linktype)
+    if transport:
+        _decode_transport(meta, data, offset)
+    return meta
+
+
+def _decode_transport(meta, data, offset):
+    """
+    Completa il PacketMeta con i campi dell'header di trasporto, se presente e non troncato.
+    """
+    try:
+        protocol = meta.protocol
+        if protocol == IPPROTO_TCP:
+            meta.src_port, meta.dst_port = _PORTS.unpack_from(data, offset)
+            meta.tcp_flags = data[offset + 13]
+        elif protocol == IPPROTO_UDP:
+            meta.src_port, meta.dst_port = _PORTS.unpack_from(data, offset)
+        elif protocol == IPPROTO_ICMP or protocol == IPPROTO_ICMPV6:
+            meta.icmp_type, meta.icmp_code = data[offset], data[offset + 1]
+    except (struct.error, IndexError):
+        meta.src_port = meta.dst_port = meta.tcp_flags = None
+
+
+def _as_bytes(frame):
+    return frame if isinstance(frame, bytes) else bytes(frame)
@@ -1,6 +1,10 @@
-from scapy.all import sniff
+from scapy.config import conf
 import logging
-from queue import Queue
+import select
+import time
+from queue import Empty, Full, Queue
+
+from services.packet_decoder import LINKTYPE_ETHERNET, decode_frame
 
 class PacketSniffer:
     """
@@ -21,36 +25,109 @@ class PacketSniffer:
         """
         self.interface = interface
         self.packet_queue = packet_queue
+        self.captured_packets = 0  # Pacchetti IP catturati e consegnati a enqueue_packet
+        self.enqueued_packets = 0  # Pacchetti inseriti nella coda
         self.dropped_packets = 0  # Contatore per i pacchetti scartati
+        self.non_ip_packets = 0  # Contatore per i frame non IP ignorati
+        self.capture_filter = None  # Espressione BPF applicata al socket di cattura
+        self._filter_changed = False
 
     def start(self, stop_event):
         """
-        Avvia il processo di sniffing dei pacchetti. Il metodo cattura i pacchetti sulla rete 
-        utilizzando l'interfaccia specificata e li invia al metodo `enqueue_packet` per l'inserimento nella coda.
+        Avvia il processo di sniffing dei pacchetti. Il metodo legge i frame grezzi dal socket
+        di cattura di Scapy senza dissezionarli, ne estrae gli header con `decode_frame`
+        e invia i PacketMeta risultanti al metodo `enqueue_packet`.
 
         Args:
             stop_event (threading.Event): Un evento utilizzato per segnalare la terminazione del processo.
                 Lo sniffing si interrompe quando `stop_event` è impostato.
         """
         logging.debug(f"Avvio del packet sniffer su {self.interface}...")
-        while not stop_event.is_set():  # Continua fino a quando stop_event non è impostato
-            sniff(iface=self.interface, prn=self.enqueue_packet, store=False, timeout=0.1)
+        sock = self._open_socket()
+        try:
+            while not stop_event.is_set():  # Continua fino a quando stop_event non è impostato
+                if self._filter_changed:
+                    # Il filtro di Scapy si applica all'apertura: si riapre il socket una sola volta
+                    sock.close()
+                    sock = self._open_socket()
+                ready, _, _ = select.select([sock], [], [], 0.1)
+                if not ready:
+                    continue
+                layer, frame, timestamp = sock.recv_raw()
+                if not frame:
+                    continue
+                linktype = conf.l2types.layer2num.get(layer, LINKTYPE_ETHERNET)
+                packet = decode_frame(frame, timestamp or time.time(), linktype)
+                if packet is None:
+                    self.non_ip_packets += 1
+                    continue
+                self.enqueue_packet(packet)
+        finally:
+            sock.close()
         logging.debug("Sniffer terminato.")
 
+    def _open_socket(self):
+        """
+        Apre il socket di cattura di Scapy applicando il filtro BPF corrente, se presente.
+        Se il filtro non può essere compilato il socket viene aperto senza filtro.
+        """
+        self._filter_changed = False
+        if self.capture_filter:
+            try:
+                return conf.L2listen(iface=self.interface, filter=self.capture_filter)
+            except Exception as e:
+                logging.warning(f"Impossibile applicare il filtro BPF '{self.capture_filter}': {e}. Cattura senza filtro.")
+        return conf.L2listen(iface=self.interface)
+
+    def set_filter(self, expression):
+        """
+        Imposta il filtro BPF da applicare nel kernel al socket di cattura.
+
+        Args:
+            expression (str|None): Espressione pcap, oppure None per catturare tutto il traffico.
+        """
+        if expression == self.capture_filter:
+            return
+        self.capture_filter = expression
+        self._filter_changed = True
+        logging.info(f"Filtro di cattura aggiornato: {expression or 'nessuno'}")
+
     def enqueue_packet(self, packet):
         """
         Inserisce un pacchetto nella coda dei pacchetti se questa non è piena. Se la coda è piena,
         rimuove il pacchetto più vecchio (FIFO) per fare spazio al nuovo pacchetto.
 
         Args:
-            packet (scapy.packet.Packet): Il pacchetto catturato dallo sniffing.
+            packet (PacketMeta): I metadati del pacchetto catturato.
+        """
+        # Operazioni non bloccanti: con full() seguito da put() l'analyzer poteva svuotare o
+        # riempire la coda nel frattempo, bloccando lo sniffer su get() o put()
+        self.captured_packets += 1
+        try:
+            self.packet_queue.put_nowait(packet)
+            self.enqueued_packets += 1
+            return
+        except Full:
+            pass
+        # Rimuovi il pacchetto più vecchio (FIFO) per fare spazio a quello nuovo
+        try:
+            self.packet_queue.get_nowait()
+        except Empty:
+            pass
+        try:
+            self.packet_queue.put_nowait(packet)
+            self.enqueued_packets += 1
+        except Full:
+            pass
+        self.dropped_packets += 1
+        logging.warning(f"Coda piena, pacchetto scartato per fare spazio. Totale scartati: {self.dropped_packets}")
+
+    def enqueue_batch(self, packets):
         """
-        if not self.packet_queue.full():
-            self.packet_queue.put(packet)
-        else:
-            # Rimuovi il pacchetto più vecchio (FIFO) per fare spazio a quello nuovo
-            self.packet_queue.get()
-            self.packet_queue.put(packet)
-            self.dropped_packets += 1
-            logging.warning(f"Coda piena, pacchetto scartato per fare spazio. Totale scartati: {self.dropped_packets}")
+        Inserisce nella coda un lotto di pacchetti, applicando a ciascuno la stessa politica di `enqueue_packet`.
 
+        Args:
+            packets (list): Lista di PacketMeta catturati.
+        """
+        for packet in packets:
+            self.enqueue_packet(packet)
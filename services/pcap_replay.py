@@ -0,0 +1,280 @@
+import logging
+import mmap
+import struct
+import time
+from queue import Empty, Full, Queue
+
+from services.packet_decoder import decode_frame
+
+
+# Magic number dei file pcap classici (letti in little endian) e risoluzione dei timestamp
+_PCAP_MAGICS = {
+    0xA1B2C3D4: ("<", 1e-6),
+    0xD4C3B2A1: (">", 1e-6),
+    0xA1B23C4D: ("<", 1e-9),
+    0x4D3CB2A1: (">", 1e-9),
+}
+
+# Tipi di blocco pcapng
+_PCAPNG_SHB = 0x0A0D0D0A
+_PCAPNG_IDB = 0x00000001
+_PCAPNG_OPB = 0x00000002  # Packet Block (obsoleto)
+_PCAPNG_SPB = 0x00000003
+_PCAPNG_EPB = 0x00000006
+_PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+_OPT_IF_TSRESOL = 9
+
+
+class PcapReader:
+    """
+    Lettore di file pcap e pcapng mappati in memoria.
+
+    Il file non viene caricato per intero: viene mappato con mmap e i record vengono
+    letti in sequenza, copiando solo i byte di ciascun frame. Sono supportati i pcap
+    classici (timestamp in microsecondi o nanosecondi, in entrambi gli ordini dei byte) e
+    i pcapng con più interfacce (Enhanced, Simple e Packet Block; `if_tsresol` per la
+    risoluzione dei timestamp). Gli altri blocchi pcapng vengono ignorati.
+
+    Attributi:
+        path (str): Percorso del file.
+        format (str): "pcap" oppure "pcapng", determinato all'apertura.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Percorso del file pcap o pcapng.
+        """
+        self.path = path
+        self.format = None
+
+    def __iter__(self):
+        """
+        Itera sui frame del file.
+
+        Yields:
+            tuple: (timestamp in secondi, frame come bytes, linktype dell'interfaccia).
+
+        Raises:
+            ValueError: Se il file non è un pcap o pcapng valido.
+        """
+        with open(self.path, "rb") as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"File di cattura vuoto: {self.path}")
+        with data:
+            if len(data) < 12:
+                raise ValueError(f"File di cattura troppo corto: {self.path}")
+            magic = struct.unpack_from("<I", data, 0)[0]
+            if magic in _PCAP_MAGICS:
+                self.format = "pcap"
+                yield from self._read_pcap(data, *_PCAP_MAGICS[magic])
+            elif magic == _PCAPNG_SHB:
+                self.format = "pcapng"
+                yield from self._read_pcapng(data)
+            else:
+                raise ValueError(f"Formato di cattura non riconosciuto ({magic:#010x}): {self.path}")
+
+    def _read_pcap(self, data, order, resolution):
+        linktype = struct.unpack_from(order + "I", data, 20)[0] & 0x0FFFFFFF
+        record = struct.Struct(order + "IIII")
+        offset, end = 24, len(data)
+        while offset + 16 <= end:
+            seconds, fraction, caplen, _ = record.unpack_from(data, offset)
+            offset += 16
+            if offset + caplen > end:
+                logging.warning(f"Record troncato alla fine di {self.path}, lettura interrotta.")
+                return
+            yield seconds + fraction * resolution, data[offset:offset + caplen], linktype
+            offset += caplen
+
+    def _read_pcapng(self, data):
+        order = "<"
+        interfaces = []  # (linktype, risoluzione dei timestamp, snaplen) per interfaccia della sezione
+        timestamp = 0.0  # I Simple Packet Block non hanno timestamp: si usa quello del pacchetto precedente
+        offset, end = 0, len(data)
+        while offset + 12 <= end:
+            block_type = struct.unpack_from(order + "I", data, offset)[0]
+            if block_type == _PCAPNG_SHB:
+                # L'ordine dei byte è definito per sezione dal byte-order magic
+                order = "<" if struct.unpack_from("<I", data, offset + 8)[0] == _PCAPNG_BYTE_ORDER else ">"
+                interfaces = []
+            length = struct.unpack_from(order + "I", data, offset + 4)[0]
+            if length < 12 or offset + length > end:
+                logging.warning(f"Blocco pcapng non valido o troncato in {self.path}, lettura interrotta.")
+                return
+            body = offset + 8
+
+            if block_type == _PCAPNG_IDB:
+                linktype, _, snaplen = struct.unpack_from(order + "HHI", data, body)
+                resolution = self._tsresol(data, order, body + 8, offset + length - 4)
+                interfaces.append((linktype, resolution, snaplen))
+            elif block_type == _PCAPNG_EPB or block_type == _PCAPNG_OPB:
+                if block_type == _PCAPNG_EPB:
+                    interface, high, low, caplen, _ = struct.unpack_from(order + "IIIII", data, body)
+                else:
+                    interface, _, high, low, caplen, _ = struct.unpack_from(order + "HHIIII", data, body)
+                if interface < len(interfaces):
+                    linktype, resolution, _ = interfaces[interface]
+                    timestamp = ((high << 32) | low) * resolution
+                    start = body + 20
+                    yield timestamp, data[start:start + caplen], linktype
+            elif block_type == _PCAPNG_SPB and interfaces:
+                linktype, _, snaplen = interfaces[0]
+                caplen = length - 16
+                if snaplen:
+                    caplen = min(caplen, snaplen)
+                orig_len = struct.unpack_from(order + "I", data, body)[0]
+                caplen = min(caplen, orig_len)
+                start = body + 4
+                yield timestamp, data[start:start + caplen], linktype
+            offset += length
+
+    @staticmethod
+    def _tsresol(data, order, offset, end):
+        """
+        Legge l'opzione if_tsresol di un Interface Description Block (default: microsecondi).
+        """
+        while offset + 4 <= end:
+            code, length = struct.unpack_from(order + "HH", data, offset)
+            if code == 0:
+                break
+            if code == _OPT_IF_TSRESOL and length >= 1:
+                value = data[offset + 4]
+                return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+            offset += 4 + (length + 3) // 4 * 4
+        return 1e-6
+
+
+class PcapReplaySource:
+    """
+    Sorgente di pacchetti che riproduce un file pcap/pcapng al posto della cattura live.
+
+    Espone la stessa interfaccia dei packet sniffer (`start`, `set_filter`, contatori),
+    quindi i pacchetti attraversano la stessa pipeline (coda o pool, PacketAnalyzer). Ogni
+    pacchetto conserva il timestamp di cattura, per cui threshold, flussi e finestre delle
+    allerte seguono il tempo della cattura e non quello della riproduzione.
+
+    Con `speed` pari a 0 il file viene letto il più velocemente possibile: l'inserimento
+    nella coda è bloccante, così nessun pacchetto viene scartato e la velocità misurata è
+    quella dell'analisi. Con un AnalyzerPool come destinazione l'attesa avviene nel pool,
+    che va creato con `backpressure` (lo fa il ServiceManager per la riproduzione). Con `speed` maggiore di 0 viene rispettato il ritmo originale
+    (diviso per `speed`) e la coda piena scarta i pacchetti come nella cattura live.
+    Al termine del file viene impostato lo `stop_event`, così il servizio si arresta
+    dopo aver analizzato i pacchetti in coda.
+
+    Attributi:
+        interface (str): Il file riprodotto (al posto dell'interfaccia di rete).
+        packets_read (int): Frame letti dal file.
+        captured_packets (int): Pacchetti IP decodificati.
+        enqueued_packets (int): Pacchetti inseriti nella coda.
+        dropped_packets (int): Pacchetti scartati perché la coda era piena.
+        non_ip_packets (int): Frame non IP ignorati.
+        capture_start (float): Timestamp di cattura del primo frame.
+        capture_end (float): Timestamp di cattura dell'ultimo frame.
+    """
+
+    def __init__(self, path, packet_queue, speed=0.0):
+        """
+        Args:
+            path (str): File pcap o pcapng da riprodurre.
+            packet_queue (queue.Queue|AnalyzerPool): Destinazione dei pacchetti.
+            speed (float): 0 per la massima velocità, 1 per il ritmo originale, 2 per il doppio, ...
+        """
+        self.interface = path
+        self.packet_queue = packet_queue
+        self.speed = speed
+        self.capture_filter = None
+        self.packets_read = 0
+        self.captured_packets = 0
+        self.enqueued_packets = 0
+        self.dropped_packets = 0
+        self.non_ip_packets = 0
+        self.capture_start = None
+        self.capture_end = None
+
+    def start(self, stop_event):
+        """
+        Legge il file e inserisce i pacchetti nella coda fino alla fine del file o
+        all'impostazione di `stop_event`, che viene comunque impostato al termine.
+
+        Args:
+            stop_event (threading.Event): Evento che segnala la terminazione.
+        """
+        logging.info(f"Riproduzione di {self.interface} avviata (velocità: {self.speed or 'massima'}).")
+        wall_start = time.monotonic()
+        blocking = not self.speed and isinstance(self.packet_queue, Queue)
+        try:
+            for timestamp, frame, linktype in PcapReader(self.interface):
+                if stop_event.is_set():
+                    break
+                self.packets_read += 1
+                if self.capture_start is None:
+                    self.capture_start = timestamp
+                self.capture_end = timestamp
+                if self.speed:
+                    delay = (timestamp - self.capture_start) / self.speed - (time.monotonic() - wall_start)
+                    if delay > 0:
+                        stop_event.wait(delay)
+                packet = decode_frame(frame, timestamp, linktype)
+                if packet is None:
+                    self.non_ip_packets += 1
+                    continue
+                self.captured_packets += 1
+                if blocking:
+                    self._put_blocking(packet, stop_event)
+                else:
+                    self.enqueue_packet(packet)
+        except (OSError, ValueError) as e:
+            logging.error(f"Impossibile riprodurre {self.interface}: {e}")
+        finally:
+            flush = getattr(self.packet_queue, "flush", None)
+            if flush is not None:
+                flush()
+            stop_event.set()
+        logging.info(f"Riproduzione terminata: {self.packets_read} frame letti, {self.non_ip_packets} non IP, "
+                     f"{self.dropped_packets} scartati.")
+
+    def _put_blocking(self, packet, stop_event):
+        while not stop_event.is_set():
+            try:
+                self.packet_queue.put(packet, timeout=0.5)
+                self.enqueued_packets += 1
+                return
+            except Full:
+                continue
+
+    def enqueue_packet(self, packet):
+        """
+        Inserisce un pacchetto nella coda; se è piena scarta il più vecchio, come lo sniffer live.
+
+        Args:
+            packet (PacketMeta): Il pacchetto da analizzare.
+        """
+        try:
+            self.packet_queue.put_nowait(packet)
+            self.enqueued_packets += 1
+            return
+        except Full:
+            pass
+        try:
+            self.packet_queue.get_nowait()
+        except Empty:
+            pass
+        try:
+            self.packet_queue.put_nowait(packet)
+            self.enqueued_packets += 1
+        except Full:
+            pass
+        self.dropped_packets += 1
+
+    def set_filter(self, expression):
+        """
+        Memorizza il filtro BPF calcolato dalle regole. Nella riproduzione non viene
+        applicato: tutti i frame del file vengono analizzati.
+
+        Args:
+            expression (str|None): Espressione pcap.
+        """
+        self.capture_filter = expression
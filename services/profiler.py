@@ -0,0 +1,137 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Profiler a campionamento attivato su richiesta (es. con un segnale).
+
+    Quando non è attivo non esegue alcun lavoro: non installa hook di tracing né thread.
+    `trigger` avvia un thread che per `duration` secondi legge ogni `interval` secondi lo
+    stack corrente dei thread selezionati per nome (sys._current_frames) e conta gli stack
+    uguali. Al termine scrive un file con un riepilogo delle funzioni più campionate e gli
+    stack in formato "collapsed" (una riga `thread;funzione;...;funzione conteggio`, leggibile
+    da flamegraph.pl e speedscope). Il costo per i thread osservati è limitato alla lettura
+    dei loro frame da parte del thread del profiler.
+
+    Sono campionati solo i thread del processo corrente: con più worker di analisi il
+    profilo copre lo sniffer e il collector del pool.
+
+    Attributi:
+        output_prefix (str): Prefisso dei file dei profili (seguito da data e ora).
+        duration (float): Durata di un profilo in secondi.
+        interval (float): Intervallo tra due campioni in secondi.
+        thread_names (tuple): Nomi dei thread campionati.
+        last_output (str): Ultimo file scritto.
+    """
+
+    def __init__(self, output_prefix, duration=10.0, interval=0.005, thread_names=("sniffer", "analyzer"), report=None):
+        """
+        Args:
+            output_prefix (str): Prefisso dei file dei profili.
+            duration (float): Durata di un profilo in secondi.
+            interval (float): Intervallo tra due campioni in secondi.
+            thread_names (tuple): Nomi dei thread da campionare.
+            report (callable): Funzione opzionale che restituisce righe aggiuntive da
+                               includere nel file (es. il costo delle regole).
+        """
+        self.output_prefix = output_prefix
+        self.duration = duration
+        self.interval = interval
+        self.thread_names = tuple(thread_names)
+        self.report = report
+        self.last_output = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def trigger(self):
+        """
+        Avvia un profilo, se non ne è già in corso uno. Può essere chiamato da un gestore di segnale.
+
+        Returns:
+            bool: True se il profilo è stato avviato.
+        """
+        if self.running:
+            logging.info("Profilo già in corso, richiesta ignorata.")
+            return False
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """
+        Interrompe il profilo in corso, scrivendo comunque i campioni raccolti.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        logging.info(f"Profilo dei thread {', '.join(self.thread_names)} avviato per {self.duration} secondi.")
+        stacks = Counter()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + self.duration
+        while time.monotonic() < deadline and not self._stop_event.is_set():
+            threads = {thread.ident: thread.name for thread in threading.enumerate() if thread.name in self.thread_names}
+            frames = sys._current_frames()
+            for ident, name in threads.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[self._collapse(name, frame)] += 1
+            del frames
+            samples += 1
+            self._stop_event.wait(self.interval)
+        self._write(stacks, samples, time.monotonic() - started)
+
+    @staticmethod
+    def _collapse(name, frame):
+        """
+        Converte uno stack in una riga "collapsed": thread;funzione esterna;...;funzione corrente.
+        """
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        parts.append(name)
+        parts.reverse()
+        return ";".join(parts)
+
+    def _write(self, stacks, samples, elapsed):
+        path = f"{self.output_prefix}-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+        total = sum(stacks.values())
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+
+        lines = [f"# Profilo a campionamento: {samples} campioni in {elapsed:.1f} s "
+                 f"(intervallo {self.interval * 1e3:.1f} ms), thread: {', '.join(self.thread_names)}",
+                 "# Funzioni più campionate (tempo proprio):"]
+        for function, count in leaves.most_common(20):
+            lines.append(f"#   {count / total * 100 if total else 0:5.1f}%  {function}")
+        if self.report is not None:
+            try:
+                lines.extend(f"# {line}" for line in self.report())
+            except Exception as e:
+                logging.error(f"Impossibile includere il riepilogo nel profilo: {e}")
+        lines.extend(f"{stack} {count}" for stack, count in stacks.most_common())
+
+        try:
+            with open(path, "w") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logging.error(f"Impossibile scrivere il profilo in {path}: {e}")
+            return
+        self.last_output = path
+        logging.info(f"Profilo scritto in {path} ({samples} campioni).")
@@ -0,0 +1,114 @@
+import logging
+import os
+import threading
+
+from rules.rule_compiler import RuleCompiler
+from rules.rule_manager import RuleManager
+from rules.rule_parser import RuleParser
+
+
+class RuleReloader:
+    """
+    Ricarica le regole in background senza interrompere cattura e analisi.
+
+    Un ricaricamento viene richiesto con `request` (es. dal gestore di SIGHUP) oppure
+    rilevato controllando ogni `watch_interval` secondi la data di modifica del file delle
+    regole. Il thread del reloader legge il file in un nuovo RuleManager e compila le
+    regole fuori dal percorso dei pacchetti, poi passa il risultato ad `apply`, che lo
+    sostituisce a quello attivo. Se il file non è valido le regole correnti restano attive.
+
+    Attributi:
+        rules_config_file (str): File delle regole osservato.
+        protocol_config_file (str): File dei protocolli usato per il nuovo RuleManager.
+        watch_interval (float): Intervallo di controllo del file in secondi (0 per disattivarlo).
+        reloads (int): Ricaricamenti applicati.
+        failures (int): Ricaricamenti falliti.
+    """
+
+    def __init__(self, rules_config_file, protocol_config_file, apply, watch_interval=2.0):
+        """
+        Args:
+            rules_config_file (str): File delle regole.
+            protocol_config_file (str): File dei protocolli.
+            apply (callable): Chiamata come apply(rule_manager, rules, compiled_rules) con le nuove regole.
+            watch_interval (float): Intervallo di controllo del file in secondi (0 o None per disattivarlo).
+        """
+        self.rules_config_file = rules_config_file
+        self.protocol_config_file = protocol_config_file
+        self.apply = apply
+        self.watch_interval = watch_interval or None
+        self.reloads = 0
+        self.failures = 0
+        self._modified = self._file_version()
+        self._requested = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _file_version(self):
+        try:
+            stat = os.stat(self.rules_config_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def request(self):
+        """
+        Richiede un ricaricamento. Non blocca: può essere chiamato da un gestore di segnale.
+        """
+        self._requested.set()
+
+    def start(self):
+        """
+        Avvia il thread del reloader.
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="rule-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Arresta il thread del reloader, attendendo l'eventuale ricaricamento in corso.
+        """
+        self._stop_event.set()
+        self._requested.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            requested = self._requested.wait(self.watch_interval)
+            if self._stop_event.is_set():
+                break
+            if requested:
+                self._requested.clear()
+                self.reload()
+            elif self._file_version() != self._modified:
+                logging.info(f"Rilevata una modifica di {self.rules_config_file}.")
+                self.reload()
+
+    def reload(self):
+        """
+        Legge e compila le regole e le passa ad `apply`.
+
+        Returns:
+            bool: True se le nuove regole sono state applicate.
+        """
+        # La versione viene letta prima del parsing: una scrittura successiva provoca un nuovo ricaricamento
+        self._modified = self._file_version()
+        logging.info(f"Ricaricamento delle regole da {self.rules_config_file}...")
+        rule_manager = RuleManager(self.protocol_config_file)
+        parser = RuleParser(self.rules_config_file, rule_manager)
+        rules = parser.parse()
+        if parser.error is not None:
+            self.failures += 1
+            logging.error(f"Regole non ricaricate, restano attive quelle correnti: {parser.error}")
+            return False
+        try:
+            self.apply(rule_manager, rules, RuleCompiler().compile(rules))
+        except Exception as e:
+            self.failures += 1
+            logging.error(f"Errore durante l'applicazione delle nuove regole: {e}")
+            return False
+        self.reloads += 1
+        return True
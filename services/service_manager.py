@@ -1,17 +1,39 @@
 import signal
 import logging
+import time
 from threading import Thread, Event
 from queue import Queue
 
 from services.packet_sniffer import PacketSniffer
+from services.afpacket_sniffer import AFPacketSniffer
+from services.bpf_filter import build_filter_expression
 from services.packet_analyzer import PacketAnalyzer
+from services.analyzer_pool import AnalyzerPool, select_shard_key
+from services.pcap_replay import PcapReplaySource
+from services.alert_aggregator import AlertAggregator
+from services.alert_sink import AlertSink
+from services.blacklist_store import BlacklistStore
+from services.enforcement import EnforcementExecutor
+from services.firewall import FIREWALL_BACKENDS
+from services.metrics import ANALYSIS_BUCKETS, FIREWALL_BUCKETS, MetricsRegistry, MetricsServer
+from services.profiler import SamplingProfiler
+from services.rule_reloader import RuleReloader
+from services.shm_ring import DROP_NEWEST, DROP_OLDEST
 
 from rules.rule_manager import RuleManager
 from rules.rule_parser import RuleParser
 
-from core.utils import DEFAULT_PROTOCOL_CONFIG, DEFAULT_RULES_CONFIG
+from core.utils import (DEFAULT_ALERT_LOG, DEFAULT_BLACKLIST_SNAPSHOT, DEFAULT_PROFILE_OUTPUT, DEFAULT_PROTOCOL_CONFIG,
+                        DEFAULT_RULES_CONFIG)
 
 
+# Backend di cattura selezionabili
+CAPTURE_BACKENDS = {
+    "scapy": PacketSniffer,
+    "afpacket": AFPacketSniffer,
+    "pcap": PcapReplaySource,
+}
+
 
 class ServiceManager:
     """
@@ -26,13 +48,41 @@ class ServiceManager:
         analyzer (PacketAnalyzer): Componente per l'analisi dei pacchetti.
         stop_event (Event): Evento per coordinare l'arresto dei thread.
     """
-    def __init__(self, interface, rules_config_file=None, protocol_config_file=None):
+    def __init__(self, interface, rules_config_file=None, protocol_config_file=None, capture_backend="scapy", bpf_prefilter=True,
+                 workers=1, shard_by="auto", firewall_backend="nftables", block_timeout=3600, max_blocked=10000,
+                 blacklist_snapshot=None, debug_sample_rate=1, alert_log=None, alert_log_max_bytes=64 * 1024 * 1024,
+                 alert_window=60, replay_speed=0.0, metrics_address=None, rule_profile=False, profile_output=None,
+                 profile_duration=10.0, rules_watch_interval=2.0):
         """
         Inizializza il ServiceManager con l'interfaccia di rete e il file di configurazione delle regole.
 
         Args:
             interface (str): Interfaccia di rete su cui operare (es. eth0, wlan0).
             config_file (str): Percorso al file di configurazione delle regole (default: "config_rules.json").
+            capture_backend (str): Backend di cattura ("scapy", "afpacket" per il socket AF_PACKET con ring mmap
+                                   oppure "pcap" per riprodurre il file indicato in `interface`).
+            bpf_prefilter (bool): Se True applica al socket di cattura un filtro BPF derivato dalle regole.
+            workers (int): Numero di processi di analisi; con 1 l'analisi avviene in un thread del processo principale.
+            shard_by (str): Chiave di sharding dei pacchetti tra i worker ("src", "flow" oppure "auto":
+                            per flusso se una regola usa flow_state o track by_flow, altrimenti per sorgente).
+            firewall_backend (str): Backend di enforcement ("nftables", "ipset", "iptables" oppure "dry-run").
+            block_timeout (int): Durata dei blocchi in secondi (None o 0 per blocchi senza scadenza).
+            max_blocked (int): Numero massimo di indirizzi bloccati contemporaneamente.
+            blacklist_snapshot (str): File dello snapshot della blacklist, riapplicato all'avvio.
+            debug_sample_rate (int): Con il livello DEBUG attivo registra i dettagli di un pacchetto ogni N.
+            alert_log (str): File JSON-lines (formato EVE) delle allerte strutturate.
+            alert_log_max_bytes (int): Dimensione oltre la quale il file delle allerte viene ruotato.
+            alert_window (float): Finestra in secondi di soppressione delle allerte ripetute per regola
+                                  e sorgente (0 per riportare ogni allerta).
+            replay_speed (float): Con il backend "pcap", 0 per riprodurre il file alla massima velocità
+                                  oppure il fattore rispetto al ritmo originale (1 = tempo reale).
+            metrics_address (str): Indirizzo locale ("host:porta" o "unix:/percorso") su cui esportare
+                                   le metriche in formato Prometheus (None per non esportarle).
+            rule_profile (bool): Se True misura valutazioni, match e tempo cumulativo di ciascuna regola.
+            profile_output (str): Prefisso dei file scritti dal profiler a campionamento (attivato con SIGUSR1).
+            profile_duration (float): Durata in secondi di un profilo.
+            rules_watch_interval (float): Intervallo in secondi di controllo del file delle regole,
+                                          ricaricato quando cambia (0 per ricaricarlo solo con SIGHUP).
         """
         self.interface = interface
         
@@ -40,6 +90,14 @@ class ServiceManager:
         
         self.protocol_config_file = protocol_config_file or DEFAULT_PROTOCOL_CONFIG # File Path base per la configurazione dei protocolli 
 
+        self.bpf_prefilter = bpf_prefilter
+
+        # La riproduzione di un file non modifica il firewall né lo snapshot della blacklist
+        self.replay = capture_backend == "pcap"
+        if self.replay:
+            firewall_backend = "dry-run"
+        self.run_time = 0.0
+
         self.packet_queue = Queue(maxsize=2000)
         
         self.stop_event = Event()  # Evento per fermare i thread
@@ -59,17 +117,251 @@ class ServiceManager:
         rule_parser.parse()
         self.rules = rule_parser.rules
 
+        # Con più worker la coda dei pacchetti è sostituita dal pool, che li distribuisce per shard
+        self.analyzer_pool = None
+        if workers > 1:
+            # La riproduzione alla massima velocità attende i worker invece di sovrascrivere i pacchetti
+            backpressure = self.replay and not replay_speed
+            self.analyzer_pool = AnalyzerPool(
+                workers,
+                self.rules,
+                self.protocol_config_file,
+                event_handler=self.handle_rule_event,
+                config_dir="./configuration",
+                shard_by=select_shard_key(self.rules, shard_by),
+                debug_sample_rate=debug_sample_rate,
+                rule_profile=rule_profile,
+                block_timeout=block_timeout,
+                max_blocked=max_blocked,
+                drop_policy=DROP_NEWEST if backpressure else DROP_OLDEST,
+                backpressure=backpressure
+            )
+
         # Inizializza i componenti sniffer e analyzer con le regole caricate
-        self.sniffer = PacketSniffer(
+        if capture_backend not in CAPTURE_BACKENDS:
+            raise ValueError(f"Backend di cattura non supportato: {capture_backend}")
+        backend_options = {"speed": replay_speed} if self.replay else {}
+        self.sniffer = CAPTURE_BACKENDS[capture_backend](
             interface,
-            self.packet_queue
+            self.analyzer_pool or self.packet_queue,
+            **backend_options
         ) # Creaimo un'istanza del Packet Sniffer 
+        self.update_capture_filter(self.rules)
+
+        if firewall_backend not in FIREWALL_BACKENDS:
+            raise ValueError(f"Backend del firewall non supportato: {firewall_backend}")
+        self.enforcer = EnforcementExecutor(FIREWALL_BACKENDS[firewall_backend]())
+        self.blacklist = BlacklistStore(
+            self.enforcer,
+            default_ttl=block_timeout,
+            max_entries=max_blocked,
+            snapshot_path=None if self.replay else blacklist_snapshot or DEFAULT_BLACKLIST_SNAPSHOT
+        )
+
+        self.alert_sink = AlertSink(alert_log or DEFAULT_ALERT_LOG, max_bytes=alert_log_max_bytes)
+        self.alert_aggregator = AlertAggregator(alert_window) if alert_window else None
 
         self.analyzer = PacketAnalyzer(
             self.packet_queue,
             rule_manager,
-            config_dir="./configuration"
+            config_dir="./configuration",
+            rules=self.rules,
+            blacklist=self.blacklist,
+            debug_sample_rate=debug_sample_rate,
+            alert_sink=self.alert_sink,
+            alert_aggregator=self.alert_aggregator
         ) # Creiamo un'istanza del Packet Analyzer 
+        self.analyzer.enable_rule_profile(rule_profile)
+
+        # Profilo dei thread di cattura e analisi su richiesta (SIGUSR1); inattivo finché non richiesto
+        self.profiler = SamplingProfiler(
+            profile_output or DEFAULT_PROFILE_OUTPUT,
+            duration=profile_duration,
+            report=self.rule_profile_lines
+        )
+
+        # Ricaricamento delle regole senza riavvio (SIGHUP o modifica del file)
+        self.rule_reloader = RuleReloader(
+            self.rules_config_file,
+            self.protocol_config_file,
+            apply=self.apply_rules,
+            watch_interval=rules_watch_interval
+        )
+
+        self.metrics = None
+        self.metrics_server = None
+        if metrics_address:
+            self.metrics = self.register_metrics(MetricsRegistry())
+            self.metrics_server = MetricsServer(self.metrics, metrics_address)
+
+    def register_metrics(self, registry):
+        """
+        Registra le metriche dei componenti del servizio. Contatori e gauge leggono gli
+        attributi già mantenuti dai componenti; gli unici costi aggiunti sono gli istogrammi
+        della durata dell'analisi (con un solo worker) e delle chiamate al firewall.
+
+        Args:
+            registry (MetricsRegistry): Registro da popolare.
+
+        Returns:
+            MetricsRegistry: Il registro popolato.
+        """
+        sniffer, analyzer, pool = self.sniffer, self.analyzer, self.analyzer_pool
+
+        registry.counter("ids_packets_captured_total", "Pacchetti IP catturati.",
+                         lambda: sniffer.captured_packets)
+        registry.counter("ids_packets_non_ip_total", "Frame non IP ignorati dalla cattura.",
+                         lambda: sniffer.non_ip_packets)
+        registry.counter("ids_packets_enqueued_total", "Pacchetti inseriti nella coda di analisi.",
+                         lambda: sniffer.enqueued_packets)
+
+        def dropped():
+            stages = {"queue": sniffer.dropped_packets}
+            if pool is not None:
+                stages["pool"] = pool.dropped_packets
+            if hasattr(sniffer, "kernel_drops"):
+                stages["kernel"] = sniffer.kernel_drops
+            return stages
+        registry.counter("ids_packets_dropped_total", "Pacchetti scartati, per punto della pipeline.", dropped, label="stage")
+
+        if pool is not None:
+            registry.gauge("ids_packet_queue_depth", "Pacchetti in attesa di analisi nel ring dei worker.",
+                           lambda: pool.ring.stats()["occupancy"] if pool.ring is not None else 0)
+            registry.gauge("ids_packet_queue_capacity", "Capacità del ring dei worker.",
+                           lambda: pool.ring.capacity * pool.ring.lanes if pool.ring is not None else 0)
+        else:
+            registry.gauge("ids_packet_queue_depth", "Pacchetti in attesa di analisi nella coda.",
+                           self.packet_queue.qsize)
+            registry.gauge("ids_packet_queue_capacity", "Capacità della coda di analisi.",
+                           lambda: self.packet_queue.maxsize)
+            analyzer.latency_histogram = registry.histogram(
+                "ids_analysis_duration_seconds", "Durata dell'analisi di un pacchetto.", ANALYSIS_BUCKETS)
+
+        # Con il pool l'analisi avviene nei worker: i loro contatori arrivano ogni STATS_INTERVAL secondi
+        if pool is not None:
+            fast_path, flows = pool.fast_path_hits, pool.active_flows
+        else:
+            def fast_path():
+                return {"blocked": analyzer.blocked_hits, "allowed": analyzer.allowed_hits}
+
+            def flows():
+                return len(analyzer.flow_table)
+        registry.counter("ids_fast_path_packets_total", "Pacchetti scartati dal fast path, per verdetto.",
+                         fast_path, label="verdict")
+        registry.counter("ids_rule_hits_total", "Eventi prodotti da ciascuna regola (prima della soppressione).",
+                         lambda: dict(analyzer.rule_hits), label="rule_id")
+        if analyzer.rule_profile is not None:
+            def rule_profile(position):
+                return lambda: {entry[0]: entry[position] for entry in self.rule_profile_report()}
+            registry.counter("ids_rule_evaluations_total", "Valutazioni di ciascuna regola.", rule_profile(1), label="rule_id")
+            registry.counter("ids_rule_matches_total", "Valutazioni con threshold superato, per regola.", rule_profile(2), label="rule_id")
+            registry.counter("ids_rule_seconds_total", "Tempo cumulativo di valutazione di ciascuna regola.", rule_profile(3), label="rule_id")
+        registry.gauge("ids_rules_active", "Regole compilate attive.", lambda: len(analyzer.compiled_rules))
+        registry.counter("ids_rule_reloads_total", "Ricaricamenti delle regole, per esito.",
+                         lambda: {"ok": self.rule_reloader.reloads, "error": self.rule_reloader.failures},
+                         label="result")
+        registry.gauge("ids_flows_active", "Flussi nella tabella delle connessioni.", flows)
+        if self.alert_aggregator is not None:
+            registry.counter("ids_alerts_suppressed_total", "Allerte ripetute riassunte nei riepiloghi.",
+                             lambda: self.alert_aggregator.suppressed)
+        registry.counter("ids_alerts_written_total", "Allerte scritte nel file delle allerte.",
+                         lambda: self.alert_sink.written)
+        registry.counter("ids_alerts_dropped_total", "Allerte scartate perché la coda di scrittura era piena.",
+                         lambda: self.alert_sink.dropped)
+
+        registry.gauge("ids_blacklist_size", "Indirizzi attualmente bloccati.", lambda: len(self.blacklist))
+        registry.counter("ids_firewall_operations_total", "Operazioni sul firewall, per esito.",
+                         lambda: {"applied": self.enforcer.applied, "failed": self.enforcer.failed,
+                                  "retried": self.enforcer.retries, "rejected": self.enforcer.rejected},
+                         label="result")
+        registry.gauge("ids_firewall_pending", "Indirizzi con operazioni sul firewall in attesa.", self.enforcer.pending)
+        self.enforcer.call_histogram = registry.histogram(
+            "ids_firewall_call_duration_seconds", "Durata delle chiamate al backend del firewall.", FIREWALL_BUCKETS)
+        return registry
+
+    def update_capture_filter(self, rules):
+        """
+        Ricalcola il filtro BPF a partire dalle regole e lo applica al socket di cattura,
+        così il traffico che nessuna regola può selezionare viene scartato nel kernel.
+        Va richiamato ogni volta che le regole cambiano.
+
+        Args:
+            rules (list): Regole parsate attualmente attive.
+        """
+        if not self.bpf_prefilter:
+            return
+        expression = build_filter_expression(rules)
+        logging.info(f"Filtro BPF derivato dalle regole: {expression or 'nessuno (cattura completa)'}")
+        self.sniffer.set_filter(expression)
+
+    def apply_rules(self, rule_manager, rules, compiled_rules):
+        """
+        Sostituisce le regole attive con quelle ricaricate, senza fermare cattura e analisi.
+        Le regole invariate conservano i contatori del threshold; blacklist, flussi e
+        allerte in corso non vengono toccati.
+
+        Args:
+            rule_manager (RuleManager): RuleManager caricato con le nuove regole.
+            rules (list): Le nuove regole parsate.
+            compiled_rules (CompiledRuleSet): Le stesse regole già compilate.
+        """
+        preserved = self.analyzer.set_rules(rules, compiled_rules=compiled_rules, rule_manager=rule_manager)
+        if self.analyzer_pool is not None:
+            if self.analyzer_pool.shard_by == "src":
+                self.analyzer_pool.set_shard_by(select_shard_key(rules, "src"))
+            self.analyzer_pool.reload_rules(rules)
+        self.rules = rules
+        self.update_capture_filter(rules)
+        logging.info(f"Regole ricaricate: {len(compiled_rules)} attive, contatori del threshold conservati per {preserved}.")
+
+    def handle_reload_signal(self, signal, frame):
+        """
+        Richiede il ricaricamento delle regole (SIGHUP).
+        """
+        self.rule_reloader.request()
+
+    def handle_rule_event(self, event):
+        """
+        Esegue nel processo principale un'azione prodotta da un worker del pool di analisi,
+        così blacklist e regole del firewall restano centralizzate.
+
+        Args:
+            event (RuleEvent): L'azione da eseguire.
+        """
+        self.analyzer.handle_event(event)
+
+    def rule_profile_lines(self, limit=20):
+        """
+        Righe di riepilogo delle regole più costose, incluse nei file del profiler.
+
+        Returns:
+            list: Una riga per regola (vuota se la misura per regola è disattivata).
+        """
+        report = self.rule_profile_report(limit)
+        if not report:
+            return []
+        lines = ["Regole più costose (valutazioni, match, tempo cumulativo):"]
+        for rule_id, evaluations, matches, seconds in report:
+            lines.append(f"  regola {rule_id}: {evaluations} valutazioni, {matches} match, {seconds * 1e3:.1f} ms")
+        return lines
+
+    def rule_profile_report(self, limit=None):
+        """
+        Costo misurato delle regole: dei worker del pool (aggiornato ogni STATS_INTERVAL
+        secondi) oppure dell'analyzer del processo principale.
+
+        Returns:
+            list: Tuple (rule_id, valutazioni, match, secondi cumulativi), dalla regola più costosa.
+        """
+        if self.analyzer_pool is not None:
+            return self.analyzer_pool.rule_profile_report(limit)
+        return self.analyzer.rule_profile_report(limit)
+
+    def handle_profile_signal(self, signal, frame):
+        """
+        Avvia un profilo a campionamento dei thread di cattura e analisi (SIGUSR1).
+        """
+        self.profiler.trigger()
 
     def handle_termination_signal(self, signal, frame):
         """
@@ -80,7 +372,7 @@ class ServiceManager:
             frame (FrameType): Frame corrente (non utilizzato).
         """
         logging.debug("Ricevuto segnale di terminazione. Arresto del servizio...")
-        self.analyzer.clear_blacklist
+        # La blacklist viene svuotata da start() dopo l'arresto dei thread, non mentre l'analisi è in corso
         self.stop_event.set()  # Imposta l'evento per fermare i thread
 
     def start(self):
@@ -100,27 +392,87 @@ class ServiceManager:
         # Gestione dei segnali di terminazione
         signal.signal(signal.SIGTERM, self.handle_termination_signal)
         signal.signal(signal.SIGINT, self.handle_termination_signal)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.handle_profile_signal)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.handle_reload_signal)
 
-        # Avvio dei thread di sniffer e analisi
-        sniffer_thread = Thread(target=self.sniffer.start, args=(self.stop_event,))
-        analyzer_thread = Thread(target=self.analyzer.start, args=(self.stop_event,))
+        # Avvio dei thread di sniffer e analisi (o del pool di processi di analisi)
+        if self.analyzer_pool is not None:
+            self.analyzer_pool.start_workers()
+            analyzer_target = self.analyzer_pool.start
+        else:
+            analyzer_target = self.analyzer.start
+        self.enforcer.start()  # Dopo la creazione dei worker, che avviene con fork
+        self.blacklist.start()  # Riapplica i blocchi dello snapshot
+        self.alert_sink.start()
+        if self.metrics_server is not None:
+            try:
+                self.metrics_server.start()
+            except (OSError, ValueError) as e:
+                logging.error(f"Impossibile esportare le metriche su {self.metrics_server.address}: {e}")
+                self.metrics_server = None
+        if not self.replay:
+            self.rule_reloader.start()
+        started = time.monotonic()
+        sniffer_thread = Thread(target=self.sniffer.start, args=(self.stop_event,), name="sniffer")
+        analyzer_thread = Thread(target=analyzer_target, args=(self.stop_event,), name="analyzer")
 
         sniffer_thread.start()
         analyzer_thread.start()
 
         logging.info("Servizio avviato. Premere Ctrl+C per terminare.")
 
-        # Unisci i thread (attendiamo che finiscano)
+        # Unisci i thread (attendiamo che finiscano), riportando nel frattempo i riepiloghi delle allerte.
+        # Nella riproduzione le finestre seguono il tempo della cattura e vengono chiuse dai pacchetti stessi
+        while sniffer_thread.is_alive() or analyzer_thread.is_alive():
+            analyzer_thread.join(timeout=1)
+            if not self.replay:
+                self.analyzer.flush_alerts(time.time())
         sniffer_thread.join()
-        analyzer_thread.join()
+        self.analyzer.flush_alerts()
+        self.run_time = time.monotonic() - started
 
         logging.info("Servizio terminato.")
-        self.analyzer.clear_blacklist
+        self.blacklist.stop()
+        self.analyzer.clear_blacklist()
+        self.rule_reloader.stop()
+        self.profiler.stop()
+        self.enforcer.stop()
+        self.alert_sink.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+
+    def replay_summary(self):
+        """
+        Riassume l'ultima esecuzione; pensato per la riproduzione di un file pcap.
+
+        Returns:
+            dict: Pacchetti letti, durata, pacchetti al secondo, allerte e pacchetti scartati.
+        """
+        packets = getattr(self.sniffer, "packets_read", 0)
+        dropped = self.sniffer.dropped_packets
+        if self.analyzer_pool is not None:
+            dropped += self.analyzer_pool.dropped_packets
+        summary = {
+            "packets": packets,
+            "non_ip": self.sniffer.non_ip_packets,
+            "seconds": self.run_time,
+            "pps": packets / self.run_time if self.run_time else 0.0,
+            "alerts": self.analyzer.rule_events,
+            "suppressed": self.alert_aggregator.suppressed if self.alert_aggregator is not None else 0,
+            "dropped": dropped,
+            "alerts_dropped": self.alert_sink.dropped,
+        }
+        start, end = getattr(self.sniffer, "capture_start", None), getattr(self.sniffer, "capture_end", None)
+        if start is not None:
+            summary["capture_seconds"] = end - start
+        return summary
 
     def stop(self):
         """
         Arresta il servizio impostando l'evento di stop per tutti i componenti.
         """
         logging.debug("Arresto del servizio...")
-        self.analyzer.clear_blacklist
+        self.analyzer.clear_blacklist()
         self.stop_event.set()
\ No newline at end of file
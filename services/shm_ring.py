@@ -0,0 +1,298 @@
+import logging
+import struct
+import time
+import zlib
+from multiprocessing import shared_memory
+
+from services.packet_decoder import PacketMeta
+
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+# Record compatto di un PacketMeta: timestamp, lunghezza, versione, protocollo, flag TCP,
+# campi presenti, porte, tipo/codice ICMP, indirizzi (16 byte, IPv4 allineati a destra)
+_RECORD = struct.Struct("<dIBBBBHHBB16s16s")
+_SEQUENCE = struct.Struct("<Q")
+_CHECKSUM = struct.Struct("<I")  # CRC32 del record, verificato dal consumatore
+_RECORD_OFFSET = _SEQUENCE.size + _CHECKSUM.size
+# Contatori di una corsia: head, tail, pacchetti prodotti, scartati (drop-newest), sovrascritti (drop-oldest)
+_LANE_HEADER = struct.Struct("<QQQQQ")
+_LANE_HEADER_SIZE = 64
+_GLOBAL_HEADER = struct.Struct("<QQ")  # capacità per corsia, flag di chiusura
+_GLOBAL_HEADER_SIZE = 64
+
+SLOT_SIZE = _RECORD_OFFSET + _RECORD.size
+
+_HAS_PORTS = 0x01
+_HAS_TCP_FLAGS = 0x02
+_HAS_ICMP = 0x04
+
+
+def pack_packet(packet):
+    """
+    Serializza i metadati di un pacchetto in un record. I byte del frame non vengono copiati.
+    """
+    present = 0
+    if packet.src_port is not None:
+        present |= _HAS_PORTS
+    if packet.tcp_flags is not None:
+        present |= _HAS_TCP_FLAGS
+    if packet.icmp_type is not None:
+        present |= _HAS_ICMP
+    return _RECORD.pack(
+        packet.timestamp, packet.length, packet.version, packet.protocol,
+        packet.tcp_flags or 0, present, packet.src_port or 0, packet.dst_port or 0,
+        packet.icmp_type or 0, packet.icmp_code or 0,
+        packet.src_int.to_bytes(16, "big"), packet.dst_int.to_bytes(16, "big")
+    )
+
+
+def unpack_packet(buffer, offset):
+    """
+    Ricostruisce un PacketMeta da un record serializzato con `pack_packet`.
+    """
+    (timestamp, length, version, protocol, tcp_flags, present, src_port, dst_port,
+     icmp_type, icmp_code, src, dst) = _RECORD.unpack_from(buffer, offset)
+    packet = PacketMeta(timestamp, version, protocol, int.from_bytes(src, "big"), int.from_bytes(dst, "big"), b"")
+    packet.length = length
+    if present & _HAS_PORTS:
+        packet.src_port, packet.dst_port = src_port, dst_port
+    if present & _HAS_TCP_FLAGS:
+        packet.tcp_flags = tcp_flags
+    if present & _HAS_ICMP:
+        packet.icmp_type, packet.icmp_code = icmp_type, icmp_code
+    return packet
+
+
+class SharedRingBuffer:
+    """
+    Ring buffer in memoria condivisa (multiprocessing.shared_memory) tra un produttore
+    (lo sniffer) e più consumatori (i worker di analisi), senza lock.
+
+    Il segmento contiene una corsia per consumatore: il produttore sceglie la corsia
+    (ad esempio con l'hash di sharding) e ogni consumatore legge solo la propria, per cui
+    ogni indice ha un solo scrittore. Ogni slot contiene un numero di sequenza scritto
+    dopo il record: in modalità drop-oldest il produttore sovrascrive gli slot non ancora
+    letti e il consumatore, confrontando la sequenza prima e dopo la copia, riconosce i
+    record sovrascritti e li conta come persi invece di leggerli a metà.
+
+    La correttezza del numero di sequenza presuppone che le scritture del record diventino
+    visibili agli altri processi prima di quella della sequenza: è garantito sulle CPU x86
+    (modello TSO), non su quelle ARM e MIPS, dove CPython non inserisce barriere di memoria.
+    Per questo ogni record porta anche un CRC32: il consumatore copia il record, ne verifica
+    il CRC e solo allora lo decodifica. Un record il cui contenuto non è ancora visibile
+    (sequenza precedente o CRC errato con sequenza invariata) non viene letto né scartato:
+    la lettura si ferma lì e riprende alla chiamata successiva.
+
+    I record trasportano solo i metadati del pacchetto: i PacketMeta letti non hanno
+    i byte del frame e quindi non supportano la dissezione lazy con Scapy.
+
+    Politiche quando una corsia è piena:
+        - DROP_NEWEST: il nuovo pacchetto viene scartato (conteggiato in `dropped`).
+        - DROP_OLDEST: il pacchetto più vecchio viene sovrascritto (conteggiato in `overwritten`).
+
+    Attributi:
+        lanes (int): Numero di corsie (consumatori).
+        capacity (int): Slot per corsia.
+        policy (str): Politica di scarto.
+        name (str): Nome del segmento di memoria condivisa.
+    """
+
+    def __init__(self, lanes=1, capacity=4096, policy=DROP_OLDEST, name=None):
+        """
+        Crea un nuovo segmento (name=None) oppure si collega a uno esistente.
+
+        Args:
+            lanes (int): Numero di corsie (ignorato in collegamento).
+            capacity (int): Slot per corsia (ignorato in collegamento).
+            policy (str): DROP_OLDEST oppure DROP_NEWEST.
+            name (str): Nome di un segmento esistente a cui collegarsi.
+        """
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Politica di scarto non supportata: {policy}")
+        self.policy = policy
+        self._owner = name is None
+
+        if self._owner:
+            size = _GLOBAL_HEADER_SIZE + lanes * (_LANE_HEADER_SIZE + capacity * SLOT_SIZE)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.shm.buf[:size] = bytes(size)
+            _GLOBAL_HEADER.pack_into(self.shm.buf, 0, capacity, 0)
+            self.lanes = lanes
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            capacity, _ = _GLOBAL_HEADER.unpack_from(self.shm.buf, 0)
+            self.lanes = (self.shm.size - _GLOBAL_HEADER_SIZE) // (_LANE_HEADER_SIZE + capacity * SLOT_SIZE)
+
+        self.capacity = capacity
+        self.name = self.shm.name
+        self._lane_size = _LANE_HEADER_SIZE + capacity * SLOT_SIZE
+
+    def __getstate__(self):
+        return {"name": self.name, "policy": self.policy}
+
+    def __setstate__(self, state):
+        self.__init__(policy=state["policy"], name=state["name"])
+
+    def _lane_offset(self, lane):
+        return _GLOBAL_HEADER_SIZE + lane * self._lane_size
+
+    def put_batch(self, lane, packets):
+        """
+        Scrive un lotto di pacchetti nella corsia indicata e pubblica il nuovo head una sola volta.
+        Va chiamato da un solo produttore.
+
+        Args:
+            lane (int): Corsia di destinazione.
+            packets (list): PacketMeta da scrivere.
+
+        Returns:
+            int: Numero di pacchetti scritti.
+        """
+        buf = self.shm.buf
+        base = self._lane_offset(lane)
+        head, tail, produced, dropped, _ = _LANE_HEADER.unpack_from(buf, base)
+        capacity = self.capacity
+        slots = base + _LANE_HEADER_SIZE
+
+        if self.policy == DROP_NEWEST:
+            free = capacity - (head - tail)
+            if len(packets) > free:
+                dropped += len(packets) - free
+                packets = packets[:free]
+
+        for packet in packets:
+            offset = slots + (head % capacity) * SLOT_SIZE
+            _SEQUENCE.pack_into(buf, offset, 0)  # Slot in scrittura
+            record = pack_packet(packet)
+            _CHECKSUM.pack_into(buf, offset + _SEQUENCE.size, zlib.crc32(record))
+            buf[offset + _RECORD_OFFSET:offset + SLOT_SIZE] = record
+            head += 1
+            _SEQUENCE.pack_into(buf, offset, head)
+
+        # Ogni campo dell'header ha un solo scrittore: head, prodotti e scartati sono del produttore
+        struct.pack_into("<Q", buf, base, head)
+        struct.pack_into("<QQ", buf, base + 16, produced + len(packets), dropped)
+        return len(packets)
+
+    def get_batch(self, lane, max_items=256):
+        """
+        Legge fino a `max_items` pacchetti dalla propria corsia e pubblica il nuovo tail una sola volta.
+        Va chiamato solo dal consumatore proprietario della corsia.
+
+        Args:
+            lane (int): Corsia da leggere.
+            max_items (int): Numero massimo di pacchetti.
+
+        Returns:
+            list: PacketMeta letti (vuota se la corsia è vuota).
+        """
+        buf = self.shm.buf
+        base = self._lane_offset(lane)
+        head, tail = struct.unpack_from("<QQ", buf, base)
+        capacity = self.capacity
+        slots = base + _LANE_HEADER_SIZE
+        lost = 0
+
+        if head - tail > capacity:
+            # Il produttore ha già sovrascritto i record più vecchi
+            lost += head - tail - capacity
+            tail = head - capacity
+
+        batch = []
+        end = min(head, tail + max_items)
+        while tail < end:
+            offset = slots + (tail % capacity) * SLOT_SIZE
+            expected = tail + 1
+            sequence = _SEQUENCE.unpack_from(buf, offset)[0]
+            if sequence != expected:
+                if sequence > expected:
+                    # Slot già riscritto con un record più recente
+                    lost += 1
+                    tail += 1
+                    continue
+                # Record in scrittura o non ancora visibile: si riprova alla prossima lettura
+                break
+            record = offset + _RECORD_OFFSET
+            data = bytes(buf[record:record + _RECORD.size])
+            checksum = _CHECKSUM.unpack_from(buf, offset + _SEQUENCE.size)[0]
+            if _SEQUENCE.unpack_from(buf, offset)[0] != expected:
+                # Sovrascritto durante la copia
+                lost += 1
+                tail += 1
+                continue
+            if zlib.crc32(data) != checksum:
+                # Sequenza pubblicata ma contenuto non ancora visibile (CPU con ordinamento debole)
+                break
+            batch.append(unpack_packet(data, 0))
+            tail += 1
+
+        # Tail e sovrascritti sono del consumatore
+        struct.pack_into("<Q", buf, base + 8, tail)
+        if lost:
+            overwritten = struct.unpack_from("<Q", buf, base + 32)[0]
+            struct.pack_into("<Q", buf, base + 32, overwritten + lost)
+        return batch
+
+    def wait_batch(self, lane, max_items=256, timeout=0.1, poll_interval=0.0005):
+        """
+        Come get_batch, ma attende (con polling) fino a `timeout` secondi se la corsia è vuota.
+
+        Returns:
+            list: PacketMeta letti (vuota allo scadere del timeout o alla chiusura del ring).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            batch = self.get_batch(lane, max_items)
+            if batch or self.closed or time.monotonic() >= deadline:
+                return batch
+            time.sleep(poll_interval)
+
+    def free_slots(self, lane):
+        """
+        Slot liberi nella corsia, secondo l'ultimo tail pubblicato dal consumatore.
+
+        Returns:
+            int: Numero di record scrivibili senza scartare né sovrascrivere.
+        """
+        head, tail = struct.unpack_from("<QQ", self.shm.buf, self._lane_offset(lane))
+        return max(self.capacity - (head - tail), 0)
+
+    def stats(self, lane=None):
+        """
+        Restituisce occupazione e contatori di una corsia o, se lane è None, la somma di tutte.
+
+        Returns:
+            dict: Chiavi "occupancy", "produced", "dropped", "overwritten".
+        """
+        lanes = range(self.lanes) if lane is None else (lane,)
+        totals = {"occupancy": 0, "produced": 0, "dropped": 0, "overwritten": 0}
+        for index in lanes:
+            head, tail, produced, dropped, overwritten = _LANE_HEADER.unpack_from(self.shm.buf, self._lane_offset(index))
+            totals["occupancy"] += min(head - tail, self.capacity)
+            totals["produced"] += produced
+            totals["dropped"] += dropped
+            totals["overwritten"] += overwritten
+        return totals
+
+    @property
+    def closed(self):
+        return _GLOBAL_HEADER.unpack_from(self.shm.buf, 0)[1] == 1
+
+    def close(self):
+        """
+        Segnala ai consumatori la chiusura del ring (i record già scritti restano leggibili).
+        """
+        _GLOBAL_HEADER.pack_into(self.shm.buf, 0, self.capacity, 1)
+
+    def release(self):
+        """
+        Rilascia il segmento; il creatore lo elimina anche dal sistema.
+        """
+        try:
+            self.shm.close()
+            if self._owner:
+                self.shm.unlink()
+        except (FileNotFoundError, BufferError) as e:
+            logging.debug(f"Rilascio del ring condiviso {self.name}: {e}")
@@ -0,0 +1,52 @@
+from services.alert_aggregator import AlertAggregator, AlertSummary
+from services.packet_analyzer import RuleEvent
+
+
+def event(rule_id, src, timestamp):
+    return RuleEvent("alert", rule_id, f"Regola {rule_id}", src, timestamp, 6, 1024, "192.0.2.100", 80)
+
+
+def test_repeated_alerts_are_suppressed_within_the_window():
+    aggregator = AlertAggregator(window=10)
+    assert aggregator.submit(event("1", "192.0.2.1", 100.0))
+    assert not aggregator.submit(event("1", "192.0.2.1", 101.0))
+    assert not aggregator.submit(event("1", "192.0.2.1", 105.0))
+    # Regola o sorgente diversa: finestra separata
+    assert aggregator.submit(event("2", "192.0.2.1", 105.0))
+    assert aggregator.submit(event("1", "192.0.2.2", 105.0))
+    assert (aggregator.reported, aggregator.suppressed) == (3, 2)
+
+    assert aggregator.expire(now=109.0) == []
+    assert aggregator.expire(now=110.0) == [AlertSummary("alert", "1", "Regola 1", "192.0.2.1", 3, 100.0, 105.0)]
+    # Le finestre con una sola occorrenza si chiudono senza riepilogo
+    assert aggregator.expire(now=115.0) == []
+    assert len(aggregator) == 0
+
+
+def test_new_window_after_expiry():
+    aggregator = AlertAggregator(window=10)
+    aggregator.submit(event("1", "192.0.2.1", 100.0))
+    aggregator.submit(event("1", "192.0.2.1", 102.0))
+    # La finestra è scaduta ma expire non è stato chiamato: la nuova occorrenza la chiude
+    assert aggregator.submit(event("1", "192.0.2.1", 111.0))
+    assert aggregator.expire(now=111.0) == [AlertSummary("alert", "1", "Regola 1", "192.0.2.1", 2, 100.0, 102.0)]
+    assert len(aggregator) == 1
+
+
+def test_oldest_window_is_closed_when_full():
+    aggregator = AlertAggregator(window=10, max_entries=2)
+    aggregator.submit(event("1", "192.0.2.1", 100.0))
+    aggregator.submit(event("1", "192.0.2.1", 100.5))
+    aggregator.submit(event("1", "192.0.2.2", 101.0))
+    aggregator.submit(event("1", "192.0.2.3", 102.0))
+    assert len(aggregator) == 2
+    assert [summary.src for summary in aggregator.expire(now=102.0)] == ["192.0.2.1"]
+
+
+def test_expire_without_time_closes_every_window():
+    aggregator = AlertAggregator(window=10)
+    for src in ("192.0.2.1", "192.0.2.2"):
+        aggregator.submit(event("1", src, 100.0))
+        aggregator.submit(event("1", src, 100.0))
+    assert [summary.count for summary in aggregator.expire()] == [2, 2]
+    assert len(aggregator) == 0
@@ -0,0 +1,80 @@
+import json
+
+from services.alert_aggregator import AlertSummary
+from services.alert_sink import AlertSink, eve_record
+from services.packet_analyzer import RuleEvent
+
+
+def event(index):
+    return RuleEvent("alert", "1", "Regola 1", f"192.0.2.{index}", 1700000000.0 + index, 6, 1024, "192.0.2.200", 80)
+
+
+def record_size(index):
+    return len(json.dumps(eve_record(event(index)), separators=(",", ":"))) + 1
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_eve_records():
+    record = eve_record(event(1))
+    assert record["event_type"] == "alert"
+    assert (record["src_ip"], record["dest_ip"], record["proto"]) == ("192.0.2.1", "192.0.2.200", "TCP")
+    assert (record["src_port"], record["dest_port"]) == (1024, 80)
+    assert record["alert"]["signature_id"] == "1"
+    assert record["timestamp"].startswith("2023-11-14T22:13:21")
+
+    summary = eve_record(AlertSummary("alert", "1", "Regola 1", "192.0.2.1", 5, 1700000000.0, 1700000009.0))
+    assert summary["event_type"] == "alert_summary"
+    assert summary["summary"]["count"] == 5
+    assert "dest_ip" not in summary
+
+
+def test_rotation_keeps_backup_count_files(tmp_path):
+    path = tmp_path / "alerts.json"
+    # Ogni file contiene al più due allerte
+    sink = AlertSink(str(path), max_bytes=2 * record_size(0), backup_count=2)
+    sink._open()
+    for index in range(7):
+        sink._write_batch([event(index)])
+    sink.stop()
+
+    assert sink.rotations == 3
+    assert sink.written == 7
+    assert [item["src_ip"] for item in read_lines(path)] == ["192.0.2.6"]
+    assert [item["src_ip"] for item in read_lines(tmp_path / "alerts.json.1")] == ["192.0.2.4", "192.0.2.5"]
+    assert [item["src_ip"] for item in read_lines(tmp_path / "alerts.json.2")] == ["192.0.2.2", "192.0.2.3"]
+    assert not (tmp_path / "alerts.json.3").exists()
+
+
+def test_existing_file_counts_towards_rotation(tmp_path):
+    path = tmp_path / "alerts.json"
+    path.write_bytes(b"x" * record_size(0) * 2)
+    sink = AlertSink(str(path), max_bytes=2 * record_size(0), backup_count=1)
+    sink._open()
+    sink._write_batch([event(0)])
+    sink.stop()
+    assert sink.rotations == 1
+    assert (tmp_path / "alerts.json.1").read_bytes() == b"x" * record_size(0) * 2
+
+
+def test_queued_alerts_are_written_on_stop(tmp_path):
+    path = tmp_path / "alerts.json"
+    sink = AlertSink(str(path), max_pending=3)
+    sink._open()
+    assert all(sink.emit(event(index)) for index in range(3))
+    assert not sink.emit(event(3))
+    sink.stop()
+    assert (sink.written, sink.dropped) == (3, 1)
+    assert len(read_lines(path)) == 3
+
+
+def test_writer_thread(tmp_path):
+    path = tmp_path / "alerts.json"
+    sink = AlertSink(str(path), flush_interval=0.01)
+    sink.start()
+    for index in range(100):
+        sink.emit(event(index))
+    sink.stop()
+    assert [item["src_ip"] for item in read_lines(path)] == [f"192.0.2.{index}" for index in range(100)]
@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from rules.rule_manager import RuleManager
+from rules.rule_parser import RuleParser
+from rules.rule import Rule
+from services.analyzer_pool import AnalyzerPool, flow_hash, select_shard_key, source_hash
+from services.packet_decoder import PacketMeta
+
+
+ROOT = Path(__file__).resolve().parents[1]
+RULES = str(ROOT / "rules" / "config_rules.json")
+PROTOCOLS = str(ROOT / "configuration" / "config_protocols.json")
+CONFIG_DIR = str(ROOT / "configuration")
+
+
+def parse_rules():
+    return RuleParser(RULES, RuleManager(PROTOCOLS)).parse()
+
+
+@pytest.fixture
+def run_pool():
+    """
+    Avvia un pool in un thread e lo arresta alla fine del test.
+    """
+    started = []
+
+    def factory(workers=2, rules=None, **kwargs):
+        rules = parse_rules() if rules is None else rules
+        pool = AnalyzerPool(workers, rules, PROTOCOLS, lambda event: None, config_dir=CONFIG_DIR, **kwargs)
+        stop_event = threading.Event()
+        thread = threading.Thread(target=pool.start, args=(stop_event,))
+        pool.start_workers()
+        thread.start()
+        started.append((stop_event, thread))
+        return pool, stop_event, thread
+
+    yield factory
+    for stop_event, thread in started:
+        stop_event.set()
+        thread.join()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_worker_logs_reach_parent_handlers(run_pool, caplog):
+    caplog.set_level(logging.INFO)
+    pool, stop_event, thread = run_pool()
+    assert wait_for(lambda: sum("avviato." in message for message in caplog.messages) == 2)
+
+    pool.reload_rules(parse_rules())
+    assert wait_for(lambda: sum("regole ricaricate" in message for message in caplog.messages) == 2)
+
+    stop_event.set()
+    thread.join()
+    assert {f"Worker di analisi {index} terminato." for index in range(2)} <= set(caplog.messages)
+
+
+def test_workers_run_the_rules_they_are_given(run_pool, caplog):
+    caplog.set_level(logging.INFO)
+    rules = parse_rules()[:2]
+    pool, stop_event, thread = run_pool(rules=rules)
+    assert wait_for(lambda: sum("avviato." in message for message in caplog.messages) == 2)
+
+    # Solo le due regole ricevute, non l'intero file, risultano invariate nei worker
+    pool.reload_rules(parse_rules()[:2])
+    assert wait_for(lambda: sum("(2 threshold conservati)" in message for message in caplog.messages) == 2)
+
+    pool.reload_rules([])
+    assert wait_for(lambda: sum("(0 threshold conservati)" in message for message in caplog.messages) == 2)
+    stop_event.set()
+    thread.join()
+
+
+def test_backpressure_delivers_every_packet(run_pool):
+    from services.shm_ring import DROP_NEWEST
+
+    pool, stop_event, thread = run_pool(ring_capacity=32, batch_size=16, drop_policy=DROP_NEWEST, backpressure=True)
+    for index in range(3000):
+        packet = PacketMeta(0.0, 4, 17, 0x0A000000 + index, 0xC0000201, bytes(60))
+        packet.src_port, packet.dst_port = 1024, 53
+        pool.put_nowait(packet)
+    pool.flush()
+    stop_event.set()
+    thread.join()
+    assert pool.dropped_packets == 0
+    assert pool.active_flows() == 3000
+
+
+def test_backpressure_requires_drop_newest():
+    with pytest.raises(ValueError):
+        AnalyzerPool(2, [], PROTOCOLS, lambda event: None, backpressure=True)
+
+
+def rule(rule_id, threshold=None, flow_state=None):
+    return Rule(rule_id, "TCP", "any", "any", "any", "any", "alert", f"Regola {rule_id}",
+                threshold=threshold, flow_state=flow_state)
+
+
+def test_select_shard_key():
+    plain = [rule("1"), rule("2", threshold={"count": 5, "time": 10, "track": "by_dst"})]
+    by_flow = plain + [rule("3", threshold={"count": 5, "time": 10, "track": "by_flow"})]
+    stateful = plain + [rule("4", flow_state=["established"])]
+    assert select_shard_key(plain) == "src"
+    assert select_shard_key(by_flow) == "flow"
+    assert select_shard_key(stateful) == "flow"
+    # Lo sharding per sorgente richiesto esplicitamente non può servire le regole per flusso
+    assert select_shard_key(stateful, "src") == "flow"
+    assert select_shard_key(plain, "flow") == "flow"
+
+
+def test_flow_hash_is_symmetric():
+    forward = PacketMeta(0.0, 4, 6, 0x0A000001, 0xC0000201, bytes(60))
+    forward.src_port, forward.dst_port = 40000, 443
+    reply = PacketMeta(0.0, 4, 6, 0xC0000201, 0x0A000001, bytes(60))
+    reply.src_port, reply.dst_port = 443, 40000
+    assert flow_hash(forward) == flow_hash(reply)
+    assert source_hash(forward) != source_hash(reply)
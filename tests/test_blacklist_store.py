@@ -0,0 +1,117 @@
+import json
+import time
+
+from services.blacklist_store import BlacklistStore
+
+
+def test_entries_expire_at_their_deadline():
+    store = BlacklistStore(default_ttl=10)
+    now = time.time()
+    store.add("192.0.2.1", now=now)
+    store.add("192.0.2.2", ttl=30, now=now)
+    assert store.expire(now=now + 5) == 0
+    assert store.expire(now=now + 11) == 1
+    assert list(store) == ["192.0.2.2"]
+    assert store.expire(now=now + 31) == 1
+    assert len(store) == 0
+    assert store.expired == 2
+
+
+def test_renewal_moves_the_deadline():
+    store = BlacklistStore(default_ttl=10)
+    now = time.time()
+    store.add("192.0.2.1", now=now)
+    store.add("192.0.2.1", now=now + 5)
+    # Lo slot della prima scadenza viene esaminato ma la voce rinnovata resta
+    assert store.expire(now=now + 11) == 0
+    assert "192.0.2.1" in store
+    assert store.expire(now=now + 16) == 1
+
+
+def test_removed_entries_are_not_expired():
+    store = BlacklistStore(default_ttl=10)
+    now = time.time()
+    store.add("192.0.2.1", now=now)
+    assert store.remove("192.0.2.1")
+    assert not store.remove("192.0.2.1")
+    assert store.expire(now=now + 11) == 0
+    assert store.expired == 0
+
+
+def test_permanent_entries_never_expire():
+    store = BlacklistStore(default_ttl=None)
+    now = time.time()
+    store.add("192.0.2.1", now=now)
+    assert store.expire(now=now + 10 ** 6) == 0
+    assert "192.0.2.1" in store
+
+
+def test_deadline_beyond_the_wheel_horizon():
+    store = BlacklistStore(default_ttl=20, wheel_slots=8)
+    now = time.time()
+    store.add("192.0.2.1", now=now)
+    # Dopo un giro completo la voce è ancora nel suo slot, in attesa del giro successivo
+    assert store.expire(now=now + 10) == 0
+    assert store.expire(now=now + 21) == 1
+
+
+def test_pause_longer_than_a_lap():
+    store = BlacklistStore(default_ttl=3, wheel_slots=8)
+    now = time.time()
+    store.add("192.0.2.1", now=now)
+    store.add("192.0.2.2", ttl=500, now=now)
+    assert store.expire(now=now + 100) == 1
+    assert list(store) == ["192.0.2.2"]
+
+
+def test_eviction_removes_the_least_recently_added():
+    store = BlacklistStore(default_ttl=10, max_entries=2)
+    now = time.time()
+    store.add("192.0.2.1", now=now)
+    store.add("192.0.2.2", now=now)
+    store.add("192.0.2.1", now=now)  # Il rinnovo la rende la voce più recente
+    store.add("192.0.2.3", now=now)
+    assert list(store) == ["192.0.2.1", "192.0.2.3"]
+    assert store.evicted == 1
+    # La voce rimossa per il limite non viene contata tra le scadute
+    assert store.expire(now=now + 11) == 2
+    assert store.expired == 2
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "blacklist.json")
+    store = BlacklistStore(default_ttl=10, snapshot_path=path)
+    now = time.time()
+    store.add("192.0.2.1", now=now)
+    store.add("192.0.2.2", ttl=100, now=now)
+    store.default_ttl = None
+    store.add("192.0.2.3", now=now)
+    store.save()
+    assert not (tmp_path / "blacklist.json.tmp").exists()
+
+    restored = BlacklistStore(default_ttl=10, snapshot_path=path)
+    # Il primo blocco è già scaduto al ripristino
+    assert restored.load(now=now + 20) == 2
+    assert list(restored) == ["192.0.2.2", "192.0.2.3"]
+    assert restored.entries["192.0.2.2"] == now + 100
+    assert restored.entries["192.0.2.3"] is None
+    assert restored.expire(now=now + 101) == 1
+    assert list(restored) == ["192.0.2.3"]
+
+
+def test_snapshot_keeps_the_most_recent_entries(tmp_path):
+    path = tmp_path / "blacklist.json"
+    now = time.time()
+    path.write_text(json.dumps({"version": 1, "entries": [[f"192.0.2.{index}", now + 60] for index in range(5)]}))
+    store = BlacklistStore(max_entries=2, snapshot_path=str(path))
+    assert store.load(now=now) == 2
+    assert list(store) == ["192.0.2.3", "192.0.2.4"]
+
+
+def test_unreadable_snapshot_is_ignored(tmp_path):
+    path = tmp_path / "blacklist.json"
+    path.write_text("{not json")
+    store = BlacklistStore(snapshot_path=str(path))
+    assert store.load() == 0
+    assert BlacklistStore(snapshot_path=str(tmp_path / "missing.json")).load() == 0
+    assert len(store) == 0
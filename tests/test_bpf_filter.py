@@ -0,0 +1,27 @@
+from rules.rule import Rule
+from services.bpf_filter import build_filter_expression
+
+
+def rule(rule_id, protocol="TCP", src_ip="any", dst_ip="any", src_port="any", dst_port="any"):
+    return Rule(rule_id, protocol, src_ip, dst_ip, src_port, dst_port, "alert", f"Regola {rule_id}")
+
+
+def test_no_rules_captures_everything():
+    assert build_filter_expression([]) is None
+    assert build_filter_expression([rule("1", protocol="SCTP-UNKNOWN")]) is None
+
+
+def test_replies_are_included():
+    expression = build_filter_expression([rule("1", src_ip="10.0.0.0/8", dst_port=80)])
+    assert expression == "(tcp and ((dst net 10.0.0.0/8 and src port 80) or (src net 10.0.0.0/8 and dst port 80)))"
+
+
+def test_unconstrained_rule_covers_the_protocol():
+    expression = build_filter_expression([rule("1", dst_port=80), rule("2"), rule("3", protocol="UDP", dst_port=53)])
+    assert expression == "tcp or (udp and ((dst port 53) or (src port 53)))"
+
+
+def test_rules_that_never_match_are_excluded():
+    expression = build_filter_expression([rule("1", protocol="ICMP", dst_port=80), rule("2", dst_port="http"),
+                                          rule("3", protocol="ICMP")])
+    assert expression == "icmp"
@@ -0,0 +1,153 @@
+import time
+
+import pytest
+
+from services.blacklist_store import BlacklistStore
+from services.enforcement import EnforcementExecutor
+from services.firewall import DryRunBackend, FirewallBackend, NftablesBackend
+
+
+class RecordingBackend(FirewallBackend):
+    """
+    Backend che registra le chiamate ricevute.
+    """
+
+    name = "recording"
+
+    def __init__(self, expires_natively=False):
+        self.expires_natively = expires_natively
+        self.calls = []
+
+    def _call(self, operation, items):
+        self.calls.append((operation, items))
+
+    def block_entries(self, entries):
+        self._call("block", sorted(entries))
+
+    def block(self, ips, timeout=None):
+        self.block_entries([(ip, timeout) for ip in ips])
+
+    def unblock(self, ips):
+        self._call("unblock", sorted(ips))
+
+    def flush(self):
+        self._call("flush", [])
+
+
+def operations(backend, operation):
+    return [items for name, items in backend.calls if name == operation]
+
+
+@pytest.mark.parametrize("native", [False, True])
+def test_expiry_unblocks_only_without_kernel_timeouts(native):
+    backend = RecordingBackend(expires_natively=native)
+    executor = EnforcementExecutor(backend)
+    store = BlacklistStore(executor, default_ttl=10)
+    now = time.time()
+    store.add("192.0.2.1", now=now)
+    store.add("192.0.2.2", now=now)
+    executor._execute(force=True)
+    assert operations(backend, "block") == [[("192.0.2.1", 10), ("192.0.2.2", 10)]]
+
+    assert store.expire(now=now + 11) == 2
+    executor._execute(force=True)
+    assert operations(backend, "unblock") == ([] if native else [["192.0.2.1", "192.0.2.2"]])
+    assert len(store) == 0
+
+
+def test_explicit_removal_and_eviction_always_unblock():
+    backend = RecordingBackend(expires_natively=True)
+    executor = EnforcementExecutor(backend)
+    store = BlacklistStore(executor, default_ttl=10, max_entries=2)
+    for index in range(3):
+        store.add(f"192.0.2.{index}", now=1000.0)
+    assert store.remove("192.0.2.2")
+    executor._execute(force=True)
+    # Il blocco rimosso per il limite e quello rimosso esplicitamente non scadono da soli prima del TTL
+    assert operations(backend, "unblock") == [["192.0.2.0", "192.0.2.2"]]
+
+
+def test_backends_declare_native_expiry():
+    assert NftablesBackend.expires_natively
+    assert not DryRunBackend.expires_natively
+    assert EnforcementExecutor(NftablesBackend()).expires_natively
+
+
+class FailingBackend(RecordingBackend):
+    """
+    Backend i cui blocchi falliscono le prime `failures` volte.
+    """
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def block_entries(self, entries):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("firewall non disponibile")
+        super().block_entries(entries)
+
+
+def test_requests_for_the_same_address_are_coalesced():
+    backend = RecordingBackend()
+    executor = EnforcementExecutor(backend)
+    for _ in range(100):
+        executor.block("192.0.2.1", 60)
+    executor.block("192.0.2.2", 30)
+    executor.block("192.0.2.3", 60)
+    executor.unblock("192.0.2.3")  # Prevale l'ultima operazione richiesta
+    executor._execute(force=True)
+    assert backend.calls == [("block", [("192.0.2.1", 60), ("192.0.2.2", 30)]), ("unblock", ["192.0.2.3"])]
+    stats = executor.stats()
+    assert stats["submitted"] == 103
+    assert stats["coalesced"] == 100
+    assert stats["applied"] == 3
+    assert stats["pending"] == 0
+
+
+def test_pending_table_is_bounded():
+    executor = EnforcementExecutor(RecordingBackend(), max_pending=2)
+    for index in range(3):
+        executor.block(f"192.0.2.{index}")
+    executor.block("192.0.2.0", 60)  # Un indirizzo già in attesa non occupa un nuovo posto
+    assert executor.pending() == 2
+    assert executor.rejected == 1
+
+
+def test_failed_operations_are_retried_with_backoff():
+    backend = FailingBackend(failures=1)
+    executor = EnforcementExecutor(backend, retry_delay=60)
+    executor.block("192.0.2.1", 10)
+    executor._execute()
+    assert executor.retries == 1
+    assert executor.pending() == 1
+    # Il nuovo tentativo non è ancora pronto
+    executor._execute()
+    assert operations(backend, "block") == []
+    executor._execute(force=True)
+    assert operations(backend, "block") == [[("192.0.2.1", 10)]]
+    assert executor.applied == 1
+    assert executor.failed == 0
+
+
+def test_operations_are_abandoned_after_max_retries():
+    backend = FailingBackend(failures=10)
+    executor = EnforcementExecutor(backend, max_retries=2, retry_delay=0)
+    executor.block("192.0.2.1")
+    for _ in range(3):
+        executor._execute()
+    assert executor.retries == 2
+    assert executor.failed == 1
+    assert executor.pending() == 0
+
+
+def test_new_request_replaces_a_pending_retry():
+    backend = FailingBackend(failures=1)
+    executor = EnforcementExecutor(backend, retry_delay=60)
+    executor.block("192.0.2.1")
+    executor._execute()
+    executor.unblock("192.0.2.1")
+    executor._execute()
+    assert operations(backend, "unblock") == [["192.0.2.1"]]
+    assert executor.pending() == 0
@@ -0,0 +1,136 @@
+import ipaddress
+
+from rules.flow_state import FLOW_CLOSED, FLOW_CLOSING, FLOW_ESTABLISHED, FLOW_NEW
+from services.flow_table import FlowTable
+from services.packet_decoder import PacketMeta
+
+
+CLIENT, SERVER = int(ipaddress.IPv4Address("192.0.2.10")), int(ipaddress.IPv4Address("198.51.100.1"))
+FIN, SYN, RST, ACK = 0x01, 0x02, 0x04, 0x10
+
+
+def packet(timestamp, flags=None, reply=False, protocol=6, client_port=40000, client=CLIENT, length=60):
+    src, dst = (SERVER, client) if reply else (client, SERVER)
+    meta = PacketMeta(timestamp, 4, protocol, src, dst, bytes(length))
+    meta.src_port, meta.dst_port = (80, client_port) if reply else (client_port, 80)
+    if protocol == 6:
+        meta.tcp_flags = flags
+    return meta
+
+
+def state(table, meta):
+    return table.state[table.lookup(meta)]
+
+
+def test_tcp_handshake_and_close():
+    table = FlowTable()
+    syn = packet(0, SYN)
+    table.update(syn)
+    assert state(table, syn) == FLOW_NEW
+    table.update(packet(0.1, SYN | ACK, reply=True))
+    assert state(table, syn) == FLOW_NEW
+    table.update(packet(0.2, ACK))
+    assert state(table, syn) == FLOW_ESTABLISHED
+
+    table.update(packet(1.0, FIN | ACK))
+    assert state(table, syn) == FLOW_CLOSING
+    table.update(packet(1.1, FIN | ACK, reply=True))
+    assert state(table, syn) == FLOW_CLOSED
+
+    flow = table.flow(table.lookup(syn))
+    assert (flow["packets_fwd"], flow["packets_rev"], flow["bytes_fwd"], flow["bytes_rev"]) == (3, 2, 180, 120)
+    assert (flow["first_seen"], flow["last_seen"], flow["state"]) == (0, 1.1, "closed")
+    assert len(table) == 1
+
+
+def test_reset_and_reuse_of_closed_tuple():
+    table = FlowTable()
+    table.update(packet(0, SYN))
+    table.update(packet(0.1, SYN | ACK, reply=True))
+    table.update(packet(0.2, RST, reply=True))
+    assert state(table, packet(0)) == FLOW_CLOSED
+    # Un nuovo SYN sulla stessa 5-tupla apre una nuova connessione
+    slot = table.update(packet(0.5, SYN))
+    assert table.state[slot] == FLOW_NEW and table.packets_rev[slot] == 0
+    assert table.stats()["created"] == 2
+
+
+def test_midstream_and_udp_flows():
+    table = FlowTable()
+    assert table.state[table.update(packet(0, ACK))] == FLOW_ESTABLISHED
+    assert table.state[table.update(packet(0, RST, client_port=1))] == FLOW_CLOSED
+    udp = packet(0, protocol=17, client_port=5000)
+    table.update(udp)
+    table.update(packet(0.1, protocol=17, client_port=5000))
+    assert state(table, udp) == FLOW_NEW
+    table.update(packet(0.2, protocol=17, client_port=5000, reply=True))
+    assert state(table, udp) == FLOW_ESTABLISHED
+
+
+def establish(table, timestamp, client_port):
+    table.update(packet(timestamp, SYN, client_port=client_port))
+    table.update(packet(timestamp, SYN | ACK, reply=True, client_port=client_port))
+    table.update(packet(timestamp, ACK, client_port=client_port))
+
+
+def test_expiry_follows_state_timeouts_not_activity_order():
+    table = FlowTable(idle_timeout=300, new_timeout=30, closed_timeout=10)
+    # Il flusso stabilito è il meno recente: non deve trattenere quelli con timeout più brevi
+    establish(table, 0, 1)
+    for port in range(100, 110):
+        table.update(packet(1, SYN, client_port=port))
+    table.update(packet(2, RST, client_port=200))
+
+    assert table.expire(12) == 1      # Il flusso chiuso scade dopo 10 secondi
+    assert table.expire(31) == 10     # I flussi nuovi dopo 30
+    assert len(table) == 1
+    assert state(table, packet(0, client_port=1)) == FLOW_ESTABLISHED
+    assert table.expire(299) == 0
+    assert table.expire(300) == 1
+    assert table.stats() == {"active": 0, "created": 12, "expired": 12, "evicted": 0}
+
+
+def test_state_change_moves_flow_to_its_new_timeout():
+    table = FlowTable(idle_timeout=300, new_timeout=30, closed_timeout=10)
+    establish(table, 0, 1)
+    table.update(packet(5, SYN, client_port=2))
+    table.update(packet(20, FIN | ACK, client_port=1))
+    # In chiusura il flusso stabilito scade dopo 10 secondi, prima di quello nuovo più vecchio
+    assert table.expire(30) == 1
+    assert table.lookup(packet(0, client_port=1)) is None
+    assert table.expire(35) == 1
+    assert len(table) == 0
+
+
+def test_new_flows_do_not_keep_expired_ones_alive():
+    table = FlowTable(max_flows=4, idle_timeout=300, new_timeout=30)
+    establish(table, 0, 1)
+    for port in range(2, 5):
+        table.update(packet(1, SYN, client_port=port))
+    # Una SYN flood successiva trova spazio nei flussi nuovi scaduti, non nel flusso stabilito
+    for index in range(3):
+        table.update(packet(40, SYN, client=CLIENT + 1 + index))
+    assert state(table, packet(0, client_port=1)) == FLOW_ESTABLISHED
+    assert table.stats()["evicted"] == 0 and table.stats()["expired"] == 3
+
+
+def test_eviction_prefers_the_nearest_deadline():
+    table = FlowTable(max_flows=3, idle_timeout=300, new_timeout=30)
+    establish(table, 0, 1)
+    table.update(packet(1, SYN, client_port=2))
+    table.update(packet(2, SYN, client_port=3))
+    table.update(packet(3, SYN, client_port=4))
+    assert table.stats()["evicted"] == 1
+    assert table.lookup(packet(0, client_port=2)) is None
+    assert state(table, packet(0, client_port=1)) == FLOW_ESTABLISHED
+    assert table.lookup(packet(0, client_port=4)) is not None
+
+
+def test_expired_flow_is_recreated_on_next_packet():
+    table = FlowTable(idle_timeout=300, new_timeout=30)
+    first = table.update(packet(0, SYN))
+    second = table.update(packet(100, SYN))
+    assert table.stats()["expired"] == 1 and table.stats()["created"] == 2
+    assert table.first_seen[second] == 100
+    assert first == second  # Lo slot liberato viene riutilizzato
+    assert table.rule_cache[2 * second] is None
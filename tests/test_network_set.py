@@ -0,0 +1,146 @@
+import ipaddress
+import json
+import random
+
+import pytest
+
+from services.config_service import ConfigService, NetworkSet
+
+
+def reference_contains(spec, address):
+    """
+    Appartenenza calcolata direttamente con ipaddress: unione delle reti positive meno quelle escluse,
+    partendo da tutti gli indirizzi se ci sono solo esclusioni.
+    """
+    ip = ipaddress.ip_address(address)
+    included, excluded = [], []
+    for entry in spec.strip("[]").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        target = excluded if entry.startswith("!") else included
+        entry = entry.lstrip("!").strip()
+        networks = ["0.0.0.0/0", "::/0"] if entry == "any" else [entry]
+        target.extend(ipaddress.ip_network(network, strict=False) for network in networks)
+    if not included:
+        included = [ipaddress.ip_network("0.0.0.0/0"), ipaddress.ip_network("::/0")]
+    contained = lambda networks: any(network.version == ip.version and ip in network for network in networks)
+    return contained(included) and not contained(excluded)
+
+
+def sample_addresses(spec, rng):
+    """
+    Indirizzi casuali più i bordi di ogni rete della specifica (primo, ultimo e adiacenti).
+    """
+    addresses = [ipaddress.IPv4Address(rng.getrandbits(32)) for _ in range(200)]
+    addresses += [ipaddress.IPv6Address(rng.getrandbits(128)) for _ in range(200)]
+    for entry in spec.strip("[]").split(","):
+        entry = entry.strip().lstrip("!").strip()
+        if not entry or entry == "any":
+            continue
+        network = ipaddress.ip_network(entry, strict=False)
+        maximum = (1 << network.max_prefixlen) - 1
+        for value in (int(network.network_address) - 1, int(network.network_address),
+                      int(network.broadcast_address), int(network.broadcast_address) + 1):
+            if 0 <= value <= maximum:
+                addresses.append(ipaddress.ip_address(value) if network.version == 4 else ipaddress.IPv6Address(value))
+    return addresses
+
+
+SPECS = [
+    "192.168.145.0/24",
+    "!192.168.145.0/24, 0.0.0.0/0",
+    "!192.168.145.0/24",
+    "any",
+    "[10.0.0.0/8, 172.16.0.0/12, 192.168.0.0/16]",
+    "10.0.0.0/8, !10.1.0.0/16, !10.2.3.4, 10.1.2.0/24",
+    "10.0.0.0/9, 10.128.0.0/9, 11.0.0.0/8",
+    "2001:db8::/32, !2001:db8:ffff::/48, fe80::/10",
+    "any, !10.0.0.0/8, !2001:db8::/32",
+    "10.0.0.1/8, 192.168.1.77/24",
+]
+
+
+@pytest.mark.parametrize("spec", SPECS)
+def test_membership_matches_ipaddress(spec):
+    network_set = NetworkSet(spec)
+    rng = random.Random(spec)
+    for address in sample_addresses(spec, rng):
+        assert network_set.contains(address.version, int(address)) == reference_contains(spec, str(address)), address
+
+
+def test_ranges_are_sorted_disjoint_and_merged():
+    network_set = NetworkSet("10.0.0.0/9, 10.128.0.0/9, 10.64.0.0/10, 11.0.0.0/8")
+    assert network_set.starts[4] == [int(ipaddress.IPv4Address("10.0.0.0"))]
+    assert network_set.ends[4] == [int(ipaddress.IPv4Address("11.255.255.255"))]
+    assert network_set.starts[6] == []
+
+
+def test_external_net_excluding_home_net():
+    home = NetworkSet("192.168.145.0/24")
+    external = NetworkSet("!192.168.145.0/24, 0.0.0.0/0")
+    for address in ("192.168.145.0", "192.168.145.200", "192.168.145.255"):
+        ip = ipaddress.IPv4Address(address)
+        assert home.contains(4, int(ip)) and not external.contains(4, int(ip))
+    for address in ("192.168.144.255", "192.168.146.0", "8.8.8.8", "0.0.0.0", "255.255.255.255"):
+        ip = ipaddress.IPv4Address(address)
+        assert not home.contains(4, int(ip)) and external.contains(4, int(ip))
+    # Con una rete positiva solo IPv4 l'insieme non include IPv6
+    assert not external.contains(6, int(ipaddress.IPv6Address("2001:db8::1")))
+
+
+def test_only_exclusions_start_from_every_address():
+    external = NetworkSet("!192.168.145.0/24")
+    assert external.contains(4, int(ipaddress.IPv4Address("8.8.8.8")))
+    assert external.contains(6, int(ipaddress.IPv6Address("2001:db8::1")))
+    assert not external.contains(4, int(ipaddress.IPv4Address("192.168.145.1")))
+
+
+def test_json_list_and_empty_sets():
+    network_set = NetworkSet(["10.0.0.0/8", "!10.0.0.0/16"])
+    assert network_set.contains(4, int(ipaddress.IPv4Address("10.1.0.0")))
+    assert not network_set.contains(4, int(ipaddress.IPv4Address("10.0.255.255")))
+    assert not NetworkSet()
+    assert not NetworkSet(None).contains(4, 0)
+    assert not NetworkSet("10.0.0.0/8, !10.0.0.0/8")
+    assert NetworkSet("any")
+
+
+@pytest.mark.parametrize("spec", ["10.0.0.0/33", "300.0.0.1", "10.0.0.0/8, nonsense"])
+def test_invalid_networks_raise(spec):
+    with pytest.raises(ValueError):
+        NetworkSet(spec)
+
+
+def write_settings(config_dir, settings):
+    (config_dir / "config_settings.json").write_text(json.dumps({"settings": settings}))
+    (config_dir / "config_protocols.json").write_text(json.dumps({"protocols": []}))
+    return ConfigService(str(config_dir))
+
+
+def test_config_service_classification(tmp_path):
+    config = write_settings(tmp_path, {
+        "HOME_NET": "192.168.145.0/24",
+        "EXTERNAL_NET": "!192.168.145.0/24, 0.0.0.0/0",
+        "ALLOWLIST": "192.168.145.1",
+    })
+    inside = int(ipaddress.IPv4Address("192.168.145.7"))
+    outside = int(ipaddress.IPv4Address("203.0.113.9"))
+    assert config.classify(4, inside) == (True, False)
+    assert config.classify(4, outside) == (False, True)
+    assert config.is_allowlisted(4, int(ipaddress.IPv4Address("192.168.145.1")))
+    assert not config.is_allowlisted(4, inside)
+
+
+def test_config_service_invalid_setting_is_empty(tmp_path):
+    config = write_settings(tmp_path, {"HOME_NET": "not-a-network", "EXTERNAL_NET": "any"})
+    assert not config.home_net
+    assert config.classify(4, int(ipaddress.IPv4Address("10.0.0.1"))) == (False, True)
+    assert not config.allowlist
+
+
+def test_empty_allowlist_bypasses_the_cache(tmp_path):
+    config = write_settings(tmp_path, {"HOME_NET": "192.168.145.0/24", "EXTERNAL_NET": "any"})
+    for index in range(100):
+        assert not config.is_allowlisted(4, index)
+    assert config._allowlisted_cached.cache_info().currsize == 0
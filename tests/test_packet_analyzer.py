@@ -0,0 +1,63 @@
+from pathlib import Path
+
+from rules.rule import Rule
+from rules.rule_manager import RuleManager
+from services.packet_analyzer import PacketAnalyzer
+from services.packet_decoder import PacketMeta
+
+
+ROOT = Path(__file__).resolve().parents[1]
+PROTOCOLS = str(ROOT / "configuration" / "config_protocols.json")
+CONFIG_DIR = str(ROOT / "configuration")
+
+
+class EventList(list):
+    put = list.append
+
+
+def rule(rule_id, dst_port=53, count=1):
+    return Rule(rule_id, "UDP", "any", "any", "any", dst_port, "alert", f"Regola {rule_id}",
+                threshold={"count": count, "time": 10})
+
+
+def analyzer(rules):
+    packet_analyzer = PacketAnalyzer(None, RuleManager(PROTOCOLS), config_dir=CONFIG_DIR, rules=rules)
+    packet_analyzer.event_sink = EventList()
+    return packet_analyzer
+
+
+def packet(timestamp, dst_port=53):
+    meta = PacketMeta(timestamp, 4, 17, 0x0A000001, 0xC0A8910A, bytes(60))
+    meta.src_port, meta.dst_port = 40000, dst_port
+    return meta
+
+
+def test_set_rules_preserves_thresholds_of_unchanged_rules():
+    packet_analyzer = analyzer([rule("1"), rule("2"), rule("3")])
+    new_rules = [rule("1"), rule("2", count=5), rule("4")]
+    assert packet_analyzer.set_rules(new_rules) == 1
+    assert new_rules[0].threshold_id == "1"
+    # Regola modificata o nuova: contatori separati da quelli della generazione precedente
+    assert new_rules[1].threshold_id == ("2", 1)
+    assert new_rules[2].threshold_id == ("4", 1)
+    assert [compiled_rule.rule_id for compiled_rule in packet_analyzer.compiled_rules.rules] == ["1", "2", "4"]
+
+
+def test_rule_change_invalidates_flow_candidates():
+    packet_analyzer = analyzer([rule("1")])
+    # Il threshold scatta oltre il primo pacchetto della finestra
+    for index in range(3):
+        packet_analyzer.analyze_packet(packet(100.0 + index))
+    assert [event.rule_id for event in packet_analyzer.event_sink] == ["1", "1"]
+    assert packet_analyzer.flow_cache_hits == 2
+
+    packet_analyzer.set_rules([rule("2", dst_port=54)])
+    packet_analyzer.analyze_packet(packet(103.0))
+    packet_analyzer.analyze_packet(packet(104.0))
+    assert len(packet_analyzer.event_sink) == 2
+    assert packet_analyzer.flow_cache_hits == 3
+
+    packet_analyzer.set_rules([rule("3")])
+    packet_analyzer.analyze_packet(packet(105.0))
+    packet_analyzer.analyze_packet(packet(106.0))
+    assert [event.rule_id for event in packet_analyzer.event_sink] == ["1", "1", "3"]
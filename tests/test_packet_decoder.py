@@ -0,0 +1,210 @@
+import ipaddress
+import struct
+
+import pytest
+
+from services.packet_decoder import (LINKTYPE_ETHERNET, LINKTYPE_IPV4, LINKTYPE_IPV6, LINKTYPE_LINUX_SLL, LINKTYPE_RAW,
+                                     decode_frame, describe_packet)
+
+
+SRC4, DST4 = "192.0.2.10", "198.51.100.20"
+SRC6, DST6 = "2001:db8::10", "2001:db8:1::20"
+MAC_DST, MAC_SRC = b"\x00\x11\x22\x33\x44\x55", b"\x66\x77\x88\x99\xaa\xbb"
+
+
+def tcp_header(src_port=40000, dst_port=80, flags=0x02):
+    return struct.pack("!HHIIBBHHH", src_port, dst_port, 1, 0, 5 << 4, flags, 1024, 0, 0)
+
+
+def udp_header(src_port=5353, dst_port=53, payload_length=0):
+    return struct.pack("!HHHH", src_port, dst_port, 8 + payload_length, 0)
+
+
+def icmp_header(icmp_type=8, code=0):
+    return struct.pack("!BBHHH", icmp_type, code, 0, 1, 1)
+
+
+def ipv4(payload, protocol, src=SRC4, dst=DST4, fragment=0, options=b""):
+    ihl = 5 + len(options) // 4
+    header = struct.pack("!BBHHHBBH4s4s", 0x40 | ihl, 0, ihl * 4 + len(payload), 1, fragment, 64, protocol, 0,
+                         ipaddress.IPv4Address(src).packed, ipaddress.IPv4Address(dst).packed)
+    return header + options + payload
+
+
+def ipv6(payload, next_header, src=SRC6, dst=DST6):
+    return struct.pack("!IHBB16s16s", 6 << 28, len(payload), next_header, 64,
+                       ipaddress.IPv6Address(src).packed, ipaddress.IPv6Address(dst).packed) + payload
+
+
+def ethernet(payload, ethertype, vlans=()):
+    header = MAC_DST + MAC_SRC
+    for tpid, vid in vlans:
+        header += struct.pack("!HH", tpid, vid)
+    return header + struct.pack("!H", ethertype) + payload
+
+
+def linux_sll(payload, ethertype):
+    return struct.pack("!HHH8sH", 0, 1, 6, MAC_SRC + b"\x00\x00", ethertype) + payload
+
+
+def extension(next_header, length_units=0):
+    """
+    Extension header generico (Hop-by-Hop, Routing, Destination Options) di (length_units + 1) * 8 byte.
+    """
+    return struct.pack("!BB", next_header, length_units) + bytes(6 + length_units * 8)
+
+
+def fragment_header(next_header, offset=0, more=True):
+    return struct.pack("!BBHI", next_header, 0, (offset << 3) | int(more), 0x1234)
+
+
+def auth_header(next_header):
+    # Lunghezza in unità di 4 byte meno 2: 4 -> 24 byte (12 di header + 12 di ICV)
+    return struct.pack("!BBHII", next_header, 4, 0, 0x100, 1) + bytes(12)
+
+
+def assert_five_tuple(meta, version, protocol, src, dst, src_port=None, dst_port=None):
+    assert meta is not None
+    assert (meta.version, meta.protocol, meta.src, meta.dst) == (version, protocol, src, dst)
+    assert meta.src_int == int(ipaddress.ip_address(src))
+    assert meta.dst_int == int(ipaddress.ip_address(dst))
+    assert (meta.src_port, meta.dst_port) == (src_port, dst_port)
+
+
+def test_ethernet_ipv4_tcp():
+    frame = ethernet(ipv4(tcp_header(flags=0x12), 6), 0x0800)
+    meta = decode_frame(frame, 1.5)
+    assert_five_tuple(meta, 4, 6, SRC4, DST4, 40000, 80)
+    assert meta.tcp_flags == 0x12
+    assert (meta.timestamp, meta.length, meta.linktype, meta.raw) == (1.5, len(frame), LINKTYPE_ETHERNET, frame)
+    assert meta.summary() == f"TCP {SRC4}:40000 > {DST4}:80"
+
+
+def test_ipv4_options_move_transport_header():
+    frame = ethernet(ipv4(udp_header(), 17, options=b"\x01" * 8), 0x0800)
+    assert_five_tuple(decode_frame(frame, 0.0), 4, 17, SRC4, DST4, 5353, 53)
+
+
+def test_ipv4_icmp():
+    meta = decode_frame(ethernet(ipv4(icmp_header(3, 1), 1), 0x0800), 0.0)
+    assert_five_tuple(meta, 4, 1, SRC4, DST4)
+    assert (meta.icmp_type, meta.icmp_code, meta.tcp_flags) == (3, 1, None)
+
+
+def test_ipv4_non_first_fragment_has_no_ports():
+    # Il payload somiglia a un header TCP ma è a metà del datagramma
+    meta = decode_frame(ethernet(ipv4(tcp_header(), 6, fragment=100), 0x0800), 0.0)
+    assert_five_tuple(meta, 4, 6, SRC4, DST4)
+    assert meta.tcp_flags is None
+    first = decode_frame(ethernet(ipv4(tcp_header(), 6, fragment=0x2000), 0x0800), 0.0)
+    assert (first.src_port, first.dst_port) == (40000, 80)
+
+
+@pytest.mark.parametrize("vlans", [
+    [(0x8100, 10)],
+    [(0x88A8, 100), (0x8100, 10)],
+    [(0x9100, 1), (0x8100, 2)],
+])
+def test_vlan_tags(vlans):
+    meta = decode_frame(ethernet(ipv4(udp_header(), 17), 0x0800, vlans), 0.0)
+    assert_five_tuple(meta, 4, 17, SRC4, DST4, 5353, 53)
+    meta = decode_frame(ethernet(ipv6(tcp_header(), 6), 0x86DD, vlans), 0.0)
+    assert_five_tuple(meta, 6, 6, SRC6, DST6, 40000, 80)
+
+
+def test_linux_cooked_capture():
+    meta = decode_frame(linux_sll(ipv4(tcp_header(), 6), 0x0800), 0.0, LINKTYPE_LINUX_SLL)
+    assert_five_tuple(meta, 4, 6, SRC4, DST4, 40000, 80)
+    assert meta.linktype == LINKTYPE_LINUX_SLL
+    meta = decode_frame(linux_sll(ipv6(udp_header(), 17), 0x86DD), 0.0, LINKTYPE_LINUX_SLL)
+    assert_five_tuple(meta, 6, 17, SRC6, DST6, 5353, 53)
+    assert decode_frame(linux_sll(b"\x00" * 28, 0x0806), 0.0, LINKTYPE_LINUX_SLL) is None
+
+
+@pytest.mark.parametrize("linktype", [LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6])
+def test_raw_ip(linktype):
+    assert_five_tuple(decode_frame(ipv4(udp_header(), 17), 0.0, linktype), 4, 17, SRC4, DST4, 5353, 53)
+    assert_five_tuple(decode_frame(ipv6(udp_header(), 17), 0.0, linktype), 6, 17, SRC6, DST6, 5353, 53)
+
+
+def test_ipv6_icmpv6():
+    meta = decode_frame(ethernet(ipv6(icmp_header(128, 0), 58), 0x86DD), 0.0)
+    assert_five_tuple(meta, 6, 58, SRC6, DST6)
+    assert (meta.icmp_type, meta.icmp_code) == (128, 0)
+    assert meta.summary() == f"ICMPv6 {SRC6} > {DST6}"
+
+
+def test_ipv6_extension_header_chain():
+    # Hop-by-Hop -> Routing (24 byte) -> Destination Options -> AH -> TCP
+    payload = extension(43) + extension(60, 2) + extension(51) + auth_header(6) + tcp_header(1234, 443, 0x10)
+    meta = decode_frame(ethernet(ipv6(payload, 0), 0x86DD), 0.0)
+    assert_five_tuple(meta, 6, 6, SRC6, DST6, 1234, 443)
+    assert meta.tcp_flags == 0x10
+    assert meta.summary() == f"TCP [{SRC6}]:1234 > [{DST6}]:443"
+
+
+def test_ipv6_fragments():
+    first = decode_frame(ethernet(ipv6(fragment_header(17, offset=0) + udp_header(), 44), 0x86DD), 0.0)
+    assert_five_tuple(first, 6, 17, SRC6, DST6, 5353, 53)
+    later = decode_frame(ethernet(ipv6(fragment_header(17, offset=185, more=False) + udp_header(), 44), 0x86DD), 0.0)
+    assert_five_tuple(later, 6, 17, SRC6, DST6)
+
+
+@pytest.mark.parametrize("frame", [
+    ethernet(ipv4(tcp_header(), 6), 0x0800)[:10],          # Header Ethernet incompleto
+    ethernet(ipv4(tcp_header(), 6), 0x0800)[:14 + 12],     # Header IPv4 incompleto
+    ethernet(ipv6(tcp_header(), 6), 0x86DD)[:14 + 30],     # Header IPv6 incompleto
+    ethernet(ipv4(tcp_header(), 6), 0x0800, [(0x8100, 1)])[:16],
+    ethernet(ipv6(extension(6, 2) + tcp_header(), 0), 0x86DD)[:14 + 40 + 1],
+    b"",
+])
+def test_truncated_headers_are_rejected(frame):
+    assert decode_frame(frame, 0.0) is None
+
+
+def test_truncated_transport_keeps_network_layer():
+    frame = ethernet(ipv4(tcp_header(), 6), 0x0800)
+    meta = decode_frame(frame[:14 + 20 + 10], 0.0)
+    assert_five_tuple(meta, 4, 6, SRC4, DST4)
+    assert meta.tcp_flags is None
+    meta = decode_frame(frame[:14 + 20 + 2], 0.0)
+    assert_five_tuple(meta, 4, 6, SRC4, DST4)
+
+
+def test_non_ip_frames_are_ignored():
+    assert decode_frame(ethernet(bytes(28), 0x0806), 0.0) is None
+    assert decode_frame(ethernet(ipv6(udp_header(), 17), 0x0800), 0.0) is None  # Versione incoerente con l'ethertype
+    assert decode_frame(ipv4(udp_header(), 17), 0.0, linktype=147) is None
+
+
+def test_memoryview_frames_are_copied():
+    frame = bytearray(ethernet(ipv4(udp_header(), 17), 0x0800))
+    meta = decode_frame(memoryview(frame), 0.0)
+    assert isinstance(meta.raw, bytes) and meta.raw == bytes(frame)
+
+
+def test_describe_packet():
+    assert describe_packet(17, SRC4, 1, DST4, 2) == f"UDP {SRC4}:1 > {DST4}:2"
+    assert describe_packet(250, SRC4, None, DST4, None) == f"250 {SRC4} > {DST4}"
+
+
+def test_matches_scapy_dissection():
+    scapy_all = pytest.importorskip("scapy.all")
+    Ether, Dot1Q, IP, IPv6, TCP, UDP = (scapy_all.Ether, scapy_all.Dot1Q, scapy_all.IP, scapy_all.IPv6,
+                                         scapy_all.TCP, scapy_all.UDP)
+    packets = [
+        Ether() / IP(src=SRC4, dst=DST4) / TCP(sport=1234, dport=80, flags="SA"),
+        Ether() / Dot1Q(vlan=5) / IP(src=SRC4, dst=DST4, ihl=7, options=[scapy_all.IPOption(b"\x01" * 8)]) / UDP(sport=1, dport=2),
+        Ether() / IPv6(src=SRC6, dst=DST6) / scapy_all.IPv6ExtHdrHopByHop() / scapy_all.IPv6ExtHdrRouting()
+        / scapy_all.IPv6ExtHdrDestOpt() / TCP(sport=5, dport=6, flags="A"),
+        Ether() / IPv6(src=SRC6, dst=DST6) / scapy_all.IPv6ExtHdrFragment(offset=0, m=1) / UDP(sport=7, dport=8),
+    ]
+    for packet in packets:
+        meta = decode_frame(bytes(packet), 0.0)
+        layer = packet[IP] if IP in packet else packet[IPv6]
+        transport = packet[TCP] if TCP in packet else packet[UDP]
+        assert (meta.src, meta.dst) == (layer.src, layer.dst)
+        assert meta.protocol == (6 if TCP in packet else 17)
+        assert (meta.src_port, meta.dst_port) == (transport.sport, transport.dport)
+        if TCP in packet:
+            assert meta.tcp_flags == int(packet[TCP].flags)
@@ -0,0 +1,164 @@
+import struct
+
+import pytest
+
+from services.packet_decoder import LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL, LINKTYPE_RAW
+from services.pcap_replay import PcapReader
+
+
+FRAMES = [bytes(range(index, index + 42 + index)) for index in range(1, 6)]
+TIMESTAMPS = [1700000000.25, 1700000000.5, 1700000001.0, 1700000002.75, 1700000003.125]
+
+
+def pcap_file(path, order, nanoseconds=False, linktype=LINKTYPE_ETHERNET, frames=FRAMES, timestamps=TIMESTAMPS):
+    magic = 0xA1B23C4D if nanoseconds else 0xA1B2C3D4
+    scale = 10 ** 9 if nanoseconds else 10 ** 6
+    data = struct.pack(order + "IHHiIII", magic, 2, 4, 0, 0, 65535, linktype)
+    for timestamp, frame in zip(timestamps, frames):
+        seconds = int(timestamp)
+        data += struct.pack(order + "IIII", seconds, round((timestamp - seconds) * scale), len(frame), len(frame)) + frame
+    path.write_bytes(data)
+    return path
+
+
+def pad(data):
+    return data + bytes(-len(data) % 4)
+
+
+def block(order, block_type, body):
+    length = 12 + len(body)
+    return struct.pack(order + "II", block_type, length) + body + struct.pack(order + "I", length)
+
+
+def section_header(order):
+    return block(order, 0x0A0D0D0A, struct.pack(order + "IHHq", 0x1A2B3C4D, 1, 0, -1))
+
+
+def interface(order, linktype, tsresol=None, snaplen=0):
+    options = b""
+    if tsresol is not None:
+        options += struct.pack(order + "HH", 9, 1) + pad(bytes([tsresol]))
+        options += struct.pack(order + "HH", 0, 0)
+    return block(order, 0x00000001, struct.pack(order + "HHI", linktype, 0, snaplen) + options)
+
+
+def enhanced_packet(order, interface_id, ticks, frame):
+    body = struct.pack(order + "IIIII", interface_id, ticks >> 32, ticks & 0xFFFFFFFF, len(frame), len(frame))
+    return block(order, 0x00000006, body + pad(frame))
+
+
+def simple_packet(order, frame, original_length=None):
+    return block(order, 0x00000003, struct.pack(order + "I", original_length or len(frame)) + pad(frame))
+
+
+def obsolete_packet(order, interface_id, ticks, frame):
+    body = struct.pack(order + "HHIIII", interface_id, 0, ticks >> 32, ticks & 0xFFFFFFFF, len(frame), len(frame))
+    return block(order, 0x00000002, body + pad(frame))
+
+
+def read_all(path):
+    reader = PcapReader(str(path))
+    records = [(timestamp, bytes(frame), linktype) for timestamp, frame, linktype in reader]
+    return reader, records
+
+
+@pytest.mark.parametrize("order", ["<", ">"])
+@pytest.mark.parametrize("nanoseconds", [False, True])
+def test_pcap_byte_orders_and_resolutions(tmp_path, order, nanoseconds):
+    reader, records = read_all(pcap_file(tmp_path / "capture.pcap", order, nanoseconds, LINKTYPE_LINUX_SLL))
+    assert reader.format == "pcap"
+    assert [frame for _, frame, _ in records] == FRAMES
+    assert {linktype for _, _, linktype in records} == {LINKTYPE_LINUX_SLL}
+    for (timestamp, _, _), expected in zip(records, TIMESTAMPS):
+        assert timestamp == pytest.approx(expected, abs=1e-9 if nanoseconds else 1e-6)
+
+
+def test_pcap_truncated_record_stops_reading(tmp_path):
+    path = pcap_file(tmp_path / "capture.pcap", "<")
+    path.write_bytes(path.read_bytes()[:-10])
+    _, records = read_all(path)
+    assert [frame for _, frame, _ in records] == FRAMES[:-1]
+
+
+def test_pcap_header_only(tmp_path):
+    _, records = read_all(pcap_file(tmp_path / "capture.pcap", ">", frames=[], timestamps=[]))
+    assert records == []
+
+
+@pytest.mark.parametrize("order", ["<", ">"])
+def test_pcapng_interfaces_and_tsresol(tmp_path, order):
+    data = section_header(order)
+    data += interface(order, LINKTYPE_ETHERNET)              # Default: microsecondi
+    data += interface(order, LINKTYPE_RAW, tsresol=9)        # Nanosecondi (10^-9)
+    data += interface(order, LINKTYPE_ETHERNET, tsresol=0x8A)  # 2^-10 secondi
+    data += enhanced_packet(order, 0, 1700000000250000, FRAMES[0])
+    data += enhanced_packet(order, 1, 1700000000500000000, FRAMES[1])
+    data += enhanced_packet(order, 2, 1700000001 * 1024 + 256, FRAMES[2])
+    data += block(order, 0x00000005, bytes(8))               # Interface Statistics: ignorato
+    data += enhanced_packet(order, 7, 0, FRAMES[3])          # Interfaccia inesistente: ignorato
+    path = tmp_path / "capture.pcapng"
+    path.write_bytes(data)
+
+    reader, records = read_all(path)
+    assert reader.format == "pcapng"
+    assert [(frame, linktype) for _, frame, linktype in records] == [
+        (FRAMES[0], LINKTYPE_ETHERNET), (FRAMES[1], LINKTYPE_RAW), (FRAMES[2], LINKTYPE_ETHERNET)]
+    assert [timestamp for timestamp, _, _ in records] == pytest.approx([1700000000.25, 1700000000.5, 1700000001.25])
+
+
+def test_pcapng_simple_and_obsolete_packet_blocks(tmp_path):
+    data = section_header("<") + interface("<", LINKTYPE_ETHERNET, snaplen=50)
+    data += obsolete_packet("<", 0, 1700000000000000, FRAMES[0])
+    data += simple_packet("<", FRAMES[1])
+    data += simple_packet("<", FRAMES[4])  # Più lungo dello snaplen: troncato a 50 byte
+    path = tmp_path / "capture.pcapng"
+    path.write_bytes(data)
+
+    _, records = read_all(path)
+    assert [frame for _, frame, _ in records] == [FRAMES[0], FRAMES[1], FRAMES[4][:50]]
+    # I Simple Packet Block riprendono il timestamp del pacchetto precedente
+    assert [timestamp for timestamp, _, _ in records] == pytest.approx([1700000000.0] * 3)
+
+
+def test_pcapng_sections_with_different_byte_orders(tmp_path):
+    data = section_header("<") + interface("<", LINKTYPE_ETHERNET) + enhanced_packet("<", 0, 1000000, FRAMES[0])
+    data += section_header(">") + interface(">", LINKTYPE_RAW) + enhanced_packet(">", 0, 2000000, FRAMES[1])
+    path = tmp_path / "capture.pcapng"
+    path.write_bytes(data)
+
+    _, records = read_all(path)
+    assert records == [(1.0, FRAMES[0], LINKTYPE_ETHERNET), (2.0, FRAMES[1], LINKTYPE_RAW)]
+
+
+def test_pcapng_truncated_block_stops_reading(tmp_path):
+    data = section_header("<") + interface("<", LINKTYPE_ETHERNET)
+    data += enhanced_packet("<", 0, 0, FRAMES[0]) + enhanced_packet("<", 0, 0, FRAMES[1])
+    path = tmp_path / "capture.pcapng"
+    path.write_bytes(data[:-8])
+
+    _, records = read_all(path)
+    assert [frame for _, frame, _ in records] == [FRAMES[0]]
+
+
+@pytest.mark.parametrize("content", [b"", b"\x00" * 8, b"GIF89a" + bytes(30)])
+def test_invalid_files_raise(tmp_path, content):
+    path = tmp_path / "capture.bin"
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        read_all(path)
+
+
+def test_matches_scapy_writer(tmp_path):
+    scapy_all = pytest.importorskip("scapy.all")
+    packets = [scapy_all.Ether() / scapy_all.IP(dst="192.0.2.1") / scapy_all.UDP(dport=53 + index) for index in range(5)]
+    for packet, timestamp in zip(packets, TIMESTAMPS):
+        packet.time = timestamp
+    pcap_path, pcapng_path = str(tmp_path / "capture.pcap"), str(tmp_path / "capture.pcapng")
+    scapy_all.wrpcap(pcap_path, packets)
+    scapy_all.wrpcapng(pcapng_path, packets)
+
+    for path in (pcap_path, pcapng_path):
+        _, records = read_all(path)
+        assert [frame for _, frame, _ in records] == [bytes(packet) for packet in packets]
+        assert [timestamp for timestamp, _, _ in records] == pytest.approx(TIMESTAMPS, abs=1e-6)
+        assert {linktype for _, _, linktype in records} == {LINKTYPE_ETHERNET}
@@ -0,0 +1,148 @@
+import ipaddress
+import random
+
+import pytest
+
+from radixTree.radix_tree import RadixTree, parse_address, parse_prefix
+
+
+class FakeRule:
+    def __init__(self, rule_id):
+        self.rule_id = rule_id
+
+    def __repr__(self):
+        return f"FakeRule({self.rule_id})"
+
+
+def reference_matches(prefixes, address):
+    """
+    Regole attese per un indirizzo, calcolate con ipaddress e ordinate dal prefisso meno specifico.
+    """
+    ip = ipaddress.ip_address(address)
+    networks = [(ipaddress.ip_network(prefix, strict=False), rule) for prefix, rule in prefixes]
+    matching = [(network.prefixlen, rule) for network, rule in networks if network.version == ip.version and ip in network]
+    return [rule for _, rule in sorted(matching, key=lambda item: item[0])]
+
+
+def random_address(rng, version):
+    if version == 4:
+        return ipaddress.IPv4Address(rng.getrandbits(32))
+    return ipaddress.IPv6Address(rng.getrandbits(128))
+
+
+def random_prefixes(rng, version, count):
+    width = 32 if version == 4 else 128
+    prefixes = []
+    for index in range(count):
+        length = rng.randint(0, width)
+        address = random_address(rng, version)
+        prefixes.append((str(ipaddress.ip_network(f"{address}/{length}", strict=False)), FakeRule(f"v{version}-{index}")))
+    return prefixes
+
+
+@pytest.mark.parametrize("key", ["10.1.2.3/8", "192.168.1.1", "0.0.0.0/0", "2001:db8::1/32", "::1", "fe80::/10"])
+def test_parse_prefix_matches_ipaddress(key):
+    network = ipaddress.ip_network(key, strict=False)
+    assert parse_prefix(key) == [(network.version, int(network.network_address), network.prefixlen)]
+
+
+def test_parse_prefix_any_covers_both_families():
+    assert parse_prefix("any") == [(4, 0, 0), (6, 0, 0)]
+
+
+@pytest.mark.parametrize("key", ["10.0.0.0/33", "2001:db8::/129", "300.1.1.1", "not-an-ip"])
+def test_parse_prefix_rejects_invalid(key):
+    with pytest.raises(ValueError):
+        parse_prefix(key)
+
+
+def test_parse_address_matches_ipaddress():
+    for address in ("127.0.0.1", "255.255.255.255", "::", "2001:db8::abcd"):
+        ip = ipaddress.ip_address(address)
+        assert parse_address(address) == (ip.version, int(ip))
+    with pytest.raises(ValueError):
+        parse_address("10.0.0.256")
+
+
+@pytest.mark.parametrize("version", [4, 6])
+def test_search_matches_reference(version):
+    rng = random.Random(version)
+    prefixes = random_prefixes(rng, version, 200)
+    # Prefissi annidati per esercitare i nodi intermedi e l'inserimento tra padre e figlio
+    base = "10.0.0.0" if version == 4 else "2001:db8::"
+    for length in ((8, 16, 24, 12, 20) if version == 4 else (32, 48, 64, 40, 56)):
+        prefixes.append((f"{base}/{length}", FakeRule(f"nested-{length}")))
+
+    tree = RadixTree()
+    for prefix, rule in prefixes:
+        tree.insert(prefix, rule)
+    assert len(tree) == len(prefixes)
+
+    addresses = [str(random_address(rng, version)) for _ in range(300)]
+    # Indirizzi interni ai prefissi inseriti, altrimenti quasi nessuna ricerca trova prefissi lunghi
+    for prefix, _ in prefixes:
+        network = ipaddress.ip_network(prefix)
+        addresses.append(str(network.network_address + rng.randrange(network.num_addresses)))
+
+    for address in addresses:
+        expected = reference_matches(prefixes, address)
+        assert sorted(map(repr, tree.search(address))) == sorted(map(repr, expected))
+        ip = ipaddress.ip_address(address)
+        assert tree.search_int(ip.version, int(ip)) == tree.search(address)
+        if expected:
+            longest = max(ipaddress.ip_network(p).prefixlen for p, r in prefixes if r in expected)
+            assert {repr(r) for r in tree.longest_match(address)} == {
+                repr(r) for p, r in prefixes if r in expected and ipaddress.ip_network(p).prefixlen == longest}
+        else:
+            assert tree.longest_match(address) == []
+
+
+def test_search_orders_from_least_to_most_specific():
+    tree = RadixTree()
+    for rule_id, prefix in (("host", "10.1.2.3/32"), ("any", "any"), ("net8", "10.0.0.0/8"), ("net24", "10.1.2.0/24")):
+        tree.insert(prefix, FakeRule(rule_id))
+    assert [rule.rule_id for rule in tree.search("10.1.2.3")] == ["any", "net8", "net24", "host"]
+    assert [rule.rule_id for rule in tree.search("2001:db8::1")] == ["any"]
+    assert tree.search("invalid") == []
+
+
+def test_duplicate_rule_id_is_ignored():
+    tree = RadixTree()
+    tree.insert("10.0.0.0/8", FakeRule("r1"))
+    tree.insert("10.0.0.0/8", FakeRule("r1"))
+    tree.insert("10.0.0.0/8", FakeRule("r2"))
+    assert len(tree) == 2
+    assert [rule.rule_id for rule in tree.search("10.9.9.9")] == ["r1", "r2"]
+
+
+def test_remove_rule_prunes_and_keeps_other_matches():
+    rng = random.Random(42)
+    prefixes = random_prefixes(rng, 4, 100) + random_prefixes(rng, 6, 100)
+    tree = RadixTree()
+    for prefix, rule in prefixes:
+        tree.insert(prefix, rule)
+
+    removed, kept = prefixes[::2], prefixes[1::2]
+    for prefix, rule in removed:
+        assert tree.remove_rule(prefix, rule)
+        assert not tree.remove_rule(prefix, rule)
+    assert len(tree) == len(kept)
+
+    for prefix, _ in prefixes:
+        address = str(ipaddress.ip_network(prefix).network_address)
+        assert sorted(map(repr, tree.search(address))) == sorted(map(repr, reference_matches(kept, address)))
+
+    for prefix, rule in kept:
+        tree.remove_rule(prefix, rule)
+    assert len(tree) == 0
+    assert all(root.children == [None, None] and not root.rules for root in tree.roots.values())
+
+
+def test_remove_rule_unknown_prefix():
+    tree = RadixTree()
+    rule = FakeRule("r1")
+    tree.insert("10.0.0.0/8", rule)
+    assert not tree.remove_rule("10.0.0.0/16", rule)
+    assert not tree.remove_rule("invalid", rule)
+    assert tree.remove_rule("any", FakeRule("r2")) is False
+    assert len(tree) == 1
@@ -0,0 +1,66 @@
+import pytest
+
+from rules.rule import Rule
+from rules.rule_compiler import (DIRECTION_IN, DIRECTION_OUT, RuleCompiler, TCP_FLAG_BITS, compile_flags,
+                                 compile_port)
+
+
+def rule(rule_id, protocol="TCP", src_ip="any", dst_ip="any", src_port="any", dst_port="any", flags=None,
+         direction="both"):
+    return Rule(rule_id, protocol, src_ip, dst_ip, src_port, dst_port, "alert", f"Regola {rule_id}",
+                direction=direction, flags=flags)
+
+
+def matched(ruleset, *args, **kwargs):
+    return sorted(compiled_rule.rule_id for compiled_rule in ruleset.match(*args, **kwargs))
+
+
+def test_dispatch_by_protocol_port_and_prefix():
+    ruleset = RuleCompiler().compile([
+        rule("any-tcp"),
+        rule("http", dst_port=80),
+        rule("http-from-1024", src_port="1024", dst_port="80"),
+        rule("lan", src_ip="10.0.0.0/8"),
+        rule("host", dst_ip="192.0.2.1"),
+        rule("dns", protocol="UDP", dst_port=53),
+        rule("icmp", protocol="ICMP"),
+    ])
+    assert len(ruleset) == 7
+    assert matched(ruleset, "TCP", "10.1.2.3", "192.0.2.1", 1024, 80) == \
+        ["any-tcp", "host", "http", "http-from-1024", "lan"]
+    assert matched(ruleset, "TCP", "203.0.113.1", "192.0.2.2", 2000, 80) == ["any-tcp", "http"]
+    assert matched(ruleset, "TCP", "203.0.113.1", "192.0.2.2", 2000, 443) == ["any-tcp"]
+    assert matched(ruleset, "UDP", "203.0.113.1", "192.0.2.2", 2000, 53) == ["dns"]
+    assert matched(ruleset, "ICMP", "203.0.113.1", "192.0.2.2") == ["icmp"]
+    assert matched(ruleset, "SCTP", "203.0.113.1", "192.0.2.2") == []
+
+
+def test_flag_filter():
+    ruleset = RuleCompiler().compile([rule("syn", flags="S"), rule("syn-ack", flags=["S", "A"]), rule("any")])
+    syn = TCP_FLAG_BITS["S"]
+    assert matched(ruleset, "TCP", "10.0.0.1", "10.0.0.2", 1, 2, tcp_flags=syn) == ["any", "syn"]
+    assert matched(ruleset, "TCP", "10.0.0.1", "10.0.0.2", 1, 2, tcp_flags=syn | TCP_FLAG_BITS["A"]) == \
+        ["any", "syn", "syn-ack"]
+    # Senza flag (pacchetto non TCP) restano solo le regole che non ne richiedono
+    assert matched(ruleset, "TCP", "10.0.0.1", "10.0.0.2", 1, 2) == ["any"]
+
+
+def test_invalid_and_duplicate_rules_are_skipped():
+    ruleset = RuleCompiler().compile([rule("1"), rule("1", dst_port=80), rule("2", dst_port="http"),
+                                      rule("3", dst_port=70000), rule("4", flags="X")])
+    assert [compiled_rule.rule_id for compiled_rule in ruleset.rules] == ["1"]
+
+
+def test_direction_masks():
+    ruleset = RuleCompiler().compile([rule("in", direction="in"), rule("out", direction="out"), rule("both")])
+    assert [compiled_rule.direction_mask for compiled_rule in ruleset.rules] == \
+        [DIRECTION_IN, DIRECTION_OUT, DIRECTION_IN | DIRECTION_OUT]
+
+
+def test_compile_helpers():
+    assert compile_flags("SA") == compile_flags(["S", "A"]) == TCP_FLAG_BITS["S"] | TCP_FLAG_BITS["A"]
+    assert compile_flags(None) == 0
+    assert compile_port("any") is None
+    assert compile_port("443") == 443
+    with pytest.raises(ValueError):
+        compile_port(-1)
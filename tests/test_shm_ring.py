@@ -0,0 +1,164 @@
+import ipaddress
+import pickle
+import struct
+
+import pytest
+
+from services.packet_decoder import PacketMeta
+from services.shm_ring import (DROP_NEWEST, DROP_OLDEST, SLOT_SIZE, SharedRingBuffer, _GLOBAL_HEADER_SIZE,
+                               _LANE_HEADER_SIZE, _RECORD_OFFSET, pack_packet, unpack_packet)
+
+
+def make_packet(index, version=4, protocol=6):
+    if version == 4:
+        src, dst = int(ipaddress.IPv4Address("10.0.0.0")) + index, int(ipaddress.IPv4Address("192.0.2.1"))
+    else:
+        src, dst = int(ipaddress.IPv6Address("2001:db8::")) + index, int(ipaddress.IPv6Address("2001:db8:1::1"))
+    packet = PacketMeta(1000.0 + index / 8, version, protocol, src, dst, bytes(60 + index % 7))
+    if protocol in (6, 17):
+        packet.src_port, packet.dst_port = 1024 + index % 60000, 80
+    if protocol == 6:
+        packet.tcp_flags = index & 0x3F
+    if protocol in (1, 58):
+        packet.icmp_type, packet.icmp_code = 8, index % 4
+    return packet
+
+
+def fields(packet):
+    return (packet.timestamp, packet.length, packet.version, packet.protocol, packet.src, packet.dst,
+            packet.src_int, packet.dst_int, packet.src_port, packet.dst_port, packet.tcp_flags,
+            packet.icmp_type, packet.icmp_code)
+
+
+@pytest.fixture
+def make_ring():
+    rings = []
+
+    def factory(*args, **kwargs):
+        ring = SharedRingBuffer(*args, **kwargs)
+        rings.append(ring)
+        return ring
+
+    yield factory
+    for ring in reversed(rings):
+        ring.release()
+
+
+def slot_offset(ring, lane, index):
+    return _GLOBAL_HEADER_SIZE + lane * (_LANE_HEADER_SIZE + ring.capacity * SLOT_SIZE) + _LANE_HEADER_SIZE \
+        + (index % ring.capacity) * SLOT_SIZE
+
+
+@pytest.mark.parametrize("version, protocol", [(4, 6), (4, 17), (4, 1), (6, 6), (6, 58), (4, 47)])
+def test_pack_roundtrip(version, protocol):
+    packet = make_packet(5, version, protocol)
+    restored = unpack_packet(pack_packet(packet), 0)
+    assert fields(restored) == fields(packet)
+    assert restored.raw == b""
+
+
+def test_put_get_preserves_order_and_fields(make_ring):
+    ring = make_ring(lanes=1, capacity=64)
+    packets = [make_packet(index, 6 if index % 3 == 0 else 4, (6, 17, 1)[index % 3]) for index in range(50)]
+    assert ring.put_batch(0, packets) == 50
+    first = ring.get_batch(0, max_items=20)
+    rest = ring.get_batch(0)
+    assert [fields(p) for p in first + rest] == [fields(p) for p in packets]
+    assert ring.get_batch(0) == []
+    assert ring.stats() == {"occupancy": 0, "produced": 50, "dropped": 0, "overwritten": 0}
+
+
+def test_lanes_are_independent(make_ring):
+    ring = make_ring(lanes=3, capacity=8)
+    ring.put_batch(1, [make_packet(index) for index in range(5)])
+    ring.put_batch(2, [make_packet(index) for index in range(100, 103)])
+    assert ring.get_batch(0) == []
+    assert [p.src_port for p in ring.get_batch(2)] == [1124, 1125, 1126]
+    assert ring.stats(1)["occupancy"] == 5
+    assert ring.stats()["produced"] == 8
+
+
+def test_drop_oldest_overwrites_unread_records(make_ring):
+    ring = make_ring(lanes=1, capacity=64, policy=DROP_OLDEST)
+    packets = [make_packet(index) for index in range(100)]
+    assert ring.put_batch(0, packets) == 100
+    assert ring.stats()["occupancy"] == 64
+    batch = ring.get_batch(0, max_items=1000)
+    assert [fields(p) for p in batch] == [fields(p) for p in packets[36:]]
+    assert ring.stats() == {"occupancy": 0, "produced": 100, "dropped": 0, "overwritten": 36}
+
+
+def test_drop_newest_discards_incoming_records(make_ring):
+    ring = make_ring(lanes=1, capacity=64, policy=DROP_NEWEST)
+    packets = [make_packet(index) for index in range(100)]
+    assert ring.put_batch(0, packets) == 64
+    assert ring.put_batch(0, [make_packet(500)]) == 0
+    batch = ring.get_batch(0, max_items=1000)
+    assert [fields(p) for p in batch] == [fields(p) for p in packets[:64]]
+    assert ring.stats() == {"occupancy": 0, "produced": 64, "dropped": 37, "overwritten": 0}
+    # Liberato lo spazio, il produttore torna a scrivere
+    assert ring.put_batch(0, [make_packet(7)]) == 1
+    assert fields(ring.get_batch(0)[0]) == fields(make_packet(7))
+
+
+def test_wraparound_over_many_batches(make_ring):
+    ring = make_ring(lanes=1, capacity=16, policy=DROP_NEWEST)
+    received = []
+    for start in range(0, 200, 10):
+        ring.put_batch(0, [make_packet(index) for index in range(start, start + 10)])
+        received += ring.get_batch(0, max_items=12)
+    received += ring.get_batch(0, max_items=1000)
+    assert [p.src_int for p in received] == [make_packet(index).src_int for index in range(200)]
+
+
+def test_attach_by_name_and_pickle(make_ring):
+    ring = make_ring(lanes=2, capacity=32, policy=DROP_NEWEST)
+    attached = pickle.loads(pickle.dumps(ring))
+    try:
+        assert (attached.lanes, attached.capacity, attached.policy) == (2, 32, DROP_NEWEST)
+        ring.put_batch(1, [make_packet(1), make_packet(2)])
+        assert [p.src_int for p in attached.get_batch(1)] == [make_packet(1).src_int, make_packet(2).src_int]
+        assert not attached.closed
+        ring.close()
+        assert attached.closed
+        assert attached.wait_batch(0, timeout=1.0) == []
+    finally:
+        attached.release()
+
+
+def test_torn_record_is_retried_not_consumed(make_ring):
+    ring = make_ring(lanes=1, capacity=8)
+    ring.put_batch(0, [make_packet(index) for index in range(3)])
+    # Sequenza già pubblicata ma contenuto del secondo record non ancora visibile
+    offset = slot_offset(ring, 0, 1) + _RECORD_OFFSET
+    original = bytes(ring.shm.buf[offset:offset + 8])
+    ring.shm.buf[offset:offset + 8] = bytes(8)
+    assert [p.src_int for p in ring.get_batch(0)] == [make_packet(0).src_int]
+    assert ring.stats()["occupancy"] == 2
+    ring.shm.buf[offset:offset + 8] = original
+    assert [p.src_int for p in ring.get_batch(0)] == [make_packet(1).src_int, make_packet(2).src_int]
+    assert ring.stats()["overwritten"] == 0
+
+
+def test_slot_being_written_stops_the_batch(make_ring):
+    ring = make_ring(lanes=1, capacity=8)
+    ring.put_batch(0, [make_packet(index) for index in range(2)])
+    # Sequenza azzerata: il produttore sta riscrivendo lo slot
+    struct.pack_into("<Q", ring.shm.buf, slot_offset(ring, 0, 1), 0)
+    assert len(ring.get_batch(0)) == 1
+    struct.pack_into("<Q", ring.shm.buf, slot_offset(ring, 0, 1), 2)
+    assert len(ring.get_batch(0)) == 1
+
+
+def test_newer_sequence_counts_as_lost(make_ring):
+    ring = make_ring(lanes=1, capacity=8)
+    ring.put_batch(0, [make_packet(index) for index in range(3)])
+    # Slot già riscritto con un record di un giro successivo
+    struct.pack_into("<Q", ring.shm.buf, slot_offset(ring, 0, 0), 1 + ring.capacity)
+    assert [p.src_int for p in ring.get_batch(0)] == [make_packet(1).src_int, make_packet(2).src_int]
+    assert ring.stats()["overwritten"] == 1
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        SharedRingBuffer(policy="drop_all")
@@ -0,0 +1,76 @@
+from rules.threshold_tracker import ThresholdTracker
+
+
+THRESHOLD = {"count": 5, "time": 10}
+
+
+def hits(tracker, timestamps, key="10.0.0.1", threshold=THRESHOLD, rule_id="r1"):
+    return [tracker.hit(rule_id, key, threshold, timestamp) for timestamp in timestamps]
+
+
+def test_fires_only_above_count_within_window():
+    tracker = ThresholdTracker()
+    assert hits(tracker, [0, 1, 2, 3, 4, 5, 6]) == [False] * 5 + [True, True]
+
+
+def test_counts_are_per_rule_and_key():
+    tracker = ThresholdTracker()
+    for index in range(5):
+        tracker.hit("r1", "a", THRESHOLD, index)
+        tracker.hit("r1", "b", THRESHOLD, index)
+        tracker.hit("r2", "a", THRESHOLD, index)
+    assert tracker.hit("r1", "a", THRESHOLD, 5)
+    assert not tracker.hit("r1", "c", THRESHOLD, 5)
+    assert len(tracker) == 4
+
+
+def test_previous_bucket_weight_decays_across_window():
+    tracker = ThresholdTracker()
+    # Sei pacchetti all'inizio del primo bucket
+    assert hits(tracker, [0] * 6)[-1]
+    # A metà del bucket successivo il precedente pesa ancora per metà: 1 + 6 * 0.5 = 4
+    assert not tracker.hit("r1", "10.0.0.1", THRESHOLD, 15)
+    # 2 + 6 * 0.2 = 3.2, poi 3 + 6 * 0.1 = 3.6
+    assert not tracker.hit("r1", "10.0.0.1", THRESHOLD, 18)
+    assert not tracker.hit("r1", "10.0.0.1", THRESHOLD, 19)
+    # Subito dopo l'inizio del bucket la stima include quasi tutto il precedente: 1 + 6 * 0.9 = 6.4
+    tracker = ThresholdTracker()
+    hits(tracker, [0] * 6)
+    assert tracker.hit("r1", "10.0.0.1", THRESHOLD, 11)
+
+
+def test_steady_rate_matches_sliding_window():
+    tracker = ThresholdTracker()
+    # Un pacchetto al secondo: circa 10 per finestra, sopra la soglia di 5 ma sotto quella di 15
+    results = hits(tracker, range(100))
+    assert all(results[10:])
+    tracker = ThresholdTracker()
+    assert not any(hits(tracker, range(100), threshold={"count": 15, "time": 10}))
+
+
+def test_counter_resets_after_two_idle_windows():
+    tracker = ThresholdTracker()
+    hits(tracker, [0] * 20)
+    assert not tracker.hit("r1", "10.0.0.1", THRESHOLD, 25)
+    assert tracker.entries[("r1", "10.0.0.1")][1:3] == [1, 0]
+
+
+def test_idle_counters_expire():
+    tracker = ThresholdTracker()
+    for index in range(3):
+        tracker.hit("r1", f"10.0.0.{index}", THRESHOLD, 0)
+    tracker.hit("r1", "10.0.0.99", THRESHOLD, 100)
+    assert list(tracker.entries) == [("r1", "10.0.0.99")]
+    assert tracker.expirations == 3
+
+
+def test_least_recently_used_counter_is_evicted():
+    tracker = ThresholdTracker(max_entries=2)
+    tracker.hit("r1", "a", THRESHOLD, 0)
+    tracker.hit("r1", "b", THRESHOLD, 0)
+    tracker.hit("r1", "a", THRESHOLD, 1)
+    tracker.hit("r1", "c", THRESHOLD, 1)
+    assert list(tracker.entries) == [("r1", "a"), ("r1", "c")]
+    assert tracker.evictions == 1
+    tracker.clear()
+    assert len(tracker) == 0